@@ -95,6 +95,73 @@ else:
         }
     }
 
+# Cache compartida entre workers de gunicorn (resultados de reportes, ver
+# reports/analytics.py). Por defecto en la base de datos, a propósito: la caché
+# local de Django (locmem) es por proceso y cada worker recalcularía y guardaría
+# su propia copia; la de base de datos no requiere servicios extra. Las ventas
+# cambian los tokens de reports.versiones al confirmarse, fuera de la transacción
+# del checkout. La tabla se crea con `python manage.py createcachetable` (entrypoint.sh).
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'db')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / '.cache')),
+        }
+    }
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'movos_cache',
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '5000'))},
+        }
+    }
+# Segundos que vive un resultado de compute_analytics (0 desactiva la caché)
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get('ANALYTICS_CACHE_TIMEOUT', '3600'))
+# Stampede: sólo un proceso calcula cada clave; los demás reciben el resultado
+# anterior si tiene menos de ANALYTICS_CACHE_STALE segundos, o esperan hasta
+# ANALYTICS_CACHE_WAIT segundos. El candado expira tras ANALYTICS_CACHE_LOCK_TIMEOUT.
+ANALYTICS_CACHE_STALE = int(os.environ.get('ANALYTICS_CACHE_STALE', '300'))
+ANALYTICS_CACHE_WAIT = int(os.environ.get('ANALYTICS_CACHE_WAIT', '15'))
+ANALYTICS_CACHE_LOCK_TIMEOUT = int(os.environ.get('ANALYTICS_CACHE_LOCK_TIMEOUT', '120'))
+# Lecturas de compute_analytics en paralelo (sólo Postgres): hilos del pool (0 o 1 = en secuencia)
+# y segundos máximos por lectura antes de repetirla en el hilo del request
+ANALYTICS_PARALLEL_WORKERS = int(os.environ.get('ANALYTICS_PARALLEL_WORKERS', '0'))
+ANALYTICS_SECTION_TIMEOUT = float(os.environ.get('ANALYTICS_SECTION_TIMEOUT', '30'))
+# Días cerrados sin resumen que una lectura de reportes consolida al vuelo; el resto y los del
+# período de comparación se encolan en reports.tareas (0 = sólo rollup_sales)
+ROLLUP_CONSOLIDAR_AL_LEER = int(os.environ.get('ROLLUP_CONSOLIDAR_AL_LEER', '3'))
+# Exportaciones PDF/DOCX generadas en segundo plano (reports.exportaciones): directorio,
+# segundos que se conservan y tope de una generación antes de liberar su candado
+REPORT_EXPORTS_DIR = os.environ.get('REPORT_EXPORTS_DIR', str(BASE_DIR / '.exportaciones'))
+REPORT_EXPORTS_MAX_AGE = int(os.environ.get('REPORT_EXPORTS_MAX_AGE', str(7 * 24 * 3600)))
+REPORT_EXPORTS_TIMEOUT = int(os.environ.get('REPORT_EXPORTS_TIMEOUT', '600'))
+# Cola de tareas en la DB (reports.tareas, comando run_worker): ejecutar al encolar (sin worker;
+# por defecto en DEBUG), segundos de espera base entre reintentos y segundos sin latido para dar
+# por muerto a un worker
+TASKS_RUN_INLINE = os.environ.get('TASKS_RUN_INLINE', str(DEBUG)).lower() in ('1', 'true', 'yes')
+TASKS_RETRY_DELAY = int(os.environ.get('TASKS_RETRY_DELAY', '30'))
+TASKS_STALE_AFTER = int(os.environ.get('TASKS_STALE_AFTER', '300'))
+# Archivo columnar de líneas de venta (reports.archivo, comando build_sales_columnar): directorio y
+# segundos que se espera a que una venta nueva esté confirmada antes de archivar su id
+SALES_ARCHIVE_DIR = os.environ.get('SALES_ARCHIVE_DIR', str(BASE_DIR / '.archivo_ventas'))
+SALES_ARCHIVE_GRACE = int(os.environ.get('SALES_ARCHIVE_GRACE', '300'))
+# Días de ventas que quedan en las tablas de operación; las más antiguas se mueven a
+# VentaArchivada (reports.historico, comando archive_old_sales)
+SALES_HOT_DAYS = int(os.environ.get('SALES_HOT_DAYS', '365'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
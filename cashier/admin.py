@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import Venta, VentaDetalle
+from .models import Venta, VentaArchivada, VentaDetalle, VentaDetalleArchivada
 
 admin.site.register(Venta)
 admin.site.register(VentaDetalle)
+admin.site.register(VentaArchivada)
+admin.site.register(VentaDetalleArchivada)
 
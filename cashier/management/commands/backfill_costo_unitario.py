@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from cashier.models import Venta, VentaDetalle
+from products.models import Product
+from reports import rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill VentaDetalle.costo_unitario for lines recorded before cost snapshots existed, "
+        "using the product's current purchase price. Works in primary-key chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000, help="Lines updated per transaction")
+
+    def handle(self, batch=5000, **options):
+        batch = max(1, batch)
+        costo_actual = Coalesce(
+            Subquery(Product.objects.filter(pk=OuterRef('producto_id')).values('precio_compra')[:1]),
+            Value(Decimal('0.00')),
+        )
+        pendientes = VentaDetalle.objects.filter(costo_unitario__isnull=True)
+        ultimo = 0
+        total = 0
+        while True:
+            ids = list(pendientes.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:batch])
+            if not ids:
+                break
+            with transaction.atomic():
+                total += VentaDetalle.objects.filter(pk__in=ids, costo_unitario__isnull=True).update(costo_unitario=costo_actual)
+                Venta.objects.filter(pk__in=VentaDetalle.objects.filter(pk__in=ids).values('venta_id')).recalcular_resumen()
+            ultimo = ids[-1]
+            self.stdout.write(f"  {total} lines updated (up to id {ultimo})")
+
+        if total:
+            # Consolidated rollup days summed these lines at zero cost
+            rollup.limpiar()
+            self.stdout.write("Daily sales rollup cleared; run rollup_sales to rebuild it.")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled costo_unitario on {total} line(s)."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cashier.models import Venta
+from reports import versiones
+
+CAMPOS = ['fecha_local', 'hora_local', 'dia_semana']
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the local-time bucket columns (fecha_local, hora_local, dia_semana) on Venta "
+        "from fecha in settings.TIME_ZONE. Works in primary-key chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000, help="Sales updated per transaction")
+        parser.add_argument(
+            "--all", action="store_true", dest="todas",
+            help="Recompute every sale (e.g. after changing TIME_ZONE), not only empty ones",
+        )
+
+    def handle(self, batch=5000, todas=False, **options):
+        batch = max(1, batch)
+        ventas = Venta.objects.all() if todas else Venta.objects.filter(fecha_local__isnull=True)
+        ultimo = 0
+        total = 0
+        while True:
+            chunk = list(ventas.filter(pk__gt=ultimo).order_by('pk').only('id', 'fecha')[:batch])
+            if not chunk:
+                break
+            for venta in chunk:
+                for campo, valor in Venta.campos_locales(venta.fecha).items():
+                    setattr(venta, campo, valor)
+            with transaction.atomic():
+                Venta.objects.bulk_update(chunk, CAMPOS)
+            total += len(chunk)
+            ultimo = chunk[-1].pk
+            self.stdout.write(f"  {total} sales updated (up to id {ultimo})")
+        if total:
+            versiones.invalidar(versiones.VENTAS)
+        self.stdout.write(self.style.SUCCESS(f"Filled local date columns on {total} sale(s)."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cashier.models import Venta
+from reports import versiones
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the per-sale summary columns (unidades, costo_total, lineas) on Venta "
+        "from its detail lines. Works in primary-key chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000, help="Sales updated per transaction")
+        parser.add_argument(
+            "--all", action="store_true", dest="todas",
+            help="Recompute every sale, not only those without a summary",
+        )
+
+    def handle(self, batch=5000, todas=False, **options):
+        batch = max(1, batch)
+        ventas = Venta.objects.all() if todas else Venta.objects.filter(lineas=0)
+        ultimo = 0
+        total = 0
+        while True:
+            ids = list(ventas.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:batch])
+            if not ids:
+                break
+            with transaction.atomic():
+                total += Venta.objects.filter(pk__in=ids).recalcular_resumen()
+            ultimo = ids[-1]
+            self.stdout.write(f"  {total} sales updated (up to id {ultimo})")
+        if total:
+            versiones.invalidar(versiones.VENTAS)
+        self.stdout.write(self.style.SUCCESS(f"Summarized {total} sale(s)."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashier', '0005_unique_open_caja_per_sucursal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ventadetalle',
+            name='costo_unitario',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
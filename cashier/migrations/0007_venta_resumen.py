@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashier', '0006_venta_detalle_costo_unitario'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='costo_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='lineas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='unidades',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['fecha'], name='cashier_ven_fecha_e4f6ae_idx'),
+        ),
+    ]
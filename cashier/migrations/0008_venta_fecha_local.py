@@ -0,0 +1,50 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:20
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def llenar_fecha_local(apps, schema_editor):
+    Venta = apps.get_model('cashier', 'Venta')
+    pendientes = []
+    for venta in Venta.objects.filter(fecha_local__isnull=True).only('id', 'fecha').iterator(chunk_size=2000):
+        local = timezone.localtime(venta.fecha)
+        venta.fecha_local, venta.hora_local, venta.dia_semana = local.date(), local.hour, local.weekday()
+        pendientes.append(venta)
+        if len(pendientes) >= 2000:
+            Venta.objects.bulk_update(pendientes, ['fecha_local', 'hora_local', 'dia_semana'])
+            pendientes = []
+    if pendientes:
+        Venta.objects.bulk_update(pendientes, ['fecha_local', 'hora_local', 'dia_semana'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashier', '0007_venta_resumen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='dia_semana',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='fecha_local',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='hora_local',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='venta',
+            name='fecha',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(llenar_fecha_local, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashier', '0008_venta_fecha_local'),
+        ('products', '0018_fuenteproductos'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['sucursal', 'fecha'], name='cashier_ven_sucursa_624bd1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['empleado', 'fecha'], name='cashier_ven_emplead_b77ff9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['caja', 'forma_pago'], name='cashier_ven_caja_id_824534_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventadetalle',
+            index=models.Index(fields=['venta', 'producto'], name='cashier_ven_venta_i_a560d8_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.7 on 2026-10-19 03:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashier', '0009_indices_ventas'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='venta',
+            name='cashier_ven_fecha_e4f6ae_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='venta',
+            name='cashier_ven_emplead_b77ff9_idx',
+        ),
+        migrations.AddIndex(
+            model_name='aperturacierrecaja',
+            index=models.Index(fields=['apertura', 'id'], name='cashier_ape_apertur_d2adf7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['fecha', 'id'], name='cashier_ven_fecha_0f423f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['empleado', 'fecha', 'id'], name='cashier_ven_emplead_bc55ef_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-19 03:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashier', '0010_indices_historial'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='venta',
+            name='cashier_ven_caja_id_824534_idx',
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['caja', 'forma_pago', 'total'], name='cashier_ven_caja_id_5aa03e_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.7 on 2026-10-19 03:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashier', '0011_indice_ventas_caja'),
+        ('products', '0020_indices_historial'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha', models.DateTimeField()),
+                ('total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tipo_venta', models.CharField(choices=[('boleta', 'Boleta Electrónica'), ('factura', 'Factura Electrónica')], default='boleta', max_length=20)),
+                ('forma_pago', models.CharField(choices=[('efectivo', 'Efectivo'), ('debito', 'Tarjeta de Débito'), ('credito', 'Tarjeta de Crédito'), ('transferencia', 'Transferencia')], default='efectivo', max_length=20)),
+                ('cliente_paga', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('vuelto_entregado', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('numero_transaccion', models.CharField(blank=True, max_length=100, null=True, verbose_name='Número de Transacción')),
+                ('banco', models.CharField(blank=True, max_length=100, null=True, verbose_name='Banco')),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('costo_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('lineas', models.PositiveIntegerField(default=0)),
+                ('fecha_local', models.DateField(blank=True, db_index=True, null=True)),
+                ('hora_local', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('dia_semana', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('archivada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('caja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cashier.aperturacierrecaja')),
+                ('empleado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('sucursal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sucursales.sucursal')),
+            ],
+            options={
+                'verbose_name': 'venta archivada',
+                'verbose_name_plural': 'ventas archivadas',
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDetalleArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('costo_unitario', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+                ('venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='cashier.ventaarchivada')),
+            ],
+            options={
+                'verbose_name': 'detalle de venta archivada',
+                'verbose_name_plural': 'detalles de ventas archivadas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ventaarchivada',
+            index=models.Index(fields=['fecha', 'id'], name='cashier_ven_fecha_486687_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventaarchivada',
+            index=models.Index(fields=['empleado', 'fecha', 'id'], name='cashier_ven_emplead_160b69_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventaarchivada',
+            index=models.Index(fields=['caja', 'forma_pago', 'total'], name='cashier_ven_caja_id_f3bc4d_idx'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 #cashier/models.py
 from django.conf import settings
 from django.db import models
-from django.db.models import Q
+from django.db.models import F, Q
 from django.utils import timezone
 from products.models import Product
 from sucursales.models import Sucursal
@@ -9,12 +9,33 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+class VentaQuerySet(models.QuerySet):
+    def recalcular_resumen(self):
+        """Recalcula unidades, costo_total y lineas desde los detalles (un UPDATE)."""
+        from django.db.models import Count, DecimalField, IntegerField, OuterRef, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+
+        def _detalle(expr, output_field):
+            sub = (
+                VentaDetalle.objects.filter(venta_id=OuterRef('pk'))
+                .order_by().values('venta_id').annotate(v=expr).values('v')
+            )
+            return Coalesce(Subquery(sub, output_field=output_field), Value(0), output_field=output_field)
+
+        return self.update(
+            unidades=_detalle(Sum('cantidad'), IntegerField()),
+            costo_total=_detalle(Sum(F('cantidad') * F('costo_unitario')), DecimalField(max_digits=12, decimal_places=2)),
+            lineas=_detalle(Count('id'), IntegerField()),
+        )
+
+
 # Modelo de Venta
 class Venta(models.Model):
     empleado = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='ventas', blank=True, null=True)
     caja = models.ForeignKey('AperturaCierreCaja', on_delete=models.SET_NULL, related_name='ventas', blank=True, null=True)
-    fecha = models.DateTimeField(auto_now_add=True)
+    # Fijada al crear (como auto_now_add) pero antes del INSERT, para derivar las columnas locales
+    fecha = models.DateTimeField(default=timezone.now, editable=False)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     
     tipo_venta = models.CharField(
@@ -47,21 +68,128 @@ class Venta(models.Model):
         blank=True,
         verbose_name="Banco"
     )
+    # Resumen de los detalles, guardado al confirmar la venta
+    unidades = models.PositiveIntegerField(default=0)
+    costo_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    lineas = models.PositiveIntegerField(default=0)
+    # Fecha en hora local (settings.TIME_ZONE) para agrupar sin convertir zona por fila
+    fecha_local = models.DateField(null=True, blank=True, db_index=True)
+    hora_local = models.PositiveSmallIntegerField(null=True, blank=True)
+    dia_semana = models.PositiveSmallIntegerField(null=True, blank=True)  # 0 = lunes
+
+    objects = VentaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # (fecha, id): orden y cursor del historial de ventas (reports.paginacion)
+            models.Index(fields=['fecha', 'id']),
+            models.Index(fields=['sucursal', 'fecha']),
+            models.Index(fields=['empleado', 'fecha', 'id']),
+            # Cubre las sumas de total por caja (y forma de pago) del cierre y del historial
+            models.Index(fields=['caja', 'forma_pago', 'total']),
+        ]
     
     def __str__(self):
         return f"Venta #{self.id} - Total: {self.total}"
 
+    @staticmethod
+    def campos_locales(fecha):
+        """Valores de fecha_local, hora_local y dia_semana para ``fecha``."""
+        local = timezone.localtime(fecha)
+        return {'fecha_local': local.date(), 'hora_local': local.hour, 'dia_semana': local.weekday()}
+
+    def save(self, *args, **kwargs):
+        if self.fecha is not None:
+            locales = self.campos_locales(self.fecha)
+            for campo, valor in locales.items():
+                setattr(self, campo, valor)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'fecha' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | set(locales)
+        super().save(*args, **kwargs)
+
 # Modelo para el detalle de la venta
 class VentaDetalle(models.Model):
     venta = models.ForeignKey(Venta, related_name='detalles', on_delete=models.CASCADE)
     producto = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='ventadetalles')
     cantidad = models.PositiveIntegerField()
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    # Precio de compra del producto al momento de la venta (NULL = aún sin respaldar)
+    costo_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['venta', 'producto'])]
     
     @property
     def subtotal(self):
         return self.cantidad * self.precio_unitario
 
+    def save(self, *args, **kwargs):
+        if self.costo_unitario is None and self.producto_id:
+            self.costo_unitario = self.producto.precio_compra
+        nuevo = self._state.adding
+        super().save(*args, **kwargs)
+        if nuevo:
+            # Fuera del checkout (que arma el resumen en memoria) se suma aquí
+            Venta.objects.filter(pk=self.venta_id).update(
+                unidades=F('unidades') + self.cantidad,
+                costo_total=F('costo_total') + self.cantidad * (self.costo_unitario or 0),
+                lineas=F('lineas') + 1,
+            )
+
+# Ventas antiguas movidas fuera de las tablas de operación (ver reports/historico.py).
+# Conservan el id y los nombres de campo de Venta/VentaDetalle, así que las
+# mismas consultas sirven sobre ambas tablas.
+class VentaArchivada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    empleado = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='+', blank=True, null=True)
+    caja = models.ForeignKey('AperturaCierreCaja', on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    fecha = models.DateTimeField()
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    tipo_venta = models.CharField(max_length=20, choices=Venta._meta.get_field('tipo_venta').choices, default='boleta')
+    forma_pago = models.CharField(max_length=20, choices=Venta._meta.get_field('forma_pago').choices, default='efectivo')
+    cliente_paga = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    vuelto_entregado = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    numero_transaccion = models.CharField(max_length=100, null=True, blank=True, verbose_name="Número de Transacción")
+    banco = models.CharField(max_length=100, null=True, blank=True, verbose_name="Banco")
+    unidades = models.PositiveIntegerField(default=0)
+    costo_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    lineas = models.PositiveIntegerField(default=0)
+    fecha_local = models.DateField(null=True, blank=True, db_index=True)
+    hora_local = models.PositiveSmallIntegerField(null=True, blank=True)
+    dia_semana = models.PositiveSmallIntegerField(null=True, blank=True)
+    archivada = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'venta archivada'
+        verbose_name_plural = 'ventas archivadas'
+        indexes = [
+            models.Index(fields=['fecha', 'id']),
+            models.Index(fields=['empleado', 'fecha', 'id']),
+            models.Index(fields=['caja', 'forma_pago', 'total']),
+        ]
+
+    def __str__(self):
+        return f"Venta #{self.id} (archivada) - Total: {self.total}"
+
+
+class VentaDetalleArchivada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    venta = models.ForeignKey(VentaArchivada, related_name='detalles', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    cantidad = models.PositiveIntegerField()
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    costo_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'detalle de venta archivada'
+        verbose_name_plural = 'detalles de ventas archivadas'
+
+    @property
+    def subtotal(self):
+        return self.cantidad * self.precio_unitario
+
 # Modelo de Apertura y Cierre de Caja (actualizado)
 class AperturaCierreCaja(models.Model):
     vendedor = models.ForeignKey(
@@ -86,6 +214,8 @@ class AperturaCierreCaja(models.Model):
         return f"Caja {self.id} - {self.vendedor.username} - {self.estado}"
 
     class Meta:
+        # Orden y cursor del historial de cajas (reports.paginacion)
+        indexes = [models.Index(fields=['apertura', 'id'])]
         constraints = [
             # Garantiza que sólo exista una caja 'abierta' por sucursal a la vez
             models.UniqueConstraint(
@@ -3,13 +3,14 @@ from django.utils import timezone
 from decimal import Decimal
 from django.contrib.auth import get_user_model
 from django.test import Client
-import threading, json, time
+import threading, json, time, io, datetime
 
 from tests.factories import (
 	create_user, create_sucursal, create_product,
 	open_caja, close_caja, make_sale
 )
-from cashier.models import Venta, AperturaCierreCaja
+from cashier.models import Venta, VentaDetalle, AperturaCierreCaja
+from django.core.management import call_command
 from django.db.models import Sum
 
 User = get_user_model()
@@ -79,6 +80,50 @@ class CashierFlowTests(TestCase):
 		expected_efectivo_final = (caja.efectivo_inicial or Decimal('0.00')) + expected_ventas_efectivo
 		self.assertEqual(caja.efectivo_final, expected_efectivo_final)
 
+	def test_checkout_snapshots_unit_cost(self):
+		caja = open_caja(self.user_admin, self.sucursal)
+		client = Client()
+		client.force_login(self.user_admin)
+		s = client.session
+		s['caja_id'] = caja.id
+		s.save()
+		body = {'carrito': [{'producto_id': self.prod_a.id, 'cantidad': 2}], 'tipo_venta': 'boleta', 'forma_pago': 'efectivo', 'cliente_paga': '5000'}
+		resp = client.post('/cashier/', data=json.dumps(body), content_type='application/json')
+		self.assertEqual(resp.status_code, 200)
+		self.prod_a.precio_compra = Decimal('1500')
+		self.prod_a.save()
+		detalle = VentaDetalle.objects.get(producto=self.prod_a)
+		self.assertEqual(detalle.costo_unitario, Decimal('1000'))
+		venta = detalle.venta
+		self.assertEqual((venta.unidades, venta.costo_total, venta.lineas), (2, Decimal('2000'), 1))
+
+	def test_backfill_costo_unitario(self):
+		v = make_sale(self.user_admin, self.sucursal, [(self.prod_a, 1), (self.prod_b, 2)])
+		VentaDetalle.objects.filter(venta=v).update(costo_unitario=None)
+		call_command('backfill_costo_unitario', batch=1, stdout=io.StringIO())
+		costos = dict(VentaDetalle.objects.filter(venta=v).values_list('producto_id', 'costo_unitario'))
+		self.assertEqual(costos, {self.prod_a.id: Decimal('1000'), self.prod_b.id: Decimal('700')})
+
+	def test_backfill_resumen_ventas(self):
+		v = make_sale(self.user_admin, self.sucursal, [(self.prod_a, 1), (self.prod_b, 2)])
+		v.refresh_from_db()
+		self.assertEqual((v.unidades, v.costo_total, v.lineas), (3, Decimal('2400'), 2))
+		Venta.objects.filter(pk=v.pk).update(unidades=0, costo_total=0, lineas=0)
+		call_command('backfill_resumen_ventas', batch=1, stdout=io.StringIO())
+		v.refresh_from_db()
+		self.assertEqual((v.unidades, v.costo_total, v.lineas), (3, Decimal('2400'), 2))
+
+	def test_local_date_columns(self):
+		# 23:30 en Santiago ya es el día siguiente en UTC
+		fecha = timezone.make_aware(datetime.datetime(2025, 3, 14, 23, 30))
+		v = make_sale(self.user_admin, self.sucursal, [(self.prod_a, 1)], fecha=fecha)
+		v.refresh_from_db()
+		self.assertEqual((v.fecha_local, v.hora_local, v.dia_semana), (datetime.date(2025, 3, 14), 23, 4))
+		Venta.objects.filter(pk=v.pk).update(fecha_local=None, hora_local=None, dia_semana=None)
+		call_command('backfill_fecha_local', stdout=io.StringIO())
+		v.refresh_from_db()
+		self.assertEqual((v.fecha_local, v.hora_local, v.dia_semana), (datetime.date(2025, 3, 14), 23, 4))
+
 	def test_concurrent_sales_decrement_stock(self):
 		"""Simula dos ventas concurrentes contra el mismo producto y valida stock final."""
 		# Producto con stock 1 (legacy stock field)
@@ -4,16 +4,16 @@ from django.contrib import messages
 from django.db import transaction
 from django.http import JsonResponse, HttpResponseForbidden
 from django.utils import timezone
-from django.db.models import Q, Sum, Count, F
+from django.db.models import Q, Sum
 from django.urls import reverse
 from django.views.decorators.csrf import ensure_csrf_cookie
 import json
-import datetime
 from decimal import Decimal
 
-from .models import Venta, VentaDetalle, AperturaCierreCaja
+from .models import Venta, VentaArchivada, VentaDetalle, AperturaCierreCaja
 from products.models import Product
 from sucursales.models import Sucursal
+from reports import historico, rollup
 from decimal import Decimal as _Decimal
 
 def format_currency(value):
@@ -198,6 +198,7 @@ def cashier_dashboard(request):
                     caja=caja_abierta
                 )
 
+                detalles = []
                 for item in carrito:
                     pid = int(item.get('producto_id'))
                     producto = products_map[pid]
@@ -213,12 +214,18 @@ def cashier_dashboard(request):
                                 producto.save(update_fields=['stock'])
                         except Exception:
                             pass
-                    VentaDetalle.objects.create(
+                    detalles.append(VentaDetalle(
                         venta=venta,
                         producto=producto,
                         cantidad=cantidad,
-                        precio_unitario=producto.precio_venta
-                    )
+                        precio_unitario=producto.precio_venta,
+                        costo_unitario=producto.precio_compra
+                    ))
+                    venta.unidades += cantidad
+                    venta.costo_total += cantidad * producto.precio_compra
+                # bulk_create no pasa por VentaDetalle.save: el resumen va en venta.save()
+                VentaDetalle.objects.bulk_create(detalles)
+                venta.lineas = len(detalles)
                 venta.total = total
                 if forma_pago == "efectivo":
                     venta.vuelto_entregado = max(Decimal('0.00'), cliente_paga - total)
@@ -305,14 +312,15 @@ def detalle_caja(request, caja_id):
     if caja.estado == 'abierta' and request.user.is_superuser:
         return redirect(f"{reverse('cashier_dashboard')}?caja_id={caja.id}")
     # Establecemos el rango de ventas: desde la apertura hasta la fecha de cierre (o ahora si está abierta)
-    # Consultar ventas ligadas a esta caja (más robusto que filtrar por empleado+fechas)
-    ventas_qs = Venta.objects.filter(caja=caja)
-    ventas_total = ventas_qs.aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_efectivo = ventas_qs.filter(forma_pago='efectivo').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_debito = ventas_qs.filter(forma_pago='debito').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_credito = ventas_qs.filter(forma_pago='credito').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_transferencia = ventas_qs.filter(forma_pago='transferencia').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    vuelto_total = ventas_qs.aggregate(total=Sum('vuelto_entregado'))['total'] or Decimal('0.00')
+    # Consultar ventas ligadas a esta caja (más robusto que filtrar por empleado+fechas),
+    # incluidas las ya archivadas
+    totales = historico.totales_caja(caja)
+    ventas_total = totales['total']
+    ventas_efectivo = totales['efectivo']
+    ventas_debito = totales['debito']
+    ventas_credito = totales['credito']
+    ventas_transferencia = totales['transferencia']
+    vuelto_total = totales['vuelto']
     # Igual que en el cierre: no restar 'vuelto_total' ya que el total en efectivo
     # ya representa el neto que queda en caja por cada venta.
     efectivo_final_calc = (caja.efectivo_inicial or Decimal('0.00')) + ventas_efectivo
@@ -332,7 +340,7 @@ def detalle_caja(request, caja_id):
 
 @login_required
 def print_venta(request, venta_id):
-    venta = get_object_or_404(Venta, id=venta_id)
+    venta = historico.obtener_venta(venta_id)
     detalles_data = _build_detalles_data(venta)
     total_formatted = "$" + format_currency(venta.total or 0)
     cliente_paga_formatted = "$" + format_currency(venta.cliente_paga or 0)
@@ -350,14 +358,14 @@ def print_venta(request, venta_id):
 @login_required
 def print_caja(request, caja_id):
     caja = get_object_or_404(AperturaCierreCaja, id=caja_id)
-    # Usar ventas asociadas a la caja para el informe de impresión
-    ventas_qs = Venta.objects.filter(caja=caja)
-    ventas_total = ventas_qs.aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_efectivo = ventas_qs.filter(forma_pago='efectivo').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_debito = ventas_qs.filter(forma_pago='debito').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_credito = ventas_qs.filter(forma_pago='credito').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    ventas_transferencia = ventas_qs.filter(forma_pago='transferencia').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-    vuelto_total = ventas_qs.aggregate(total=Sum('vuelto_entregado'))['total'] or Decimal('0.00')
+    # Usar ventas asociadas a la caja (también las archivadas) para el informe de impresión
+    totales = historico.totales_caja(caja)
+    ventas_total = totales['total']
+    ventas_efectivo = totales['efectivo']
+    ventas_debito = totales['debito']
+    ventas_credito = totales['credito']
+    ventas_transferencia = totales['transferencia']
+    vuelto_total = totales['vuelto']
     # El efectivo final debe ser efectivo_inicial + ventas_efectivo.
     # No restamos 'vuelto_total' porque las ventas en efectivo ya representan el neto que queda en caja.
     efectivo_final_calc = (caja.efectivo_inicial or Decimal('0.00')) + ventas_efectivo
@@ -376,8 +384,9 @@ def print_caja(request, caja_id):
 
 @login_required
 def historial_caja(request):
-    historial_cajas = AperturaCierreCaja.objects.all().order_by('-apertura')
-    return render(request, 'cashier/historial_caja.html', {'historial_cajas': historial_cajas})
+    """Alias del historial de cajas: misma vista paginada que ``reports.views.cash_history``."""
+    from reports.views import cash_history
+    return cash_history(request)
 
 @login_required
 def buscar_producto(request):
@@ -422,7 +431,7 @@ def buscar_producto(request):
 
 @login_required
 def reporte_venta(request, venta_id):
-    venta = get_object_or_404(Venta, id=venta_id)
+    venta = historico.obtener_venta(venta_id)
     embed_mode = request.GET.get('embed') == '1'
     detalles_data = _build_detalles_data(venta)
     total_formatted = "$" + format_currency(venta.total or 0)
@@ -443,7 +452,7 @@ def reporte_venta(request, venta_id):
 @login_required
 def reporte_venta_embed(request, venta_id):
     """Versión embebible del detalle de venta para usar dentro del modal del cajero."""
-    venta = get_object_or_404(Venta, id=venta_id)
+    venta = historico.obtener_venta(venta_id)
     detalles_data = _build_detalles_data(venta)
     total_formatted = "$" + format_currency(venta.total or 0)
     cliente_paga_formatted = "$" + format_currency(venta.cliente_paga or 0)
@@ -553,7 +562,9 @@ def limpiar_carrito(request):
 def delete_all_sales_and_cash_history(request):
     if request.method == 'POST':
         try:
-            Venta.objects.all().delete()
+            with rollup.borrado_masivo():
+                Venta.objects.all().delete()
+                VentaArchivada.objects.all().delete()
             AperturaCierreCaja.objects.all().delete()
             messages.success(request, '¡Éxito! Todo el historial de ventas y caja ha sido eliminado.')
         except Exception as e:
@@ -636,105 +647,6 @@ def abrir_caja(request):
 
 @login_required
 def advanced_reports(request):
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
-            fecha_inicio = timezone.make_aware(fecha_inicio)
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')
-            fecha_fin = timezone.make_aware(fecha_fin) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-    ventas_qs = Venta.objects.filter(fecha__gte=fecha_inicio, fecha__lte=fecha_fin)
-    agg_ventas = ventas_qs.aggregate(
-        ingreso_total=Sum('total'),
-        num_transacciones=Count('id')
-    )
-    ingreso_total = agg_ventas.get('ingreso_total') or Decimal('0.00')
-    num_transacciones = agg_ventas.get('num_transacciones') or 0
-    agg_unidades = VentaDetalle.objects.filter(venta__in=ventas_qs).aggregate(total_unidades=Sum('cantidad'))
-    total_unidades = agg_unidades.get('total_unidades') or 0
-    agg_cmv = VentaDetalle.objects.filter(venta__in=ventas_qs).aggregate(
-        cmv=Sum(F('cantidad') * F('producto__precio_compra'))
-    )
-    cmv_val = agg_cmv.get('cmv') or 0
-    cmv = Decimal(str(cmv_val))
-    if ingreso_total > 0:
-        ingreso_sin_iva = (ingreso_total / Decimal('1.19')).quantize(Decimal('0.01'))
-        iva_total_calc = ingreso_total - ingreso_sin_iva
-    else:
-        ingreso_sin_iva = Decimal('0.00')
-        iva_total_calc = Decimal('0.00')
-    cmv_net = (cmv / Decimal('1.19')).quantize(Decimal('0.01')) if cmv else Decimal('0.00')
-    ganancia_real = ingreso_sin_iva - cmv_net
-    margen = ((ganancia_real / ingreso_sin_iva) * Decimal('100')).quantize(Decimal('0.01')) if ingreso_sin_iva > 0 else Decimal('0.00')
-    ticket_promedio = (ingreso_total / num_transacciones) if num_transacciones > 0 else Decimal('0.00')
-    unidades_promedio = (total_unidades / num_transacciones) if num_transacciones > 0 else 0
-    promedio_ganancia_neta = Decimal('0.00')
-    promedio_porcentaje_ganancia = Decimal('0.00')
-    best_selling = VentaDetalle.objects.filter(venta__in=ventas_qs) \
-                     .values('producto__nombre') \
-                     .annotate(total_cantidad=Sum('cantidad')) \
-                     .order_by('-total_cantidad') \
-                     .first()
-    best_selling_product = best_selling['producto__nombre'] if best_selling else "N/A"
-    best_selling_quantity = best_selling['total_cantidad'] if best_selling else 0
-    sales_by_payment_type = Venta.objects.filter(
-        fecha__gte=fecha_inicio, fecha__lte=fecha_fin
-    ).values('forma_pago').annotate(
-        total_monto=Sum('total')
-    )
-    sales_by_payment = []
-    sales_by_payment_chart = []
-    for item in sales_by_payment_type:
-        monto = item['total_monto'] or 0
-        sales_by_payment.append({
-            'forma_pago': item['forma_pago'],
-            'total_monto': "$" + format_clp(monto)
-        })
-        sales_by_payment_chart.append({
-            'forma_pago': item['forma_pago'],
-            'total_monto': float(monto)
-        })
-    filtro_top = request.GET.get('top', 10)
-    try:
-        filtro_top = int(filtro_top)
-    except ValueError:
-        filtro_top = 10
-    top_selling_products = VentaDetalle.objects.filter(
-        venta__fecha__gte=fecha_inicio, venta__fecha__lte=fecha_fin
-    ).values('producto__nombre').annotate(
-        total_cantidad=Sum('cantidad')
-    ).order_by('-total_cantidad')[:filtro_top]
-    context = {
-        'ingreso_total': "$" + format_clp(ingreso_total),
-        'ingreso_total_sin_iva': "$" + format_clp(ingreso_sin_iva),
-        'iva_total': "$" + format_clp(iva_total_calc),
-        'ganancia_bruta': "$" + format_clp(ganancia_real),
-        'ganancia_liquida': "$" + format_clp(ganancia_real),
-        'margen': format_clp(margen) + "%",
-        'costo_total': "$" + format_clp(cmv),
-        'num_transacciones': num_transacciones,
-        'ticket_promedio': "$" + format_clp(ticket_promedio),
-        'unidades_promedio': format_clp(unidades_promedio),
-        'best_selling_product': best_selling_product,
-        'best_selling_quantity': best_selling_quantity,
-        'sales_by_payment': sales_by_payment,
-        'sales_by_payment_chart': sales_by_payment_chart,
-        'top_selling_products': list(top_selling_products),
-        'fecha_inicio': fecha_inicio_str,
-        'fecha_fin': fecha_fin_str,
-        'filtro_top_actual': filtro_top,
-        'promedio_ganancia_neta': "$" + format_clp(promedio_ganancia_neta),
-        'promedio_porcentaje_ganancia': format_clp(promedio_porcentaje_ganancia) + "%"
-    }
-    return render(request, 'reports/advanced_reports.html', context)
\ No newline at end of file
+    """Alias del dashboard avanzado: mismo cálculo y permisos que ``reports.views.advanced_reports``."""
+    from reports.views import advanced_reports as dashboard
+    return dashboard(request)
\ No newline at end of file
@@ -11,6 +11,15 @@ fi
 
 echo "Running migrations"
 python manage.py migrate --noinput
+python manage.py createcachetable
+
+echo "Backfilling cost snapshots on sale lines"
+python manage.py backfill_costo_unitario || true
+python manage.py backfill_resumen_ventas || true
+python manage.py backfill_fecha_local || true
+
+echo "Consolidating daily sales rollup"
+python manage.py rollup_sales || true
 
 echo "Collecting static files"
 python manage.py collectstatic --noinput || true
@@ -46,14 +55,31 @@ print(f"Superuser '{username}' ready (created={created})")
 PY
 fi
 
-# Optional: import products on boot if a path/url is provided (streaming, low memory)
+# Optional: import products on boot if a path/url is provided (streaming, low memory).
+# Runs are fingerprinted: a file that was already fully imported is a no-op and an
+# interrupted import (OOM, restart) resumes from its last committed batch.
 if [ -n "$IMPORT_PRODUCTS_PATH" ]; then
   echo "Importing products from $IMPORT_PRODUCTS_PATH (dry-run=${IMPORT_PRODUCTS_DRY_RUN:-false})"
   if [ "${IMPORT_PRODUCTS_DRY_RUN:-false}" = "true" ]; then
-    python manage.py import_products "$IMPORT_PRODUCTS_PATH" --dry-run --batch "${IMPORT_PRODUCTS_BATCH:-500}" || true
+    python manage.py import_products "$IMPORT_PRODUCTS_PATH" --dry-run --batch "${IMPORT_PRODUCTS_BATCH:-500}" --workers "${IMPORT_PRODUCTS_WORKERS:-1}" || true
   else
-    python manage.py import_products "$IMPORT_PRODUCTS_PATH" --batch "${IMPORT_PRODUCTS_BATCH:-500}" || true
+    python manage.py import_products "$IMPORT_PRODUCTS_PATH" --resume --skip-if-imported --batch "${IMPORT_PRODUCTS_BATCH:-500}" --workers "${IMPORT_PRODUCTS_WORKERS:-1}" || true
   fi
 fi
 
+# Run the background task worker (reports.tareas) next to the web process, restarting it if
+# it exits. Without a worker, and with TASKS_RUN_INLINE off, queued exports and day
+# consolidations never finish. Set TASKS_RUN_WORKER=false when a separate worker container
+# runs it (the "worker" service in docker-compose.yml).
+if [ "${TASKS_RUN_WORKER:-true}" = "true" ]; then
+  echo "Starting background task worker"
+  (
+    while true; do
+      python manage.py run_worker || true
+      echo "Task worker exited; restarting in 5s"
+      sleep 5
+    done
+  ) &
+fi
+
 exec "$@"
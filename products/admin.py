@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import Product, StockSucursal, TransferenciaStock, AjusteStock
+from .models import Product, StockSucursal, TransferenciaStock, AjusteStock, ImportacionProductos, FuenteProductos
 
 admin.site.register(Product)
 admin.site.register(StockSucursal)
 admin.site.register(TransferenciaStock)
 admin.site.register(AjusteStock)
+admin.site.register(ImportacionProductos)
+admin.site.register(FuenteProductos)
@@ -0,0 +1,320 @@
+"""Helpers puros para el comando ``import_products``.
+
+Este módulo no importa modelos: todo lo que contiene debe poder ejecutarse en
+procesos hijos del pool de parsing (incluso con el método de arranque
+``spawn``), por lo que sólo trabaja con tipos simples (str, int, Decimal, date,
+dict) que se pueden serializar con pickle.
+"""
+import csv
+import hashlib
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+
+from django.utils.dateparse import parse_date
+
+REQUIRED_HEADERS = ['NOMBRE', 'CODIGO 1', 'PRECIO DE COMPRA', 'PRECIO DE VENTA']
+
+# Cantidad de chunks por worker: más chunks que workers equilibra la carga
+# cuando algunas zonas del archivo son más costosas de parsear que otras.
+CHUNKS_PER_WORKER = 4
+
+# Filas crudas por tarea cuando un solo lector reparte la hoja XLSX al pool
+XLSX_ROWS_PER_TASK = 2000
+
+
+def safe_decimal(val):
+    if val is None:
+        return Decimal("0.00")
+    try:
+        return Decimal(str(val).strip().replace(",", "."))
+    except (ValueError, TypeError, InvalidOperation):
+        return Decimal("0.00")
+
+
+def safe_int(val):
+    try:
+        if val is None:
+            return 0
+        s = str(val).strip().replace(",", "")
+        if s == "":
+            return 0
+        return int(float(s))
+    except Exception:
+        return 0
+
+
+def safe_bool(val, default=True):
+    if val is None:
+        return default
+    s = str(val).strip().lower()
+    if s in ("1", "true", "sí", "si", "yes", "y", "on"):  # Spanish variants included
+        return True
+    if s in ("0", "false", "no", "off", "n"):
+        return False
+    return default
+
+
+def norm_date(fecha_raw):
+    if not fecha_raw:
+        return None
+    if isinstance(fecha_raw, (datetime, date)):
+        return fecha_raw.date() if isinstance(fecha_raw, datetime) else fecha_raw
+    try:
+        return parse_date(str(fecha_raw).split(" ")[0].strip())
+    except Exception:
+        return None
+
+
+def build_parse_context(header_map, sucursales):
+    """Arma el contexto (picklable) que necesita ``parse_row``.
+
+    ``sucursales`` es un iterable de pares ``(id, nombre)``. Se resuelven aquí
+    las columnas de stock por sucursal para no repetir el trabajo por fila.
+    """
+    sucursales = list(sucursales)
+    suc_by_name = {(nombre or "").strip().lower(): sid for sid, nombre in sucursales}
+    suc_by_id = {str(sid): sid for sid, _ in sucursales}
+
+    # Detectar columnas de stock por sucursal. Soportamos prefijos:
+    # "STOCK@Nombre", "STOCK:Nombre", "STOCK Nombre"
+    stock_cols = []  # lista de tuplas (header, sucursal_id)
+    for h in header_map:
+        if not h:
+            continue
+        hl = h.strip()
+        base = None
+        if hl.upper().startswith(("STOCK@", "STOCK:", "STOCK ")):
+            base = hl[6:].strip()
+        if base:
+            sid = suc_by_name.get(base.lower()) or suc_by_id.get(base)
+            if sid:
+                stock_cols.append((h, sid))
+
+    return {
+        'header_map': dict(header_map),
+        'suc_by_name': suc_by_name,
+        'suc_by_id': suc_by_id,
+        'stock_cols': stock_cols,
+    }
+
+
+def parse_row(row_values, ctx):
+    """Normaliza una fila cruda del archivo.
+
+    Retorna ``None`` si la fila debe saltarse, o una tupla
+    ``(code, defaults, stocks)`` donde ``defaults`` son los valores de campos
+    del producto y ``stocks`` una lista de ``(sucursal_id, cantidad)``.
+    """
+    header_map = ctx['header_map']
+
+    def get_val(header):
+        idx = header_map.get(header)
+        if idx is not None and idx < len(row_values):
+            return row_values[idx]
+        return None
+
+    if not any(v for v in row_values if v is not None and str(v).strip() != ""):
+        return None
+    code = get_val("CODIGO 1")
+    if code is None or str(code).strip() == "":
+        return None
+    code = str(code).strip()
+
+    # Sucursal por fila (opcional)
+    sucursal_id = None
+    sucursal_val = get_val("SUCURSAL")
+    if sucursal_val is not None:
+        sstr = str(sucursal_val).strip()
+        if sstr:
+            sucursal_id = ctx['suc_by_name'].get(sstr.lower()) or ctx['suc_by_id'].get(sstr)
+
+    defaults = {
+        "nombre": str(get_val("NOMBRE") or "").strip(),
+        "descripcion": (str(get_val("DESCRIPCION") or "").strip() or None),
+        # Migración: interpretar CODIGO 2 como código de barras por defecto
+        "codigo_barras": (str(get_val("CODIGO DE BARRAS") or "") or str(get_val("CODIGO 2") or "")).strip() or None,
+        "codigo_alternativo": None,
+        "fecha_ingreso_producto": norm_date(get_val("FECHA DE INGRESO")),
+        "precio_compra": safe_decimal(get_val("PRECIO DE COMPRA")),
+        "precio_venta": safe_decimal(get_val("PRECIO DE VENTA")),
+        "permitir_venta_sin_stock": safe_bool(get_val("PERMITIR VENTA SIN STOCK"), default=True),
+    }
+
+    # Campos de cantidades globales (opcionales y de compatibilidad)
+    cantidad_global = safe_int(get_val("CANTIDAD"))
+    stock_global = safe_int(get_val("STOCK"))
+    if cantidad_global:
+        defaults["cantidad"] = cantidad_global
+    if stock_global:
+        defaults["stock"] = stock_global
+    if sucursal_id:
+        defaults["sucursal_id"] = sucursal_id
+
+    stocks = []
+    # 1) Si hay columna STOCK y sucursal por fila → asignar stock a esa sucursal
+    if stock_global and sucursal_id:
+        stocks.append((sucursal_id, stock_global))
+    # 2) Columnas dedicadas por sucursal detectadas
+    for hdr, sid in ctx['stock_cols']:
+        qty = safe_int(get_val(hdr))
+        if qty:
+            stocks.append((sid, qty))
+
+    return code, defaults, stocks
+
+
+def row_code(row_values, ctx):
+    """Extrae sólo el código de una fila (mismo criterio de salto que ``parse_row``)."""
+    if not any(v for v in row_values if v is not None and str(v).strip() != ""):
+        return None
+    idx = ctx['header_map'].get("CODIGO 1")
+    code = row_values[idx] if idx is not None and idx < len(row_values) else None
+    if code is None or str(code).strip() == "":
+        return None
+    return str(code).strip()
+
+
+def parse_rows(rows, ctx, skip=0):
+    """Versión secuencial: genera los registros normalizados en orden.
+
+    Los primeros ``skip`` registros (ya confirmados en una ejecución anterior)
+    no se normalizan: se entregan como ``(code, None, None)`` para que el
+    consumidor conozca los códigos ya procesados sin pagar el parsing completo.
+    """
+    for row_values in rows:
+        if skip > 0:
+            code = row_code(row_values, ctx)
+            if code is not None:
+                skip -= 1
+                yield code, None, None
+            continue
+        parsed = parse_row(row_values, ctx)
+        if parsed is not None:
+            yield parsed
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """SHA-256 del contenido del archivo (identifica el archivo entre ejecuciones)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Particionado de archivos
+# ---------------------------------------------------------------------------
+
+def read_csv_header(path):
+    """Lee la fila de encabezados de un CSV local.
+
+    Retorna ``(headers, data_start)`` donde ``data_start`` es el offset en
+    bytes de la primera fila de datos.
+    """
+    with open(path, 'rb') as fh:
+        first = fh.readline()
+        data_start = fh.tell()
+    headers = next(csv.reader(io.StringIO(first.decode('utf-8'), newline='')), [])
+    return headers, data_start
+
+
+def csv_byte_ranges(path, data_start, n_chunks):
+    """Divide el cuerpo de un CSV en rangos ``[start, end)`` alineados a fin de línea.
+
+    Un campo entre comillas puede contener saltos de línea: un corte dentro de
+    él partiría el registro en dos filas falsas. Cada límite se valida con la
+    paridad de comillas acumulada desde ``data_start`` (las comillas escapadas
+    ``""`` van de a pares); si algún límite queda dentro de un campo entre
+    comillas se retorna ``None`` y el llamador debe usar el modo secuencial.
+    """
+    size = os.path.getsize(path)
+    if size <= data_start:
+        return []
+    step = max(1, (size - data_start) // max(1, n_chunks))
+    bounds = [data_start]
+    with open(path, 'rb') as fh:
+        pos = data_start + step
+        while pos < size:
+            fh.seek(pos)
+            fh.readline()  # avanzar hasta el inicio de la línea siguiente
+            boundary = fh.tell()
+            if boundary >= size:
+                break
+            if boundary > bounds[-1]:
+                bounds.append(boundary)
+            pos = boundary + step
+        if not _quotes_balanced(fh, bounds):
+            return None
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _quotes_balanced(fh, bounds, block=1024 * 1024):
+    """True si hay un número par de comillas entre ``bounds[0]`` y cada límite siguiente."""
+    quotes = 0
+    fh.seek(bounds[0])
+    pos = bounds[0]
+    for boundary in bounds[1:]:
+        while pos < boundary:
+            data = fh.read(min(block, boundary - pos))
+            quotes += data.count(b'"')
+            pos += len(data)
+        if quotes % 2:
+            return False
+    return True
+
+
+def row_batches(rows, size):
+    """Agrupa filas crudas (tuplas) en listas de a lo más ``size``."""
+    batch = []
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_csv_chunk(task):
+    """Entrada del worker para un rango de bytes de un CSV."""
+    path, start, end, ctx = task
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    reader = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+    return list(parse_rows(reader, ctx))
+
+
+def parse_rows_chunk(task):
+    """Entrada del worker para un lote de filas crudas ya leídas (p. ej. de una hoja XLSX)."""
+    rows, ctx = task
+    return list(parse_rows(rows, ctx))
+
+
+def run_parallel(func, tasks, workers):
+    """Ejecuta ``func`` sobre ``tasks`` en un pool de procesos y genera los
+    registros en el orden original del archivo.
+
+    Mantiene a lo sumo ``2 * workers`` chunks en vuelo para acotar la memoria
+    cuando el proceso principal (escrituras en DB) va más lento que el parsing.
+    """
+    tasks = iter(tasks)
+    window = max(1, workers * 2)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(func, task))
+            if len(pending) >= window:
+                break
+        while pending:
+            records = pending.popleft().result()
+            nxt = next(tasks, None)
+            if nxt is not None:
+                pending.append(pool.submit(func, nxt))
+            yield from records
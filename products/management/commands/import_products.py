@@ -1,10 +1,11 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from products.models import Product, StockSucursal
+from django.db.models import F
+from django.utils import timezone
+from products.models import Product, StockSucursal, ImportacionProductos, FuenteProductos
+from products import import_pipeline as pipeline
+from reports import versiones
 from sucursales.models import Sucursal
-from decimal import Decimal, InvalidOperation
-from datetime import datetime, date
-from django.utils.dateparse import parse_date
 
 import os
 from urllib.parse import urlparse, parse_qs
@@ -16,155 +17,156 @@ class Command(BaseCommand):
         parser.add_argument("path", help="Path or URL to CSV/XLSX file")
         parser.add_argument("--dry-run", action="store_true", help="Parse only, don't write DB")
         parser.add_argument("--batch", type=int, default=500, help="Batch size for bulk operations")
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Continue the last unfinished run of the same file (by fingerprint) from its checkpoint.",
+        )
+        parser.add_argument(
+            "--skip-if-imported", action="store_true",
+            help="Do nothing if a run with the same file fingerprint already completed.",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="For URL sources: ignore stored ETag/Last-Modified/content hash and always download and import.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Parse the file in N processes (CSV by byte ranges, XLSX by row ranges). "
+                 "The main process only performs ordered batched writes. 1 = sequential.",
+        )
+
+    def handle(self, path, dry_run=False, batch=500, workers=1, resume=False, skip_if_imported=False, force=False, **options):
+        workers = max(1, int(workers or 1))
+        filetype = None
+        plower = path.lower()
+        if plower.endswith('.csv'):
+            filetype = 'csv'
+        elif plower.endswith('.xlsx'):
+            filetype = 'xlsx'
+        elif plower.startswith('http://') or plower.startswith('https://'):
+            # Support Google Sheets export URLs like .../export?format=xlsx
+            q = parse_qs(urlparse(path).query)
+            fmt = (q.get('format') or [None])[0]
+            if fmt in ('csv', 'xlsx'):
+                filetype = fmt
+        if filetype not in ('csv', 'xlsx'):
+            raise CommandError("Unsupported file type. Use .csv or .xlsx")
 
-    def handle(self, path, dry_run=False, batch=500, **options):
+        cleanup = None
+        run = None
+        fuente = None
+        validators = {}
+        is_url = plower.startswith('http://') or plower.startswith('https://')
         try:
-            filetype = None
-            plower = path.lower()
-            if plower.endswith('.csv'):
-                filetype = 'csv'
-            elif plower.endswith('.xlsx'):
-                filetype = 'xlsx'
-            elif plower.startswith('http://') or plower.startswith('https://'):
-                # Support Google Sheets export URLs like .../export?format=xlsx
-                q = parse_qs(urlparse(path).query)
-                fmt = (q.get('format') or [None])[0]
-                if fmt in ('csv', 'xlsx'):
-                    filetype = fmt
+            # URLs are downloaded first: the fingerprint (and the parallel
+            # byte-range split) need the complete local file. The request is
+            # conditional on the validators stored for the source, if the URL
+            # is a registered source (sync_products registers them; a one-off
+            # import must not schedule future syncs).
+            local_path = path
+            if is_url:
+                fuente = FuenteProductos.objects.filter(url=path[:1000]).first()
+                local_path, validators = self._fetch(path, f'.{filetype}', None if force else fuente)
+                cleanup = local_path
+                if fuente and not dry_run:
+                    fuente.ultima_consulta = timezone.now()
+                    fuente.save(update_fields=['ultima_consulta'])
+                if local_path is None:
+                    self.stdout.write(self.style.SUCCESS("Source not modified (HTTP 304). Nothing to do."))
+                    return
+            huella = pipeline.file_fingerprint(local_path)
+
+            if fuente and not force and fuente.huella == huella:
+                # Server without validators (or rotating them for identical content)
+                self._store_validators(fuente, validators, huella, dry_run)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Source content unchanged (fingerprint {huella[:12]}). Nothing to do."
+                ))
+                return
+
+            previous = ImportacionProductos.objects.filter(huella=huella).order_by('-iniciada').first()
+            if previous and previous.estado == ImportacionProductos.ESTADO_COMPLETADA and (resume or skip_if_imported):
+                if fuente:
+                    self._store_validators(fuente, validators, huella, dry_run)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Already imported (fingerprint {huella[:12]}, run #{previous.id}). Nothing to do."
+                ))
+                return
+
+            skip = 0
+            if not dry_run:
+                if resume and previous:
+                    run = previous
+                    skip = run.registros_confirmados
+                    run.estado = ImportacionProductos.ESTADO_EN_CURSO
+                    run.error = None
+                    run.save(update_fields=['estado', 'error', 'actualizada'])
+                    self.stdout.write(f"Resuming run #{run.id} after {skip} committed records.")
+                else:
+                    run = ImportacionProductos.objects.create(origen=path[:1000], huella=huella, batch=batch)
 
             if filetype == 'csv':
-                created, updated = self._import_csv(path, dry_run, batch)
-            elif filetype == 'xlsx':
-                created, updated = self._import_xlsx(path, dry_run, batch)
+                created, updated = self._import_csv(local_path, dry_run, batch, workers, run=run, skip=skip)
             else:
-                raise CommandError("Unsupported file type. Use .csv or .xlsx")
+                created, updated = self._import_xlsx(local_path, dry_run, batch, workers, run=run, skip=skip)
+            if updated and not dry_run:
+                # bulk_update does not send post_save: cached reports keep old names/costs
+                versiones.invalidar(versiones.CATALOGO)
+
+            if run:
+                run.estado = ImportacionProductos.ESTADO_COMPLETADA
+                run.finalizada = timezone.now()
+                run.save(update_fields=['estado', 'finalizada', 'actualizada'])
+            if fuente:
+                self._store_validators(fuente, validators, huella, dry_run)
         except Exception as e:
+            if run:
+                ImportacionProductos.objects.filter(pk=run.pk).update(
+                    estado=ImportacionProductos.ESTADO_FALLIDA, error=str(e), actualizada=timezone.now()
+                )
             raise CommandError(str(e))
+        finally:
+            self._cleanup(cleanup)
 
         self.stdout.write(self.style.SUCCESS(f"Imported. created={created}, updated={updated}"))
 
-    def _safe_decimal(self, val):
-        if val is None:
-            return Decimal("0.00")
-        try:
-            return Decimal(str(val).strip().replace(",", "."))
-        except (ValueError, TypeError, InvalidOperation):
-            return Decimal("0.00")
+    def _parse_context(self, header_map):
+        missing = [h for h in pipeline.REQUIRED_HEADERS if h not in header_map]
+        if missing:
+            raise CommandError(f"Missing required headers: {', '.join(missing)}")
+        return pipeline.build_parse_context(header_map, Sucursal.objects.values_list('id', 'nombre'))
 
-    def _safe_int(self, val):
-        try:
-            if val is None:
-                return 0
-            s = str(val).strip().replace(",", "")
-            if s == "":
-                return 0
-            return int(float(s))
-        except Exception:
-            return 0
-
-    def _safe_bool(self, val, default=True):
-        if val is None:
-            return default
-        s = str(val).strip().lower()
-        if s in ("1", "true", "sí", "si", "yes", "y", "on"):  # Spanish variants included
-            return True
-        if s in ("0", "false", "no", "off", "n"):
-            return False
-        return default
-
-    def _norm_date(self, fecha_raw):
-        if not fecha_raw:
-            return None
-        if isinstance(fecha_raw, (datetime, date)):
-            return fecha_raw.date() if isinstance(fecha_raw, datetime) else fecha_raw
-        try:
-            return parse_date(str(fecha_raw).split(" ")[0].strip())
-        except Exception:
-            return None
+    def _process_records(self, records, dry_run=False, batch=500, run=None, skip=0):
+        """Aplica registros ya normalizados (en orden de archivo) contra la DB.
 
-    def _process_rows(self, rows, header_map, dry_run=False, batch=500):
-        def get_val(rv, header):
-            idx = header_map.get(header)
-            if idx is not None and idx < len(rv):
-                return rv[idx]
-            return None
+        Si un código aparece más de una vez en el archivo, se conserva la primera
+        aparición; el modo paralelo entrega los registros en el mismo orden que el
+        secuencial, por lo que la semántica es idéntica en ambos.
 
+        Los primeros ``skip`` registros ya fueron confirmados por una ejecución
+        anterior (``run``): sólo se registran sus códigos para mantener la misma
+        semántica de duplicados. Cada flush guarda el checkpoint en ``run``.
+        """
         existing_map = {p.producto_id: p for p in Product.objects.filter(producto_id__isnull=False)}
         to_create = []
         to_update = []
         processed_codes = set()
-
-        # Mapear sucursales por nombre (case-insensitive) e ID en texto
-        sucursales = list(Sucursal.objects.all())
-        suc_by_name = { (s.nombre or "").strip().lower(): s for s in sucursales }
-        suc_by_id = { str(s.id): s for s in sucursales }
-
-        # Detectar columnas de stock por sucursal. Soportamos prefijos:
-        # "STOCK@Nombre", "STOCK:Nombre", "STOCK Nombre"
-        stock_sucursal_cols = []  # lista de tuplas (header, sucursal)
-        for h, i in header_map.items():
-            if not h:
-                continue
-            hl = h.strip()
-            base = None
-            if hl.upper().startswith("STOCK@"):  # STOCK@Sucursal
-                base = hl[6:].strip()
-            elif hl.upper().startswith("STOCK:"):
-                base = hl[6:].strip()
-            elif hl.upper().startswith("STOCK "):
-                base = hl[6:].strip()
-            # Mapear base a sucursal
-            if base:
-                key = base.lower()
-                suc = suc_by_name.get(key) or suc_by_id.get(base)
-                if suc:
-                    stock_sucursal_cols.append((h, suc))
+        created = updated = 0
 
         # Acumular cambios de stock por sucursal a aplicar tras flush de productos
         # Dict[(producto_id_code, sucursal_id)] = cantidad
         stocks_to_set = {}
+        position = 0
 
-        for row_values in rows:
-            if not any(v for v in row_values if v is not None and str(v).strip() != ""):
-                continue
-            code = get_val(row_values, "CODIGO 1")
-            if code is None or str(code).strip() == "":
+        for code, defaults, stocks in records:
+            position += 1
+            if position <= skip:
+                processed_codes.add(code)
                 continue
-            code = str(code).strip()
             if code in processed_codes:
                 continue
             processed_codes.add(code)
 
-            # Sucursal por fila (opcional)
-            sucursal_val = get_val(row_values, "SUCURSAL")
-            sucursal_obj = None
-            if sucursal_val is not None:
-                sstr = str(sucursal_val).strip()
-                if sstr:
-                    sucursal_obj = suc_by_name.get(sstr.lower()) or suc_by_id.get(sstr)
-
-            defaults = {
-                "nombre": str(get_val(row_values, "NOMBRE") or "").strip(),
-                "descripcion": (str(get_val(row_values, "DESCRIPCION") or "").strip() or None),
-                # Migración: interpretar CODIGO 2 como código de barras por defecto
-                "codigo_barras": (str(get_val(row_values, "CODIGO DE BARRAS") or "") or str(get_val(row_values, "CODIGO 2") or "")).strip() or None,
-                "codigo_alternativo": None,
-                "fecha_ingreso_producto": self._norm_date(get_val(row_values, "FECHA DE INGRESO")),
-                "precio_compra": self._safe_decimal(get_val(row_values, "PRECIO DE COMPRA")),
-                "precio_venta": self._safe_decimal(get_val(row_values, "PRECIO DE VENTA")),
-                "permitir_venta_sin_stock": self._safe_bool(get_val(row_values, "PERMITIR VENTA SIN STOCK"), default=True),
-            }
-
-            # Campos de cantidades globales (opcionales y de compatibilidad)
-            cantidad_global = self._safe_int(get_val(row_values, "CANTIDAD"))
-            stock_global = self._safe_int(get_val(row_values, "STOCK"))
-            if cantidad_global:
-                defaults["cantidad"] = cantidad_global
-            if stock_global:
-                defaults["stock"] = stock_global
-            if sucursal_obj:
-                defaults["sucursal"] = sucursal_obj
-
             if code in existing_map:
                 prod = existing_map[code]
                 if any(getattr(prod, k) != v for k, v in defaults.items()):
@@ -174,27 +176,23 @@ class Command(BaseCommand):
             else:
                 to_create.append(Product(producto_id=code, **defaults))
 
-            # Manejar stock por sucursal en fila
-            # 1) Si hay columna STOCK y sucursal por fila → asignar stock a esa sucursal
-            if stock_global and sucursal_obj:
-                stocks_to_set[(code, sucursal_obj.id)] = stock_global
-
-            # 2) Columnas dedicadas por sucursal detectadas
-            for hdr, suc in stock_sucursal_cols:
-                qty = self._safe_int(get_val(row_values, hdr))
-                if qty:
-                    stocks_to_set[(code, suc.id)] = qty
+            for suc_id, qty in stocks:
+                stocks_to_set[(code, suc_id)] = qty
 
             # Flush periodically to keep memory low
             if not dry_run and (len(to_create) + len(to_update)) >= batch:
-                self._flush(to_create, to_update, stocks_to_set, batch)
+                created += len(to_create)
+                updated += len(to_update)
+                self._flush(to_create, to_update, stocks_to_set, batch, run=run, position=position)
 
+        created += len(to_create)
+        updated += len(to_update)
         if not dry_run:
-            self._flush(to_create, to_update, stocks_to_set, batch)
-            return len(to_create), len(to_update)
-        return len(to_create), len(to_update)
+            self._flush(to_create, to_update, stocks_to_set, batch, run=run, position=max(position, skip))
+        return created, updated
 
-    def _flush(self, to_create, to_update, stocks_to_set, batch):
+    def _flush(self, to_create, to_update, stocks_to_set, batch, run=None, position=0):
+        n_created, n_updated = len(to_create), len(to_update)
         with transaction.atomic():
             if to_create:
                 Product.objects.bulk_create(to_create, batch_size=batch)
@@ -223,71 +221,119 @@ class Command(BaseCommand):
                     # Remover del dict tras aplicar
                     stocks_to_set.pop((code, suc_id), None)
 
-    def _import_csv(self, path, dry_run=False, batch=500):
-        import csv
-        import io
-        import requests
-
-        if path.startswith("http://") or path.startswith("https://"):
-            resp = requests.get(path, stream=True, timeout=60)
-            resp.raise_for_status()
-            stream = io.TextIOWrapper(resp.raw, encoding='utf-8', newline='')
-        else:
-            stream = open(path, 'r', encoding='utf-8', newline='')
-
-        with stream as f:
-            reader = csv.reader(f)
-            headers = next(reader, [])
-            header_map = {h.strip(): i for i, h in enumerate(headers) if h}
-            minimal = ['NOMBRE', 'CODIGO 1', 'PRECIO DE COMPRA', 'PRECIO DE VENTA']
-            missing = [h for h in minimal if h not in header_map]
-            if missing:
-                raise CommandError(f"Missing required headers: {', '.join(missing)}")
-            return self._process_rows(reader, header_map, dry_run=dry_run, batch=batch)
-
-    def _import_xlsx(self, path, dry_run=False, batch=500):
-        from openpyxl import load_workbook
+            # Checkpoint en la misma transacción que las escrituras del batch
+            if run is not None:
+                ImportacionProductos.objects.filter(pk=run.pk).update(
+                    registros_confirmados=position,
+                    creados=F('creados') + n_created,
+                    actualizados=F('actualizados') + n_updated,
+                    actualizada=timezone.now(),
+                )
+
+    def _fetch(self, url, suffix, fuente=None):
+        """Download a URL to a temp file.
+
+        When ``fuente`` is given, its stored validators are sent as
+        If-None-Match / If-Modified-Since. Returns ``(tmp_path, validators)``;
+        ``tmp_path`` is None when the server answers 304 Not Modified.
+        """
         import tempfile, requests
-        import os
 
-        # For URLs, download to a temp file to let openpyxl stream from disk
-        cleanup = None
-        if path.startswith("http://") or path.startswith("https://"):
-            resp = requests.get(path, stream=True, timeout=120)
+        headers = {}
+        if fuente is not None:
+            if fuente.etag:
+                headers['If-None-Match'] = fuente.etag
+            if fuente.last_modified:
+                headers['If-Modified-Since'] = fuente.last_modified
+        resp = requests.get(url, stream=True, timeout=120, headers=headers)
+        with resp:
+            if resp.status_code == 304:
+                return None, {}
             resp.raise_for_status()
-            fd, tmp = tempfile.mkstemp(suffix='.xlsx')
+            validators = {
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+            }
+            fd, tmp = tempfile.mkstemp(suffix=suffix)
             os.close(fd)
             with open(tmp, 'wb') as out:
                 for chunk in resp.iter_content(chunk_size=1024*1024):
                     if chunk:
                         out.write(chunk)
-            path = tmp
-            cleanup = tmp
+        return tmp, validators
+
+    def _store_validators(self, fuente, validators, huella, dry_run):
+        """Persist the source validators and content hash after a successful import.
+
+        Nothing is stored on dry-run so the next real run still downloads.
+        """
+        if dry_run:
+            return
+        fuente.etag = (validators.get('etag') or '')[:255] or None
+        fuente.last_modified = (validators.get('last_modified') or '')[:255] or None
+        if fuente.huella != huella:
+            fuente.ultima_importacion = timezone.now()
+        fuente.huella = huella
+        fuente.save(update_fields=['etag', 'last_modified', 'huella', 'ultima_importacion'])
+
+    def _cleanup(self, tmp):
+        if tmp and os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except Exception:
+                pass
+
+    def _import_csv(self, path, dry_run=False, batch=500, workers=1, run=None, skip=0):
+        import csv
+
+        if workers > 1:
+            result = self._import_csv_parallel(path, dry_run, batch, workers, run=run, skip=skip)
+            if result is not None:
+                return result
+            self.stdout.write("Quoted fields span several lines; parsing the CSV sequentially.")
+
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            headers = next(reader, [])
+            header_map = {h.strip(): i for i, h in enumerate(headers) if h}
+            ctx = self._parse_context(header_map)
+            records = pipeline.parse_rows(reader, ctx, skip=skip)
+            return self._process_records(records, dry_run=dry_run, batch=batch, run=run, skip=skip)
+
+    def _import_csv_parallel(self, path, dry_run, batch, workers, run=None, skip=0):
+        headers, data_start = pipeline.read_csv_header(path)
+        header_map = {h.strip(): i for i, h in enumerate(headers) if h}
+        ctx = self._parse_context(header_map)
+        ranges = pipeline.csv_byte_ranges(path, data_start, workers * pipeline.CHUNKS_PER_WORKER)
+        if ranges is None:
+            return None
+        tasks = [(path, start, end, ctx) for start, end in ranges]
+        records = pipeline.run_parallel(pipeline.parse_csv_chunk, tasks, workers)
+        return self._process_records(records, dry_run=dry_run, batch=batch, run=run, skip=skip)
+
+    def _import_xlsx(self, path, dry_run=False, batch=500, workers=1, run=None, skip=0):
+        from openpyxl import load_workbook
 
+        wb = load_workbook(path, read_only=True, data_only=True)
         try:
-            wb = load_workbook(path, read_only=True, data_only=True)
             sh = wb.active
             first_row = next(sh.iter_rows(min_row=1, max_row=1, values_only=True), None)
             headers = [str(v).strip() for v in (first_row or [])]
             header_map = {h: i for i, h in enumerate(headers) if h}
-            minimal = ['NOMBRE', 'CODIGO 1', 'PRECIO DE COMPRA', 'PRECIO DE VENTA']
-            missing = [h for h in minimal if h not in header_map]
-            if missing:
-                raise CommandError(f"Missing required headers: {', '.join(missing)}")
-
-            def row_iter():
-                for rv in sh.iter_rows(min_row=2, values_only=True):
-                    yield rv
-
-            created, updated = self._process_rows(row_iter(), header_map, dry_run=dry_run, batch=batch)
+            ctx = self._parse_context(header_map)
+
+            if workers > 1:
+                # openpyxl recorre la hoja desde el principio aunque se pida
+                # min_row: un solo lector la parsea una vez y el pool normaliza
+                # los lotes de filas crudas.
+                rows = sh.iter_rows(min_row=2, values_only=True)
+                tasks = ((lote, ctx) for lote in pipeline.row_batches(rows, pipeline.XLSX_ROWS_PER_TASK))
+                records = pipeline.run_parallel(pipeline.parse_rows_chunk, tasks, workers)
+            else:
+                records = pipeline.parse_rows(sh.iter_rows(min_row=2, values_only=True), ctx, skip=skip)
+            return self._process_records(records, dry_run=dry_run, batch=batch, run=run, skip=skip)
+        finally:
             try:
                 wb.close()
             except Exception:
                 pass
-            return created, updated
-        finally:
-            if cleanup and os.path.exists(cleanup):
-                try:
-                    os.remove(cleanup)
-                except Exception:
-                    pass
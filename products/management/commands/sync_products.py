@@ -0,0 +1,59 @@
+import os
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from products.models import FuenteProductos
+
+
+class Command(BaseCommand):
+    help = (
+        "Periodically sync product catalogs from registered remote sources (FuenteProductos). "
+        "Each poll is a conditional request: unchanged sources cost one HTTP round trip."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls", nargs="*",
+            help="Source URLs to register (or re-activate) before syncing.",
+        )
+        parser.add_argument(
+            "--interval", type=int,
+            default=int(os.getenv("PRODUCT_SYNC_INTERVAL", "900")),
+            help="Seconds between polls (default: PRODUCT_SYNC_INTERVAL or 900).",
+        )
+        parser.add_argument("--once", action="store_true", help="Poll every source once and exit")
+        parser.add_argument("--batch", type=int, default=500, help="Batch size passed to import_products")
+        parser.add_argument("--workers", type=int, default=1, help="Parser processes passed to import_products")
+
+    def handle(self, urls=None, interval=900, once=False, batch=500, workers=1, **options):
+        for url in urls or []:
+            FuenteProductos.objects.update_or_create(url=url[:1000], defaults={'activa': True})
+
+        while True:
+            self._poll(batch, workers)
+            if once:
+                return
+            close_old_connections()
+            time.sleep(max(1, interval))
+
+    def _poll(self, batch, workers):
+        fuentes = list(FuenteProductos.objects.filter(activa=True).order_by('id'))
+        if not fuentes:
+            self.stdout.write("No active product sources.")
+            return
+        for fuente in fuentes:
+            self.stdout.write(f"[{timezone.now():%Y-%m-%d %H:%M:%S}] {fuente.url}")
+            try:
+                call_command(
+                    'import_products', fuente.url,
+                    resume=True, batch=batch, workers=workers,
+                    stdout=self.stdout, stderr=self.stderr,
+                )
+            except CommandError as e:
+                # A failing source must not stop the others; the failed run is
+                # recorded in ImportacionProductos and resumed on the next poll.
+                self.stderr.write(self.style.ERROR(f"{fuente.url}: {e}"))
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-19 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_merge_0011_and_0015'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacionProductos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origen', models.CharField(max_length=1000, verbose_name='Ruta o URL')),
+                ('huella', models.CharField(db_index=True, max_length=64, verbose_name='Huella SHA-256')),
+                ('estado', models.CharField(choices=[('en_curso', 'En curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='en_curso', max_length=20)),
+                ('registros_confirmados', models.PositiveIntegerField(default=0, verbose_name='Registros confirmados')),
+                ('creados', models.PositiveIntegerField(default=0)),
+                ('actualizados', models.PositiveIntegerField(default=0)),
+                ('batch', models.PositiveIntegerField(default=500)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('iniciada', models.DateTimeField(auto_now_add=True)),
+                ('actualizada', models.DateTimeField(auto_now=True)),
+                ('finalizada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Importación de Productos',
+                'verbose_name_plural': 'Importaciones de Productos',
+                'ordering': ['-iniciada'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-19 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_importacionproductos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FuenteProductos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=1000, unique=True, verbose_name='URL')),
+                ('activa', models.BooleanField(default=True, help_text='Incluir en la sincronización periódica (sync_products).')),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=255, null=True, verbose_name='Last-Modified')),
+                ('huella', models.CharField(blank=True, max_length=64, null=True, verbose_name='Huella SHA-256 importada')),
+                ('ultima_consulta', models.DateTimeField(blank=True, null=True)),
+                ('ultima_importacion', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Fuente de Productos',
+                'verbose_name_plural': 'Fuentes de Productos',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_fuenteproductos'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ajustestock',
+            index=models.Index(fields=['-fecha'], name='products_aj_fecha_ed98c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ajustestock',
+            index=models.Index(fields=['producto', '-fecha'], name='products_aj_product_ee4380_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ajustestock',
+            index=models.Index(fields=['sucursal', '-fecha'], name='products_aj_sucursa_c109aa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferenciastock',
+            index=models.Index(fields=['-fecha'], name='products_tr_fecha_d70528_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferenciastock',
+            index=models.Index(fields=['producto', '-fecha'], name='products_tr_product_5906d5_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.7 on 2026-10-19 03:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_indices_movimientos_stock'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ajustestock',
+            name='products_aj_fecha_ed98c0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ajustestock',
+            name='products_aj_product_ee4380_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ajustestock',
+            name='products_aj_sucursa_c109aa_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transferenciastock',
+            name='products_tr_fecha_d70528_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transferenciastock',
+            name='products_tr_product_5906d5_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ajustestock',
+            index=models.Index(fields=['-fecha', '-id'], name='products_aj_fecha_8cb400_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ajustestock',
+            index=models.Index(fields=['producto', '-fecha', '-id'], name='products_aj_product_f473b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ajustestock',
+            index=models.Index(fields=['sucursal', '-fecha', '-id'], name='products_aj_sucursa_e127f1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferenciastock',
+            index=models.Index(fields=['-fecha', '-id'], name='products_tr_fecha_c15652_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferenciastock',
+            index=models.Index(fields=['producto', '-fecha', '-id'], name='products_tr_product_b5fbe6_idx'),
+        ),
+    ]
@@ -32,6 +32,10 @@ class TransferenciaStock(models.Model):
 
     class Meta:
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['-fecha', '-id']),
+            models.Index(fields=['producto', '-fecha', '-id']),
+        ]
         verbose_name = 'Transferencia de Stock'
         verbose_name_plural = 'Transferencias de Stock'
 
@@ -49,6 +53,11 @@ class AjusteStock(models.Model):
 
     class Meta:
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['-fecha', '-id']),
+            models.Index(fields=['producto', '-fecha', '-id']),
+            models.Index(fields=['sucursal', '-fecha', '-id']),
+        ]
         verbose_name = 'Ajuste de Stock'
         verbose_name_plural = 'Ajustes de Stock'
 
@@ -56,6 +65,17 @@ class AjusteStock(models.Model):
         signo = '+' if (self.cantidad_delta or 0) >= 0 else ''
         return f"{self.producto} @ {self.sucursal}: {signo}{self.cantidad_delta} ({self.fecha:%Y-%m-%d %H:%M})"
 
+class ProductQuerySet(models.QuerySet):
+    def con_margenes(self):
+        """
+        Anota precio_venta_neto, precio_compra_neto, ganancia_unitaria y
+        margen_porcentaje calculados en SQL con las mismas reglas de redondeo
+        que las propiedades del modelo (que reutilizan estos valores si están).
+        """
+        from .pricing import anotaciones_margen
+        return self.annotate(**anotaciones_margen())
+
+
 class Product(models.Model):
     """
     Modelo simplificado para un producto.
@@ -84,6 +104,8 @@ class Product(models.Model):
     permitir_venta_sin_stock = models.BooleanField(default=True, verbose_name="Permitir Venta sin Stock")
     sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='productos', blank=True, null=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return self.nombre if self.nombre else self.producto_id or f"Producto sin nombre ({self.pk})"
 
@@ -109,6 +131,8 @@ class Product(models.Model):
         Calcula el precio de venta sin IVA.
         Fórmula: Precio total con IVA = Precio sin IVA * 1.19
         """
+        if 'precio_venta_neto' in self.__dict__:  # anotado por Product.objects.con_margenes()
+            return self.__dict__['precio_venta_neto']
         if not self.precio_venta:
             return Decimal('0.00')
         return (self.precio_venta / Decimal('1.19')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
@@ -135,6 +159,8 @@ class Product(models.Model):
         Calcula el costo neto (Precio de Compra sin IVA).
         Fórmula: Precio de Compra / 1.19
         """
+        if 'precio_compra_neto' in self.__dict__:  # anotado por Product.objects.con_margenes()
+            return self.__dict__['precio_compra_neto']
         if not self.precio_compra:
             return Decimal('0.00')
         return (self.precio_compra / Decimal('1.19')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
@@ -149,6 +175,8 @@ class Product(models.Model):
         Calcula la ganancia real (utilidad neta) en base a los precios sin IVA.
         Fórmula: ganancia = Precio de Venta sin IVA – Precio de Compra sin IVA
         """
+        if 'ganancia_unitaria' in self.__dict__:  # anotado por Product.objects.con_margenes()
+            return self.__dict__['ganancia_unitaria']
         if self.precio_venta_sin_iva == Decimal('0.00'):
             return Decimal('0.00')
         return (self.precio_venta_sin_iva - self.precio_compra_sin_iva).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
@@ -163,6 +191,8 @@ class Product(models.Model):
         Calcula el porcentaje de ganancia basado en el precio de venta sin IVA.
         Fórmula: (ganancia neta / Precio de Venta sin IVA) * 100
         """
+        if 'margen_porcentaje' in self.__dict__:  # anotado por Product.objects.con_margenes()
+            return self.__dict__['margen_porcentaje']
         if self.precio_venta_sin_iva == Decimal('0.00'):
             return Decimal('0.00')
         porcentaje = (self.ganancia_neta / self.precio_venta_sin_iva) * Decimal('100')
@@ -201,4 +231,64 @@ class Product(models.Model):
         # Fallback legado: solo si pertenece a la sucursal
         if self.sucursal_id == sucursal.id:
             self.stock = max(0, (self.stock or 0) - cantidad)
-            self.save()
\ No newline at end of file
+            self.save()
+
+class ImportacionProductos(models.Model):
+    """Ejecución del comando import_products sobre un archivo concreto.
+
+    Guarda la huella (SHA-256) del archivo y un checkpoint con la cantidad de
+    registros ya confirmados en la DB, actualizado en la misma transacción de
+    cada flush. Permite reanudar (--resume) y omitir archivos ya importados.
+    """
+    ESTADO_EN_CURSO = 'en_curso'
+    ESTADO_COMPLETADA = 'completada'
+    ESTADO_FALLIDA = 'fallida'
+    ESTADOS = [
+        (ESTADO_EN_CURSO, 'En curso'),
+        (ESTADO_COMPLETADA, 'Completada'),
+        (ESTADO_FALLIDA, 'Fallida'),
+    ]
+
+    origen = models.CharField(max_length=1000, verbose_name="Ruta o URL")
+    huella = models.CharField(max_length=64, db_index=True, verbose_name="Huella SHA-256")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=ESTADO_EN_CURSO)
+    registros_confirmados = models.PositiveIntegerField(default=0, verbose_name="Registros confirmados")
+    creados = models.PositiveIntegerField(default=0)
+    actualizados = models.PositiveIntegerField(default=0)
+    batch = models.PositiveIntegerField(default=500)
+    error = models.TextField(blank=True, null=True)
+    iniciada = models.DateTimeField(auto_now_add=True)
+    actualizada = models.DateTimeField(auto_now=True)
+    finalizada = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-iniciada']
+        verbose_name = 'Importación de Productos'
+        verbose_name_plural = 'Importaciones de Productos'
+
+    def __str__(self):
+        return f"{self.origen} [{self.huella[:12]}] {self.estado} ({self.registros_confirmados})"
+
+
+class FuenteProductos(models.Model):
+    """Fuente remota (Google Sheets / HTTP) de un catálogo de productos.
+
+    Guarda los validadores HTTP (ETag / Last-Modified) y la huella del último
+    contenido importado con éxito para que import_products haga peticiones
+    condicionales y evite descargar o re-parsear una fuente sin cambios.
+    sync_products consulta periódicamente las fuentes activas.
+    """
+    url = models.CharField(max_length=1000, unique=True, verbose_name="URL")
+    activa = models.BooleanField(default=True, help_text="Incluir en la sincronización periódica (sync_products).")
+    etag = models.CharField(max_length=255, blank=True, null=True)
+    last_modified = models.CharField(max_length=255, blank=True, null=True, verbose_name="Last-Modified")
+    huella = models.CharField(max_length=64, blank=True, null=True, verbose_name="Huella SHA-256 importada")
+    ultima_consulta = models.DateTimeField(blank=True, null=True)
+    ultima_importacion = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Fuente de Productos'
+        verbose_name_plural = 'Fuentes de Productos'
+
+    def __str__(self):
+        return self.url
@@ -0,0 +1,81 @@
+"""Expresiones SQL para precios netos (sin IVA) y márgenes de productos.
+
+Replican exactamente las propiedades de ``Product`` (división por 1,19 y
+redondeo a centavos ROUND_HALF_UP) pero se evalúan en la base de datos, de modo
+que listados, exportaciones y reportes no pagan la aritmética Decimal fila a
+fila en Python.
+
+Todo el cálculo se hace en centavos enteros: la división entera con redondeo
+"mitad hacia afuera" es exacta tanto en SQLite (donde los decimales se guardan
+como REAL) como en PostgreSQL. Se asumen divisores positivos (precios no
+negativos), igual que el resto del sistema.
+"""
+from decimal import Decimal
+
+from django.db.models import BigIntegerField, Case, DecimalField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import Exact, GreaterThanOrEqual
+
+IVA_CENTESIMAS = 119  # 1,19 expresado en centésimas
+
+
+def _expr(value):
+    return F(value) if isinstance(value, str) else value
+
+
+def centavos(value):
+    """Monto Decimal (NULL = 0) → entero de centavos."""
+    return Cast(Round(Coalesce(_expr(value), Value(Decimal('0.00'))) * Value(100)), BigIntegerField())
+
+
+def dividir_redondeado(num, den):
+    """División entera ``num / den`` con redondeo mitad hacia afuera (``den`` > 0)."""
+    return Case(
+        When(GreaterThanOrEqual(num, 0), then=(Value(2) * num + den) / (Value(2) * den)),
+        default=Value(0) - (Value(-2) * num + den) / (Value(2) * den),
+        output_field=BigIntegerField(),
+    )
+
+
+def a_pesos(centavos_expr):
+    """Centavos enteros → Decimal con 2 decimales."""
+    return ExpressionWrapper(
+        centavos_expr * Value(Decimal('0.01')),
+        output_field=DecimalField(max_digits=16, decimal_places=2),
+    )
+
+
+def neto_centavos(value):
+    """Centavos del monto sin IVA (``monto / 1.19`` redondeado)."""
+    return dividir_redondeado(centavos(value) * Value(100), Value(IVA_CENTESIMAS))
+
+
+def margenes_centavos(precio_venta='precio_venta', precio_compra='precio_compra'):
+    """Expresiones en centavos (y centésimas de %) equivalentes a las propiedades de Product.
+
+    Retorna ``(venta_neta, compra_neta, ganancia, porcentaje)``.
+    """
+    venta = neto_centavos(precio_venta)
+    compra = neto_centavos(precio_compra)
+    ganancia = Case(
+        When(Exact(venta, 0), then=Value(0)),
+        default=venta - compra,
+        output_field=BigIntegerField(),
+    )
+    porcentaje = Case(
+        When(Exact(venta, 0), then=Value(0)),
+        default=dividir_redondeado((venta - compra) * Value(10000), venta),
+        output_field=BigIntegerField(),
+    )
+    return venta, compra, ganancia, porcentaje
+
+
+def anotaciones_margen(prefix=''):
+    """Anotaciones para ``Product`` (o una relación vía ``prefix='producto__'``)."""
+    venta, compra, ganancia, porcentaje = margenes_centavos(f'{prefix}precio_venta', f'{prefix}precio_compra')
+    return {
+        'precio_venta_neto': a_pesos(venta),
+        'precio_compra_neto': a_pesos(compra),
+        'ganancia_unitaria': a_pesos(ganancia),
+        'margen_porcentaje': a_pesos(porcentaje),
+    }
@@ -4,11 +4,18 @@ from django.urls import reverse
 from django.utils import timezone
 from decimal import Decimal
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+import io
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from tests.factories import (
     create_user, create_sucursal, create_product
 )
-from products.models import Product, StockSucursal, TransferenciaStock, AjusteStock
+from products.models import Product, StockSucursal, TransferenciaStock, AjusteStock, ImportacionProductos, FuenteProductos
 from cashier.models import Venta, VentaDetalle
 from sucursales.models import Sucursal
 
@@ -71,6 +78,22 @@ class ProductStockFlowsTests(TestCase):
         # Evitar falso positivo: aseguramos que no aparezca la fila -1 analizando celdas Delta específicas
         self.assertNotIn('>-1<', html_a)
 
+    def test_transfer_history_keyset_pages(self):
+        otro = create_product("TP2", "Otro Prod", precio_compra=Decimal('1000'), precio_venta=Decimal('2000'))
+        for i in range(23):
+            TransferenciaStock.objects.create(producto=self.prod, origen=self.suc_a, destino=self.suc_b, cantidad=i + 1)
+        TransferenciaStock.objects.create(producto=otro, origen=self.suc_a, destino=self.suc_b, cantidad=99)
+        # Misma fecha para todas: el orden lo desempata el id
+        TransferenciaStock.objects.update(fecha=timezone.now())
+        self.client.force_login(self.admin)
+        url = f'/products/transfer/history/?producto={self.prod.id}&per_page=10'
+        cantidades = []
+        while url:
+            page = self.client.get(url).context['page_obj']
+            cantidades += [t.cantidad for t in page]
+            url = page.url_siguiente and '/products/transfer/history/' + page.url_siguiente
+        self.assertEqual(cantidades, list(range(23, 0, -1)))
+
     def test_advanced_reports_ajax_filters_combined(self):
         # Crear ventas para alimentar reporte
         from reports.analytics import compute_analytics
@@ -102,6 +125,45 @@ class ProductStockFlowsTests(TestCase):
         # Debe devolver 302 (redirect) o 403; no 200
         self.assertNotEqual(resp.status_code, 200)
 
+    def test_export_products_streams_csv_and_xlsx(self):
+        from openpyxl import load_workbook
+        create_product("TP2", "Otro Prod", precio_compra=Decimal('119'), precio_venta=Decimal('238'))
+        self.client.force_login(self.admin)
+        resp = self.client.get('/products/exportar/csv/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        lines = b''.join(resp.streaming_content).decode('utf-8').lstrip('\ufeff').splitlines()
+        self.assertEqual(lines[0].split(';')[2], 'CODIGO 1')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('TP2', lines[1])  # orden por nombre: "Otro Prod" < "Test Prod"
+
+        resp = self.client.get('/products/exportar/excel/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        wb = load_workbook(io.BytesIO(b''.join(resp.streaming_content)), read_only=True)
+        rows = list(wb['Productos'].iter_rows(values_only=True))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][2], 'TP2')
+        self.assertEqual(rows[1][8], '200')  # 238 / 1.19
+
+    def test_con_margenes_matches_python_properties(self):
+        precios = [('0', '0'), ('0', '990'), ('1190', '0'), ('999.99', '1234.56'),
+                   ('5000', '4000'), ('0.01', '0.02'), ('29.38', '200'), ('87654321.99', '99999999.99')]
+        for i, (pc, pv) in enumerate(precios):
+            create_product(f"M{i}", f"Margen {i}", precio_compra=Decimal(pc), precio_venta=Decimal(pv))
+        plain = {p.pk: p for p in Product.objects.all()}
+        for p in Product.objects.con_margenes():
+            ref = plain[p.pk]
+            self.assertEqual(
+                (p.precio_venta_sin_iva, p.precio_compra_sin_iva, p.ganancia_neta, p.porcentaje_ganancia),
+                (ref.precio_venta_sin_iva, ref.precio_compra_sin_iva, ref.ganancia_neta, ref.porcentaje_ganancia),
+                msg=f"{ref.precio_compra} / {ref.precio_venta}",
+            )
+        self.client.force_login(self.admin)
+        resp = self.client.get('/products/management/', {'sort_by': 'porcentaje_ganancia', 'order': 'desc', 'per_page': 25})
+        margenes = [p.porcentaje_ganancia for p in resp.context['products']]
+        self.assertEqual(margenes, sorted(margenes, reverse=True))
+
     def test_mass_upload_placeholder(self):
         """Si existe endpoint de carga masiva, simular; si no, marcar skip lógico."""
         # Buscar ruta conocida (ajustar si hay URL específica). Aquí sólo comprobamos que no 404 genérico si existe.
@@ -116,3 +178,213 @@ class ProductStockFlowsTests(TestCase):
                 # No afirmar demasiado: sólo que responde algo procesable
                 self.assertIn(post_resp.status_code, (200, 302))
                 break
+
+
+class ImportProductsCommandTests(TestCase):
+    def setUp(self):
+        self.suc = create_sucursal("Central")
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        lines = ["NOMBRE,CODIGO 1,PRECIO DE COMPRA,PRECIO DE VENTA,FECHA DE INGRESO,STOCK@Central"]
+        for i in range(300):
+            lines.append(f"Prod {i},C{i},{100 + i},{200 + i},2025-01-{(i % 28) + 1:02d},{i % 7}")
+        # Duplicado: debe prevalecer la misma fila en modo secuencial y paralelo
+        lines.append("Prod dup,C5,1,2,,")
+        self.csv_path = os.path.join(self.tmpdir, 'productos.csv')
+        with open(self.csv_path, 'w', encoding='utf-8', newline='') as fh:
+            fh.write("\n".join(lines) + "\n")
+
+    def _snapshot(self):
+        return sorted(Product.objects.values_list('producto_id', 'nombre', 'precio_compra', 'precio_venta', 'fecha_ingreso_producto'))
+
+    def test_parallel_matches_sequential(self):
+        call_command('import_products', self.csv_path, batch=50, stdout=io.StringIO())
+        sequential = self._snapshot()
+        stocks_seq = sorted(StockSucursal.objects.values_list('producto__producto_id', 'cantidad'))
+        Product.objects.all().delete()
+        call_command('import_products', self.csv_path, batch=50, workers=2, stdout=io.StringIO())
+        self.assertEqual(self._snapshot(), sequential)
+        self.assertEqual(sorted(StockSucursal.objects.values_list('producto__producto_id', 'cantidad')), stocks_seq)
+        self.assertEqual(Product.objects.count(), 300)
+        self.assertEqual(Product.objects.get(producto_id='C5').nombre, 'Prod 5')
+
+    def test_csv_byte_ranges_cover_every_row(self):
+        from products import import_pipeline as pipeline
+        headers, data_start = pipeline.read_csv_header(self.csv_path)
+        self.assertIn('CODIGO 1', headers)
+        ranges = pipeline.csv_byte_ranges(self.csv_path, data_start, 7)
+        self.assertGreater(len(ranges), 1)
+        ctx = pipeline.build_parse_context({h: i for i, h in enumerate(headers)}, [(self.suc.id, self.suc.nombre)])
+        codes = []
+        for start, end in ranges:
+            codes.extend(r[0] for r in pipeline.parse_csv_chunk((self.csv_path, start, end, ctx)))
+        self.assertEqual(len(codes), 301)
+        self.assertEqual(codes[0], 'C0')
+        self.assertEqual(codes[-1], 'C5')
+
+    def test_quoted_newlines_fall_back_to_sequential(self):
+        from products import import_pipeline as pipeline
+        lines = ["NOMBRE,CODIGO 1,PRECIO DE COMPRA,PRECIO DE VENTA,DESCRIPCION"]
+        for i in range(200):
+            lines.append(f'Prod {i},Q{i},100,200,"Línea 1\nLínea ""2"""')
+        path = os.path.join(self.tmpdir, 'multilinea.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as fh:
+            fh.write("\n".join(lines) + "\n")
+        _, data_start = pipeline.read_csv_header(path)
+        self.assertIsNone(pipeline.csv_byte_ranges(path, data_start, 7))
+        out = io.StringIO()
+        call_command('import_products', path, batch=50, workers=2, stdout=out)
+        self.assertIn('sequentially', out.getvalue())
+        self.assertEqual(Product.objects.count(), 200)
+        self.assertEqual(Product.objects.get(producto_id='Q7').descripcion, 'Línea 1\nLínea "2"')
+
+    def test_parallel_xlsx_matches_sequential(self):
+        from unittest import mock
+        from openpyxl import Workbook
+        wb = Workbook()
+        sh = wb.active
+        sh.append(["NOMBRE", "CODIGO 1", "PRECIO DE COMPRA", "PRECIO DE VENTA", "STOCK@Central"])
+        for i in range(300):
+            sh.append([f"Prod {i}", f"X{i}", 100 + i, 200 + i, i % 7])
+        sh.append(["Prod dup", "X5", 1, 2, None])
+        path = os.path.join(self.tmpdir, 'productos.xlsx')
+        wb.save(path)
+        call_command('import_products', path, batch=50, stdout=io.StringIO())
+        sequential = self._snapshot()
+        Product.objects.all().delete()
+        with mock.patch('products.import_pipeline.XLSX_ROWS_PER_TASK', 40):
+            call_command('import_products', path, batch=50, workers=2, stdout=io.StringIO())
+        self.assertEqual(self._snapshot(), sequential)
+        self.assertEqual(Product.objects.get(producto_id='X5').nombre, 'Prod 5')
+
+    def test_resume_continues_from_checkpoint(self):
+        from unittest import mock
+        from django.core.management.base import CommandError
+        from products.management.commands.import_products import Command
+
+        original_flush = Command._flush
+        calls = {'n': 0}
+
+        def failing_flush(cmd, *args, **kwargs):
+            calls['n'] += 1
+            if calls['n'] == 3:
+                raise RuntimeError('simulated crash')
+            return original_flush(cmd, *args, **kwargs)
+
+        with mock.patch.object(Command, '_flush', failing_flush):
+            with self.assertRaises(CommandError):
+                call_command('import_products', self.csv_path, batch=50, stdout=io.StringIO())
+        run = ImportacionProductos.objects.get()
+        self.assertEqual(run.estado, ImportacionProductos.ESTADO_FALLIDA)
+        self.assertEqual(run.registros_confirmados, 100)
+        self.assertEqual(Product.objects.count(), 100)
+
+        out = io.StringIO()
+        call_command('import_products', self.csv_path, batch=50, resume=True, stdout=out)
+        self.assertIn('Resuming run', out.getvalue())
+        run.refresh_from_db()
+        self.assertEqual(run.estado, ImportacionProductos.ESTADO_COMPLETADA)
+        self.assertEqual(run.registros_confirmados, 301)
+        self.assertEqual(run.creados, 300)
+        self.assertEqual(Product.objects.count(), 300)
+        # El duplicado final sigue sin pisar la primera aparición
+        self.assertEqual(Product.objects.get(producto_id='C5').nombre, 'Prod 5')
+
+    def test_skip_if_imported_is_noop_for_same_fingerprint(self):
+        call_command('import_products', self.csv_path, stdout=io.StringIO())
+        Product.objects.filter(producto_id='C1').update(nombre='Editado a mano')
+        out = io.StringIO()
+        call_command('import_products', self.csv_path, skip_if_imported=True, stdout=out)
+        self.assertIn('Nothing to do', out.getvalue())
+        self.assertEqual(Product.objects.get(producto_id='C1').nombre, 'Editado a mano')
+        self.assertEqual(ImportacionProductos.objects.count(), 1)
+
+
+class _SheetHandler(BaseHTTPRequestHandler):
+    """Imita la exportación CSV de Google Sheets (con o sin ETag)."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        body = server.body
+        etag = f'"{hash(body) & 0xffffffff:x}"'
+        if server.send_etag and self.headers.get('If-None-Match') == etag:
+            server.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body)))
+        if server.send_etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RemoteProductSourceTests(TestCase):
+    def setUp(self):
+        create_sucursal("Central")
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _SheetHandler)
+        self.server.requests = 0
+        self.server.not_modified = 0
+        self.server.send_etag = True
+        self._set_rows(20)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/export?format=csv"
+        # Registered as sync_products does; import_products only reuses it
+        FuenteProductos.objects.create(url=self.url)
+
+    def _set_rows(self, n):
+        lines = ["NOMBRE,CODIGO 1,PRECIO DE COMPRA,PRECIO DE VENTA"]
+        lines += [f"Prod {i},R{i},100,200" for i in range(n)]
+        self.server.body = ("\n".join(lines) + "\n").encode('utf-8')
+
+    def test_unchanged_source_is_answered_with_304(self):
+        call_command('import_products', self.url, stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 20)
+        fuente = FuenteProductos.objects.get(url=self.url)
+        self.assertTrue(fuente.etag)
+        self.assertTrue(fuente.huella)
+
+        out = io.StringIO()
+        call_command('import_products', self.url, stdout=out)
+        self.assertIn('not modified', out.getvalue())
+        self.assertEqual(self.server.not_modified, 1)
+        self.assertEqual(ImportacionProductos.objects.count(), 1)
+
+    def test_same_content_without_validators_short_circuits_on_hash(self):
+        self.server.send_etag = False
+        call_command('import_products', self.url, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('import_products', self.url, stdout=out)
+        self.assertIn('content unchanged', out.getvalue())
+        self.assertEqual(ImportacionProductos.objects.count(), 1)
+
+    def test_changed_source_is_imported(self):
+        call_command('import_products', self.url, stdout=io.StringIO())
+        self._set_rows(25)
+        call_command('import_products', self.url, stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 25)
+        self.assertEqual(ImportacionProductos.objects.count(), 2)
+
+    def test_one_off_import_does_not_register_a_source(self):
+        FuenteProductos.objects.all().delete()
+        call_command('import_products', self.url, dry_run=True, stdout=io.StringIO())
+        call_command('import_products', self.url, stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertFalse(FuenteProductos.objects.exists())
+
+    def test_sync_products_once_polls_registered_sources(self):
+        FuenteProductos.objects.all().delete()
+        call_command('sync_products', self.url, once=True, stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 20)
+        call_command('sync_products', once=True, stdout=io.StringIO())
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(self.server.not_modified, 1)
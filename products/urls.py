@@ -12,6 +12,7 @@ urlpatterns = [
     path('delete-all/', views.delete_all_products, name='delete_all_products'),
     path('bulk-delete/', views.bulk_delete_products, name='bulk_delete_products'),
     path('exportar/excel/', views.export_products_to_excel, name='export_products_to_excel'),
+    path('exportar/csv/', views.export_products_to_csv, name='export_products_to_csv'),
     path('bulk-assign/', views.bulk_assign_products, name='bulk_assign_products'),
     path('transfer/', views.transfer_stock, name='transfer_stock'),
     path('transfer/history/', views.transfer_history, name='transfer_history'),
@@ -4,8 +4,9 @@ from django.db.models import Q
 from .models import Product, StockSucursal, TransferenciaStock, AjusteStock
 from .utils import build_product_search_q
 from .forms import ProductForm
+from reports import exportar, paginacion, versiones
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
 from django.http import JsonResponse
 from openpyxl import Workbook, load_workbook
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
@@ -27,7 +28,7 @@ def product_management(request):
     order = request.GET.get('order', 'asc')
 
     # Filtrar productos
-    products = Product.objects.filter(build_product_search_q(query))
+    products = Product.objects.con_margenes().filter(build_product_search_q(query))
 
     # Lista de campos permitidos para ordenar
     allowed_sort_fields = {
@@ -40,6 +41,10 @@ def product_management(request):
         'precio_venta': 'precio_venta',
         'cantidad': 'cantidad',
         'stock': 'stock',
+        # Calculados en SQL (Product.objects.con_margenes)
+        'precio_venta_sin_iva': 'precio_venta_neto',
+        'ganancia_neta': 'ganancia_unitaria',
+        'porcentaje_ganancia': 'margen_porcentaje',
     }
 
     # Aplicar ordenamiento
@@ -127,6 +132,8 @@ def delete_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     if request.method == 'POST':
         product.delete()
+        # El borrado arrastra sus líneas de venta (CASCADE): cambian ventas y catálogo
+        versiones.invalidar()
         messages.success(request, 'Producto eliminado exitosamente.')
         return redirect('product_management')
     return render(request, 'products/delete_product.html', {'product': product})
@@ -136,7 +143,6 @@ def download_template(request):
     Vista para descargar una plantilla Excel con los encabezados de los productos, 
     incluyendo los nuevos campos calculados.
     """
-    from openpyxl import Workbook
     response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     response['Content-Disposition'] = 'attachment; filename="plantilla_productos.xlsx"'
 
@@ -296,6 +302,7 @@ def upload_products(request):
                                 'nombre','descripcion','codigo_alternativo','codigo_barras','fecha_ingreso_producto','precio_compra','precio_venta','permitir_venta_sin_stock'
                             ], batch_size=500)
                             updated_count = len(to_update)
+                            versiones.invalidar(versiones.CATALOGO)
                 except Exception as e:
                     messages.error(request, f'Error de transacción: {e}')
                     return redirect('upload_products')
@@ -347,6 +354,7 @@ def delete_all_products(request):
     if request.method == 'POST':
         try:
             count, _ = Product.objects.all().delete()
+            versiones.invalidar()
             messages.success(request, f'¡Se eliminaron {count} productos exitosamente!')
             return redirect('product_management')
         except Exception as e:
@@ -374,6 +382,7 @@ def bulk_delete_products(request):
             qs = Product.objects.filter(id__in=ids)
             count = qs.count()
             qs.delete()
+            versiones.invalidar()
             try:
                 messages.success(request, f'Se eliminaron {count} productos correctamente.')
             except Exception:
@@ -384,31 +393,30 @@ def bulk_delete_products(request):
             return JsonResponse({'success': False, 'error': str(e)}, status=500)
     return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
 
-def export_products_to_excel(request):
-    """
-    Vista para exportar todos los productos a un archivo Excel.
-    Se utiliza el formateo definido en el modelo, incluyendo los nuevos cálculos.
-    """
-    from openpyxl import Workbook
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="export_productos.xlsx"'
-
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = 'Productos'
+# Columnas comunes a las exportaciones de productos (Excel y CSV)
+EXPORT_HEADERS = [
+    'NOMBRE', 'DESCRIPCION', 'CODIGO 1', 'CODIGO DE BARRAS',
+    'FECHA DE INGRESO', 'PRECIO DE COMPRA', 'PRECIO DE VENTA',
+    'PRECIO COMPRA SIN IVA', 'PRECIO VENTA SIN IVA',
+    'GANANCIA NETA', 'PORCENTAJE DE GANANCIA'
+]
+EXPORT_CHUNK_SIZE = 2000
 
-    # Encabezados actualizados
-    headers = [
-        'NOMBRE', 'DESCRIPCION', 'CODIGO 1', 'CODIGO DE BARRAS',
-        'FECHA DE INGRESO', 'PRECIO DE COMPRA', 'PRECIO DE VENTA',
-        'PRECIO COMPRA SIN IVA', 'PRECIO VENTA SIN IVA',
-        'GANANCIA NETA', 'PORCENTAJE DE GANANCIA'
-    ]
-    sheet.append(headers)
 
-    products = Product.objects.all().order_by('nombre')
+def _export_products_rows():
+    """
+    Genera las filas de exportación recorriendo el catálogo con un cursor
+    (``.iterator``): la memoria no crece con la cantidad de productos.
+    """
+    products = (
+        Product.objects.order_by('nombre', 'id')
+        .only('nombre', 'descripcion', 'producto_id', 'codigo_barras',
+              'fecha_ingreso_producto', 'precio_compra', 'precio_venta')
+        .con_margenes()
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
     for product in products:
-        row_data = [
+        yield [
             product.nombre,
             product.descripcion,
             product.producto_id,
@@ -419,13 +427,51 @@ def export_products_to_excel(request):
             product.formatted_precio_compra_sin_iva,
             product.formatted_precio_venta_sin_iva,
             product.formatted_ganancia_neta,
-            product.porcentaje_ganancia  # O, si se tiene formateado: product.formatted_porcentaje_ganancia
+            product.porcentaje_ganancia
         ]
+
+
+def export_products_to_excel(request):
+    """
+    Vista para exportar todos los productos a un archivo Excel.
+    Se utiliza el formateo definido en el modelo, incluyendo los nuevos cálculos.
+
+    El libro se escribe en modo ``write_only`` (filas volcadas a disco a medida
+    que se agregan) sobre un archivo temporal, que luego se envía por partes con
+    FileResponse y se elimina al cerrar la respuesta.
+    """
+    import tempfile
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Productos')
+    sheet.append(EXPORT_HEADERS)
+    for row_data in _export_products_rows():
         sheet.append(row_data)
 
-    workbook.save(response)
+    tmp = tempfile.TemporaryFile()
+    try:
+        workbook.save(tmp)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    response = FileResponse(
+        tmp,
+        as_attachment=True,
+        filename='export_productos.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
     return response
 
+
+def export_products_to_csv(request):
+    """
+    Exporta todos los productos a CSV como respuesta en streaming: la primera
+    fila se envía de inmediato y la memoria es constante sin importar el
+    tamaño del catálogo.
+    """
+    return exportar.respuesta_csv('export_productos.csv', EXPORT_HEADERS, _export_products_rows())
+
 @property
 def precio_compra_sin_iva(self):
     if not self.precio_compra:
@@ -597,12 +643,8 @@ def transfer_history(request):
         qs = qs.filter(producto_id=prod)
     if suc:
         qs = qs.filter(Q(origen_id=suc) | Q(destino_id=suc))
-    # Ordenar descendente por fecha (más recientes primero)
-    qs = qs.order_by('-fecha')
-    # Construir paginador
-    paginator = Paginator(qs, per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor, más recientes primero (costo constante en cualquier página)
+    page_obj = paginacion.paginar(request, qs, 'fecha', per_page, contar=True)
     return render(request, 'products/transfer_history.html', {
         'page_obj': page_obj,
         'per_page': per_page,
@@ -656,10 +698,9 @@ def adjust_history(request):
             Q(producto__producto_id__icontains=q_text) |
             Q(producto__codigo_alternativo__icontains=q_text)
         )
-    # Ordenar por fecha descendente para mostrar primero los ajustes más recientes
-    qs = qs.order_by('-fecha')
+    # Paginación por cursor, ajustes más recientes primero
     return render(request, 'products/adjust_history.html', {
-        'ajustes': qs[:200],
+        'ajustes': paginacion.paginar(request, qs, 'fecha', 50),
         'productos': productos,
         'sucursales': sucursales,
         'producto_sel': prod,
@@ -1,13 +1,14 @@
 from decimal import Decimal, ROUND_HALF_UP
 import datetime
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum, F, Count
-from django.db.models import DateField
-from django.db.models.functions import Cast, ExtractHour, ExtractWeekDay
-from django.core.cache import cache
-from cashier.models import Venta, VentaDetalle
 import hashlib
 import calendar
+import time
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
 
 def _safe_cache_key(prefix: str, *parts) -> str:
     """Genera una clave de caché segura para backends como memcached.
@@ -17,282 +18,378 @@ def _safe_cache_key(prefix: str, *parts) -> str:
     digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()  # corto y seguro
     return f"{prefix}:{digest}"
 from sucursales.models import Sucursal
+from . import cache_reportes, paralelo, rollup, vectorizado, versiones
 
-# Nota: Mantener lógica alineada con reports/views.py advanced_reports.
 
-def compute_analytics(fecha_inicio, fecha_fin, cajero_filter='todos', sucursal_filter='todos', limit_rentabilidad=50):
-    """Computa todos los datasets y KPIs usados en advanced_reports.
-    Retorna diccionario con claves idénticas a las usadas en el contexto.
+def _pesos(cents):
+    return Decimal(cents or 0) * Decimal('0.01')
+
+
+def _sin_iva(monto):
+    return (monto / Decimal('1.19')).quantize(Decimal('0.01')) if monto else Decimal('0.00')
+
+
+def _meses_wave(ref):
+    """Primer y último día de los 6 meses que terminan en el mes de ``ref``."""
+    meses = []
+    for m in range(5, -1, -1):
+        year = ref.year
+        month = ref.month - m
+        while month <= 0:
+            month += 12
+            year -= 1
+        meses.append((datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])))
+    return meses
+
+
+def _clave_rango(fecha_inicio, fecha_fin, version_ventas):
+    """Componentes de la clave de caché para el rango.
+
+    Un fin posterior al último cambio de ventas se normaliza a "abierto": las
+    ventas se registran con la hora de su creación, así que ninguna cae entre
+    ese fin y cualquier otro posterior mientras la versión no cambie (p. ej.
+    ``fecha_fin=timezone.now()`` en pedidos sucesivos). El largo en días se
+    mantiene porque define el período anterior comparativo.
+    """
+    fin = 'abierto' if fecha_fin >= version_ventas.desde else fecha_fin.isoformat()
+    return fecha_inicio.isoformat(), fin, (fecha_fin - fecha_inicio).days
+
+
+# Secciones del dashboard: nombre → secciones de ``rollup.hechos`` que necesita.
+# ``kpis`` y ``comparativo`` sólo leen la tabla de ventas (o sus resúmenes);
+# las líneas (``productos``) se leen sólo para rentabilidad y top de productos.
+SECCIONES = {
+    'kpis': ('ventas',),
+    'comparativo': ('ventas',),
+    'diaria': ('ventas',),
+    'sucursales': ('ventas',),
+    'horaria': ('ventas',),
+    'wave': ('ventas',),
+    'rentabilidad': ('productos',),
+    'ranking': ('cajeros',),
+    'top_productos': ('productos',),
+}
+
+
+# Parámetros de las vistas y exportaciones del dashboard avanzado (ver ``consulta``)
+Consulta = namedtuple('Consulta', 'fecha_inicio fecha_fin cajero sucursal top fecha_inicio_str fecha_fin_str')
+
+
+def _fecha_param(valor, fin=False):
+    """``AAAA-MM-DD`` → inicio (o último segundo, con ``fin``) del día local; ``None`` si no es válida."""
+    try:
+        fecha = timezone.make_aware(datetime.datetime.strptime(valor, '%Y-%m-%d'))
+    except (TypeError, ValueError):
+        return None
+    return fecha + datetime.timedelta(days=1, seconds=-1) if fin else fecha
+
+
+def consulta(params):
+    """Rango, filtros y top pedidos en ``params`` (``request.GET``).
+
+    Sin fechas (o con fechas inválidas) el rango va desde el inicio del día
+    local de hace 30 días hasta ahora: el inicio no cambia en todo el día, así
+    que pedidos sucesivos comparten la clave de caché (ver ``_clave_rango``);
+    un ``top`` inválido vale 10. Todas las vistas del dashboard y sus
+    exportaciones leen los parámetros aquí, así calculan sobre el mismo rango.
     """
-    ventas_qs = Venta.objects.filter(fecha__gte=fecha_inicio, fecha__lte=fecha_fin)
-    # DEBUG: contar ventas en rango para diagnosticar tests intermitentes
+    fecha_inicio_str = params.get('fecha_inicio')
+    fecha_fin_str = params.get('fecha_fin')
+    ahora = timezone.now()
     try:
-        print(f"DEBUG compute_analytics ventas_count={ventas_qs.count()} rango={fecha_inicio} - {fecha_fin}")
-    except Exception:
-        pass
-    if cajero_filter and cajero_filter != 'todos':
-        try:
-            ventas_qs = ventas_qs.filter(empleado_id=int(cajero_filter))
-        except ValueError:
-            pass
-    if sucursal_filter and sucursal_filter != 'todos':
-        try:
-            ventas_qs = ventas_qs.filter(sucursal_id=int(sucursal_filter))
-        except ValueError:
-            pass
-
-    # Aggregates principales
-    agg_ventas = ventas_qs.aggregate(ingreso_total=Sum('total'), num_transacciones=Count('id'))
-    ingreso_total = agg_ventas.get('ingreso_total') or Decimal('0.00')
-    num_transacciones = agg_ventas.get('num_transacciones') or 0
-
-    agg_unidades = VentaDetalle.objects.filter(venta__in=ventas_qs).aggregate(total_unidades=Sum('cantidad'))
-    total_unidades = agg_unidades.get('total_unidades') or 0
-
-    agg_cmv = VentaDetalle.objects.filter(venta__in=ventas_qs).aggregate(
-        cmv=Sum(F('cantidad') * F('producto__precio_compra'))
+        top = int(params.get('top', 10) or 10)
+    except ValueError:
+        top = 10
+    return Consulta(
+        fecha_inicio=_fecha_param(fecha_inicio_str) or rollup.inicio_dia(timezone.localdate() - datetime.timedelta(days=30)),
+        fecha_fin=_fecha_param(fecha_fin_str, fin=True) or ahora,
+        cajero=params.get('cajero', 'todos'),
+        sucursal=params.get('sucursal', 'todos'),
+        top=top,
+        fecha_inicio_str=fecha_inicio_str,
+        fecha_fin_str=fecha_fin_str,
     )
-    cmv_val = agg_cmv.get('cmv') or 0
-    cmv = Decimal(str(cmv_val))
-
-    ganancia_bruta = ingreso_total - cmv
-    ticket_promedio = (ingreso_total / num_transacciones) if num_transacciones > 0 else Decimal('0.00')
-    unidades_promedio = (total_unidades / num_transacciones) if num_transacciones > 0 else 0
-
-    best_selling = VentaDetalle.objects.filter(venta__in=ventas_qs) \
-        .values('producto__nombre') \
-        .annotate(total_cantidad=Sum('cantidad')) \
-        .order_by('-total_cantidad') \
-        .first()
-    best_selling_product = best_selling['producto__nombre'] if best_selling else "N/A"
-    best_selling_quantity = best_selling['total_cantidad'] if best_selling else 0
-
-    sales_by_payment_type = ventas_qs.values('forma_pago').annotate(total_monto=Sum('total'))
-    sales_by_payment = []
-    sales_by_payment_chart = []
-    for item in sales_by_payment_type:
-        monto = item['total_monto'] or 0
-        sales_by_payment.append({'forma_pago': item['forma_pago'], 'total_monto_raw': monto})
-        sales_by_payment_chart.append({'forma_pago': item['forma_pago'], 'total_monto': float(monto)})
 
+
+def compute_analytics(fecha_inicio, fecha_fin, cajero_filter='todos', sucursal_filter='todos', limit_rentabilidad=50, use_cache=True, top=10, secciones=SECCIONES):
+    """Computa los datasets y KPIs usados en advanced_reports.
+    Retorna diccionario con claves idénticas a las usadas en el contexto.
+
+    Es la unión de las ``secciones`` pedidas (todas por defecto, ver
+    ``compute_sections``). El dashboard HTML, el endpoint JSON, las
+    exportaciones CSV/PDF/DOCX y el alias de ``cashier`` pasan por aquí, así
+    que muestran los mismos números y comparten las entradas de caché.
+    """
+    data = {}
+    for valores in compute_sections(secciones, fecha_inicio, fecha_fin, cajero_filter, sucursal_filter,
+                                    limit_rentabilidad, top, use_cache).values():
+        data.update(valores)
+    return data
+
+
+def comparativo_personalizado(kpis, comp_inicio_str, comp_fin_str, cajero_filter='todos', sucursal_filter='todos'):
+    """Claves del comparativo contra un rango elegido por el usuario.
+
+    ``kpis`` son los valores del rango actual (sección ``kpis``). A diferencia
+    del periodo anterior automático, el rango personalizado respeta los
+    filtros de cajero y sucursal. Retorna ``None`` si el rango no es válido.
+    """
+    comp_inicio = _fecha_param(comp_inicio_str)
+    comp_fin = _fecha_param(comp_fin_str, fin=True)
+    if comp_inicio is None or comp_fin is None or comp_inicio > comp_fin:
+        return None
+    return _variaciones(kpis, comp_inicio, comp_fin, *rollup.totales(comp_inicio, comp_fin, cajero_filter, sucursal_filter, consolidar=False))
+
+
+def compute_sections(nombres, fecha_inicio, fecha_fin, cajero_filter='todos', sucursal_filter='todos',
+                     limit_rentabilidad=50, top=10, use_cache=True, tiempos=None):
+    """Calcula las secciones ``nombres`` del dashboard: ``{nombre: {clave: valor}}``.
+
+    Cada sección se guarda en la caché compartida (``settings.CACHES``) bajo su
+    propia clave con el rango, los filtros, el día local y sus parámetros
+    propios (``limit_rentabilidad``, ``top``), válida mientras no cambien las
+    versiones de ventas y catálogo (ver ``reports.versiones``). Los aciertos se
+    leen en una sola consulta; las secciones que faltan se calculan juntas en
+    una pasada sobre los hechos, con el candado por clave de
+    ``reports.cache_reportes``. ``use_cache=False`` fuerza el cálculo
+    (benchmarks, pruebas). Si se entrega ``tiempos`` (dict) se llena con los
+    milisegundos que tomó cada sección.
+    """
+    nombres = [n for n in SECCIONES if n in set(nombres)]
+    parametros = {'rentabilidad': limit_rentabilidad, 'top_productos': top}
+    calculadas = {}
+
+    def calcular(nombre):
+        if nombre not in calculadas:
+            # Todas las que aún faltan, en una pasada (los hechos se leen una vez)
+            calculadas.update(_calcular_secciones(
+                [n for n in nombres if n not in resultado], fecha_inicio, fecha_fin,
+                cajero_filter, sucursal_filter, limit_rentabilidad, top,
+            ))
+        return calculadas[nombre]
+
+    resultado = {}
+    if not use_cache or not getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 3600):
+        for nombre in nombres:
+            t0 = time.perf_counter()
+            resultado[nombre] = calcular(nombre)
+            _medir(tiempos, nombre, t0)
+        return resultado
+
+    actuales = versiones.actuales()
+    rango = _clave_rango(fecha_inicio, fecha_fin, actuales[0])
+    claves = {
+        nombre: _safe_cache_key(
+            f'analytics:{nombre}', *rango, cajero_filter, sucursal_filter, parametros.get(nombre), timezone.localdate(),
+        )
+        for nombre in nombres
+    }
+    t0 = time.perf_counter()
+    resultado.update(cache_reportes.vigentes(claves, actuales))
+    for nombre in resultado:
+        _medir(tiempos, nombre, t0)
+    for nombre in nombres:
+        if nombre not in resultado:
+            t0 = time.perf_counter()
+            resultado[nombre] = cache_reportes.obtener(claves[nombre], lambda nombre=nombre: calcular(nombre), actuales)
+            _medir(tiempos, nombre, t0)
+    return resultado
+
+
+def _medir(tiempos, nombre, t0):
+    if tiempos is not None:
+        tiempos[nombre] = (time.perf_counter() - t0) * 1000
+
+
+def _calcular_secciones(nombres, fecha_inicio, fecha_fin, cajero_filter, sucursal_filter, limit_rentabilidad, top):
+    """Motor de una pasada: los hechos del rango se leen ya agrupados (desde los
+    resúmenes diarios para días consolidados y desde las ventas para el resto,
+    ver ``reports.rollup.hechos``), sólo los que piden las secciones, y todas
+    se derivan de ellos en memoria. El número de consultas no depende del
+    volumen de ventas.
+
+    Con ``reports.paralelo`` activo, cada lectura (una por sección de hechos,
+    periodo anterior y sucursales) corre en su propio hilo y conexión; la
+    derivación en memoria es la misma.
+    """
+    secciones = tuple(sorted({s for nombre in nombres for s in SECCIONES[nombre]}))
+    prev_inicio, prev_fin = _periodo_anterior(fecha_inicio, fecha_fin)
+    lecturas = {}
+    if paralelo.activo():
+        # La partición (y la consolidación al vuelo) se hace una vez, antes de repartir
+        particion = rollup.particionar(fecha_inicio, fecha_fin)
+        tareas = {
+            s: partial(rollup.hechos, fecha_inicio, fecha_fin, cajero_filter, sucursal_filter, secciones=(s,), particion=particion)
+            for s in secciones
+        }
+        if 'comparativo' in nombres:
+            tareas['previo'] = partial(rollup.totales, prev_inicio, prev_fin, consolidar=False)
+        if 'sucursales' in nombres:
+            tareas['sucursales'] = _sucursales
+        lecturas = paralelo.ejecutar(tareas)
+        hechos = {s: lecturas[s][s] for s in secciones}
+    else:
+        hechos = rollup.hechos(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter, secciones=secciones)
+    ventas = _derivar_ventas(hechos['ventas']) if 'ventas' in secciones else None
+    productos = _derivar_productos(hechos['productos']) if 'productos' in secciones else None
+    resultado = {}
+    for nombre in nombres:
+        if nombre == 'kpis':
+            resultado[nombre] = _kpis(ventas)
+        elif nombre == 'comparativo':
+            previo = lecturas['previo'] if 'previo' in lecturas else rollup.totales(prev_inicio, prev_fin, consolidar=False)
+            resultado[nombre] = _comparativo(ventas, prev_inicio, prev_fin, previo)
+        elif nombre == 'diaria':
+            resultado[nombre] = {'daily_chart': _serie_diaria(ventas, fecha_inicio, fecha_fin)}
+        elif nombre == 'sucursales':
+            sucursales = lecturas['sucursales'] if 'sucursales' in lecturas else _sucursales()
+            resultado[nombre] = {'branch_comparison': _comparacion_sucursales(ventas, sucursales)}
+        elif nombre == 'horaria':
+            resultado[nombre] = {'hourly_distribution': ventas['hourly_distribution'], 'heatmap_matrix': ventas['heatmap_matrix']}
+        elif nombre == 'wave':
+            resultado[nombre] = _wave(ventas)
+        elif nombre == 'rentabilidad':
+            resultado[nombre] = {'rentabilidad_productos': _rentabilidad(productos)[:limit_rentabilidad]}
+        elif nombre == 'ranking':
+            resultado[nombre] = {'ranking_cajeros': _ranking(hechos['cajeros'])}
+        elif nombre == 'top_productos':
+            resultado[nombre] = _top_productos(productos, top)
+    return resultado
+
+
+def _periodo_anterior(fecha_inicio, fecha_fin):
+    """Periodo de igual largo que termina el día antes de ``fecha_inicio``."""
+    rango_dias = (fecha_fin - fecha_inicio).days + 1
+    prev_fin = fecha_inicio - datetime.timedelta(days=1)
+    return prev_fin - datetime.timedelta(days=rango_dias - 1), prev_fin
+
+
+def _sucursales():
+    return list(Sucursal.objects.values_list('id', 'nombre'))
+
+
+def _derivar_ventas(filas):
+    """Agregados de los hechos de ventas (vectorizados sobre centavos enteros)."""
+    n = vectorizado.columna(filas, 'ventas')
+    ingreso_c = vectorizado.columna_centavos(filas, 'ingreso')
+    cmv_fila = vectorizado.columna(filas, 'cmv_c')
+    hora = vectorizado.columna(filas, 'hora')
+    dia, dias = vectorizado.codificar([row['dia'] for row in filas])
+    suc, sucursales = vectorizado.codificar([row['sucursal_id'] for row in filas])
+    forma, formas = vectorizado.codificar([row['forma_pago'] for row in filas])
+    semana = np.array([d.weekday() for d in dias], dtype=np.int64)[dia] if filas else dia
+
+    [pagos_c] = vectorizado.sumar_por(forma, len(formas), ingreso_c)
+    ingreso_dia_c, cmv_dia_c = vectorizado.sumar_por(dia, len(dias), ingreso_c, cmv_fila)
+    ingreso_suc_c, cmv_suc_c = vectorizado.sumar_por(suc, len(sucursales), ingreso_c, cmv_fila)
+    # float(centavos / 100) coincide con float(Decimal) del monto en pesos
+    ventas_hora, ingreso_hora = vectorizado.sumar_por(hora, 24, n, ingreso_c)
+    ventas_celda, ingreso_celda = vectorizado.sumar_por(semana * 24 + hora, 7 * 24, n, ingreso_c)
+    celdas = [{'ventas': v, 'ingreso': i} for v, i in zip(ventas_celda.tolist(), (ingreso_celda / 100).tolist())]
+    return {
+        'ingreso_total': _pesos(int(ingreso_c.sum())),
+        'num_transacciones': int(n.sum()),
+        'total_unidades': int(vectorizado.columna(filas, 'unidades').sum()),
+        'cmv_c': int(cmv_fila.sum()),
+        'pagos': {f: _pesos(c) for f, c in zip(formas, pagos_c.tolist())},
+        'ingreso_dia': {d: _pesos(c) for d, c in zip(dias, ingreso_dia_c.tolist())},
+        'cmv_dia': dict(zip(dias, cmv_dia_c.tolist())),
+        'ingreso_suc': {s: _pesos(c) for s, c in zip(sucursales, ingreso_suc_c.tolist())},
+        'cmv_suc': dict(zip(sucursales, cmv_suc_c.tolist())),
+        'hourly_distribution': [
+            {'hora': h, 'ventas': v, 'ingreso': i}
+            for h, (v, i) in enumerate(zip(ventas_hora.tolist(), (ingreso_hora / 100).tolist()))
+        ],
+        'heatmap_matrix': [celdas[d * 24:(d + 1) * 24] for d in range(7)],
+    }
+
+
+def _derivar_productos(productos):
+    """Unidades por nombre de producto (para el más vendido y el top)."""
+    unidades = vectorizado.columna(productos, 'unidades')
+    codigo_nombre, nombres = vectorizado.codificar([row['producto__nombre'] for row in productos])
+    [por_nombre] = vectorizado.sumar_por(codigo_nombre, len(nombres), unidades)
+    return {'filas': productos, 'unidades': unidades, 'nombres': nombres, 'por_nombre': por_nombre}
+
+
+def _indicadores(ingreso_total, cmv):
+    """Ingreso sin IVA, IVA, ganancia neta y margen a partir de ingreso y costo con IVA."""
     if ingreso_total > 0:
         ingreso_sin_iva = (ingreso_total / Decimal('1.19')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         iva_total_calc = ingreso_total - ingreso_sin_iva
     else:
         ingreso_sin_iva = Decimal('0.00')
         iva_total_calc = Decimal('0.00')
-
     cost_net = (cmv / Decimal('1.19')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if cmv else Decimal('0.00')
     ganancia_neta = ingreso_sin_iva - cost_net
     margen = ((ganancia_neta / ingreso_sin_iva) * Decimal('100')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if ingreso_sin_iva > 0 else Decimal('0.00')
+    return ingreso_sin_iva, iva_total_calc, ganancia_neta, margen
 
-    # Serie diaria (cacheada) - usar Cast(DateField) en lugar de SQL raw para mayor compatibilidad
-    # Series diaria: agregación directa (no cache para evitar inconsistencias en tests)
-    daily_series_qs = ventas_qs.annotate(day=Cast('fecha', DateField())).values('day').annotate(ingreso=Sum('total')).order_by('day')
-    daily_series = list(daily_series_qs)
-    # Rellenar la serie diaria para todos los días en el rango (incluir días con 0)
-    daily_chart = []
-    detalle_por_dia = VentaDetalle.objects.filter(venta__in=ventas_qs).annotate(day=Cast('venta__fecha', DateField())).values('day').annotate(costo=Sum(F('cantidad') * F('producto__precio_compra')))
-    detalle_map = {d['day']: d['costo'] or 0 for d in detalle_por_dia}
-    # Construir mapa de ingreso por día desde daily_series
-    ingresos_map = {row.get('day'): row.get('ingreso') or Decimal('0.00') for row in daily_series}
-    # Iterar todos los días del rango
-    current = fecha_inicio.date() if isinstance(fecha_inicio, datetime.datetime) else fecha_inicio
-    end_date = fecha_fin.date() if isinstance(fecha_fin, datetime.datetime) else fecha_fin
-    while current <= end_date:
-        ingreso_dia = ingresos_map.get(current, Decimal('0.00'))
-        costo_dia = Decimal(str(detalle_map.get(current, 0)))
-        ingreso_sin_iva_dia = (ingreso_dia / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso_dia else Decimal('0.00')
-        costo_sin_iva_dia = (costo_dia / Decimal('1.19')).quantize(Decimal('0.01')) if costo_dia else Decimal('0.00')
-        ganancia_neta_dia = ingreso_sin_iva_dia - costo_sin_iva_dia
-        day_str = current.strftime('%Y-%m-%d')
-        daily_chart.append({'day': day_str, 'ingreso': float(ingreso_dia), 'ganancia_neta': float(ganancia_neta_dia)})
-        current = current + datetime.timedelta(days=1)
-
-    # Comparación por sucursal (cacheada)
-    # Comparación por sucursal (sin cache para evitar inconsistencias durante tests)
-    ingresos_qs = ventas_qs.values('sucursal__id').annotate(ingreso=Sum('total'))
-    ingresos_map = {row['sucursal__id']: row.get('ingreso') or Decimal('0.00') for row in ingresos_qs}
-    costos_qs = VentaDetalle.objects.filter(venta__in=ventas_qs).annotate(suc_id=F('venta__sucursal_id')).values('suc_id').annotate(costo=Sum(F('cantidad') * F('producto__precio_compra')))
-    costos_map = {row['suc_id']: row.get('costo') or 0 for row in costos_qs}
-    branch_comparison = []
-    for suc in Sucursal.objects.all():
-        ingreso = ingresos_map.get(suc.id, Decimal('0.00'))
-        costo_val = costos_map.get(suc.id, 0)
-        costo = Decimal(str(costo_val))
-        ingreso_sin_iva_suc = (ingreso / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso else Decimal('0.00')
-        costo_sin_iva_suc = (costo / Decimal('1.19')).quantize(Decimal('0.01')) if costo else Decimal('0.00')
-        ganancia_neta_suc = ingreso_sin_iva_suc - costo_sin_iva_suc
-        branch_comparison.append({'sucursal': suc.nombre, 'ingreso': float(ingreso), 'ganancia_neta': float(ganancia_neta_suc)})
-
-    # Distribución horaria y heatmap (usar agregaciones en DB)
-    hourly_distribution = [{'hora': h, 'ventas': 0, 'ingreso': 0.0} for h in range(24)]
-    heatmap_matrix = [[{'ventas':0,'ingreso':0.0} for _ in range(24)] for _ in range(7)]
-    # Agregar por hora
-    hours_qs = ventas_qs.annotate(hour=ExtractHour('fecha')).values('hour').annotate(ventas=Count('id'), ingreso=Sum('total'))
-    for row in hours_qs:
-        h = int(row['hour']) if row.get('hour') is not None else None
-        if h is not None and 0 <= h < 24:
-            hourly_distribution[h]['ventas'] = int(row['ventas'])
-            hourly_distribution[h]['ingreso'] = float(row['ingreso'] or 0)
-    # Agregar por weekday+hour para heatmap
-    heat_qs = ventas_qs.annotate(weekday=ExtractWeekDay('fecha'), hour=ExtractHour('fecha')).values('weekday','hour').annotate(ventas=Count('id'), ingreso=Sum('total'))
-    for row in heat_qs:
-        # ExtractWeekDay returns 1-7 (Sunday=1). Convert to 0-6 Monday=0
-        wk = int(row['weekday'])
-        # Convert to Python weekday where Monday=0
-        py_wk = (wk - 2) % 7
-        h = int(row['hour']) if row.get('hour') is not None else None
-        if 0 <= py_wk < 7 and h is not None and 0 <= h < 24:
-            heatmap_matrix[py_wk][h]['ventas'] = int(row['ventas'])
-            heatmap_matrix[py_wk][h]['ingreso'] = float(row['ingreso'] or 0)
-
-    # Rentabilidad productos (cacheada parcialmente)
-    # Rentabilidad productos (sin cache para coherencia durante tests)
-    # Construir clave de caché única para rentabilidad (si se desea cachear)
-    cache_key_rent = _safe_cache_key('rentabilidad', getattr(fecha_inicio, 'isoformat', lambda: str(fecha_inicio))(), getattr(fecha_fin, 'isoformat', lambda: str(fecha_fin))(), cajero_filter or '', sucursal_filter or '')
-
-    # Intentar recuperar rentabilidad desde cache antes de computar (clave segura por rango y filtros)
-    rentabilidad_productos = cache.get(cache_key_rent)
-    if rentabilidad_productos is None:
-        detalles_rango = VentaDetalle.objects.filter(venta__in=ventas_qs).select_related('producto')
-        tmp = {}
-        for det in detalles_rango:
-            pid = det.producto_id
-            venta_unit = det.precio_unitario or Decimal('0.00')
-            compra_unit = det.producto.precio_compra or Decimal('0.00')
-            venta_sin_iva_unit = (venta_unit / Decimal('1.19')).quantize(Decimal('0.01')) if venta_unit else Decimal('0.00')
-            compra_sin_iva_unit = (compra_unit / Decimal('1.19')).quantize(Decimal('0.01')) if compra_unit else Decimal('0.00')
-            ganancia_neta_unit = venta_sin_iva_unit - compra_sin_iva_unit
-            entry = tmp.get(pid)
-            if not entry:
-                entry = {'producto': det.producto.nombre or det.producto.producto_id, 'cantidad': 0, 'ingreso_neto_total': Decimal('0.00'), 'costo_neto_total': Decimal('0.00'), 'ganancia_neta_total': Decimal('0.00')}
-            entry['cantidad'] += det.cantidad
-            entry['ingreso_neto_total'] += venta_sin_iva_unit * det.cantidad
-            entry['costo_neto_total'] += compra_sin_iva_unit * det.cantidad
-            entry['ganancia_neta_total'] += ganancia_neta_unit * det.cantidad
-            tmp[pid] = entry
-
-        rentabilidad_productos = []
-        for _, data in tmp.items():
-            porcentaje = Decimal('0.00')
-            if data['ingreso_neto_total'] > 0:
-                porcentaje = (data['ganancia_neta_total'] / data['ingreso_neto_total'] * Decimal('100')).quantize(Decimal('0.01'))
-            rentabilidad_productos.append({
-                'producto': data['producto'],
-                'cantidad': data['cantidad'],
-                'ingreso_neto_total': float(data['ingreso_neto_total']),
-                'costo_neto_total': float(data['costo_neto_total']),
-                'ganancia_neta_total': float(data['ganancia_neta_total']),
-                'porcentaje_ganancia': float(porcentaje)
-            })
-
-        rentabilidad_productos.sort(key=lambda x: x['ganancia_neta_total'], reverse=True)
-        # Only cache non-empty results to avoid returning stale empty lists
-        try:
-            if rentabilidad_productos:
-                cache.set(cache_key_rent, rentabilidad_productos, 300)
-        except Exception:
-            pass
-    else:
-        try:
-            print(f"DEBUG compute_analytics: cache HIT for key={cache_key_rent} len={len(rentabilidad_productos)}")
-        except Exception:
-            pass
-
-    ranking_cajeros_map = {}
-    for v in ventas_qs.select_related('empleado'):
-        uid = v.empleado_id
-        entry = ranking_cajeros_map.get(uid)
-        if not entry:
-            entry = {'usuario': v.empleado.username, 'ventas_count':0, 'ingreso_total':Decimal('0.00')}
-        entry['ventas_count'] += 1
-        entry['ingreso_total'] += v.total or Decimal('0.00')
-        ranking_cajeros_map[uid] = entry
-    ranking_cajeros = []
-    for _, data in ranking_cajeros_map.items():
-        ticket_prom = (data['ingreso_total'] / data['ventas_count']).quantize(Decimal('0.01')) if data['ventas_count'] else Decimal('0.00')
-        ranking_cajeros.append({'usuario': data['usuario'], 'ventas_count': data['ventas_count'], 'ingreso_total': float(data['ingreso_total']), 'ticket_promedio': float(ticket_prom)})
-    ranking_cajeros.sort(key=lambda x: x['ingreso_total'], reverse=True)
-
-    # Wave últimos 6 meses (ganancia neta mensual)
-    # Wave últimos 6 meses (ganancia neta mensual) — generar meses correctamente
-    months_wave = []
-    gains_wave = []
-    ref = timezone.now().date().replace(day=1)
-    for m in range(5, -1, -1):
-        # calcular year/month retrocediendo m meses
-        year = ref.year
-        month = ref.month - m
-        while month <= 0:
-            month += 12
-            year -= 1
-        first_day = datetime.date(year, month, 1)
-        last_day = datetime.date(year, month, calendar.monthrange(year, month)[1])
-        ventas_mes = ventas_qs.filter(fecha__date__gte=first_day, fecha__date__lte=last_day)
-        ingreso_mes = ventas_mes.aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-        detalles_mes = VentaDetalle.objects.filter(venta__in=ventas_mes)
-        costo_mes = Decimal('0.00')
-        for det in detalles_mes:
-            costo_mes += (det.producto.precio_compra or Decimal('0.00')) * det.cantidad
-        ingreso_sin_iva_mes = (ingreso_mes / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso_mes else Decimal('0.00')
-        costo_sin_iva_mes = (costo_mes / Decimal('1.19')).quantize(Decimal('0.01')) if costo_mes else Decimal('0.00')
-        ganancia_neta_mes = ingreso_sin_iva_mes - costo_sin_iva_mes
-        months_wave.append(first_day.strftime('%b %Y'))
-        gains_wave.append(float(ganancia_neta_mes))
-
-    # Periodo anterior comparativo
-    rango_dias = (fecha_fin - fecha_inicio).days + 1
-    prev_fin = fecha_inicio - datetime.timedelta(days=1)
-    prev_inicio = prev_fin - datetime.timedelta(days=rango_dias - 1)
-    ventas_prev = Venta.objects.filter(fecha__gte=prev_inicio, fecha__lte=prev_fin)
-    ingreso_prev = ventas_prev.aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-    detalles_prev = VentaDetalle.objects.filter(venta__in=ventas_prev)
-    cmv_prev_val = detalles_prev.aggregate(cmv_prev=Sum(F('cantidad') * F('producto__precio_compra')))['cmv_prev'] or 0
-    cmv_prev = Decimal(str(cmv_prev_val))
-    ingreso_sin_iva_prev = (ingreso_prev / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso_prev else Decimal('0.00')
-    costo_prev_net = (cmv_prev / Decimal('1.19')).quantize(Decimal('0.01')) if cmv_prev else Decimal('0.00')
-    ganancia_neta_prev = ingreso_sin_iva_prev - costo_prev_net
-    num_transacciones_prev = ventas_prev.count()
-
-    def delta_pct(current: Decimal, previous: Decimal):
-        delta = (current - previous)
-        if previous == 0:
-            pct = Decimal('100.00') if current > 0 else Decimal('0.00')
-        else:
-            pct = ((delta / previous) * Decimal('100')).quantize(Decimal('0.01'))
-        return delta, pct
-
-    ingreso_delta, ingreso_pct = delta_pct(ingreso_total, ingreso_prev)
-    ganancia_neta_delta, ganancia_neta_pct = delta_pct(ganancia_neta, ganancia_neta_prev)
-    transacciones_delta, transacciones_pct = delta_pct(Decimal(num_transacciones), Decimal(num_transacciones_prev))
-    margen_prev = ((ganancia_neta_prev / ingreso_sin_iva_prev) * Decimal('100')).quantize(Decimal('0.01')) if ingreso_sin_iva_prev > 0 else Decimal('0.00')
-    margen_delta, margen_pct = delta_pct(margen, margen_prev)
 
+def _kpis(v):
+    ingreso_total = v['ingreso_total']
+    num_transacciones = v['num_transacciones']
+    cmv = _pesos(v['cmv_c'])
+    ingreso_sin_iva, iva_total_calc, ganancia_neta, margen = _indicadores(ingreso_total, cmv)
+    sales_by_payment = []
+    sales_by_payment_chart = []
+    for forma_pago in sorted(v['pagos'], key=lambda f: f or ''):
+        monto = v['pagos'][forma_pago]
+        sales_by_payment.append({'forma_pago': forma_pago, 'total_monto_raw': monto})
+        sales_by_payment_chart.append({'forma_pago': forma_pago, 'total_monto': float(monto)})
     return {
         'ingreso_total': ingreso_total,
         'ingreso_total_sin_iva': ingreso_sin_iva,
         'iva_total_calc': iva_total_calc,
-        'ganancia_bruta': ganancia_bruta,
+        'ganancia_bruta': ingreso_total - cmv,
         'ganancia_neta': ganancia_neta,
         'margen': margen,
         'costo_total': cmv,
         'num_transacciones': num_transacciones,
-        'ticket_promedio': ticket_promedio,
-        'unidades_promedio': unidades_promedio,
-        'best_selling_product': best_selling_product,
-        'best_selling_quantity': best_selling_quantity,
+        'ticket_promedio': (ingreso_total / num_transacciones) if num_transacciones > 0 else Decimal('0.00'),
+        'unidades_promedio': (v['total_unidades'] / num_transacciones) if num_transacciones > 0 else 0,
         'sales_by_payment': sales_by_payment,
         'sales_by_payment_chart': sales_by_payment_chart,
-        'daily_chart': daily_chart,
-        'branch_comparison': branch_comparison,
-        'hourly_distribution': hourly_distribution,
-        'heatmap_matrix': heatmap_matrix,
-        'rentabilidad_productos': rentabilidad_productos[:limit_rentabilidad],
-        'ranking_cajeros': ranking_cajeros,
-        'wave_labels': months_wave,
-        'wave_gains': gains_wave,
-        # Comparativos
+    }
+
+
+def _delta_pct(current: Decimal, previous: Decimal):
+    delta = (current - previous)
+    if previous == 0:
+        pct = Decimal('100.00') if current > 0 else Decimal('0.00')
+    else:
+        pct = ((delta / previous) * Decimal('100')).quantize(Decimal('0.01'))
+    return delta, pct
+
+
+def _comparativo(v, prev_inicio, prev_fin, previo):
+    """Periodo anterior de igual largo y variaciones respecto al actual.
+
+    ``previo`` son los ``rollup.totales`` del periodo anterior.
+    """
+    _, _, ganancia_neta, margen = _indicadores(v['ingreso_total'], _pesos(v['cmv_c']))
+    actual = {
+        'ingreso_total': v['ingreso_total'],
+        'ganancia_neta': ganancia_neta,
+        'num_transacciones': v['num_transacciones'],
+        'margen': margen,
+    }
+    return _variaciones(actual, prev_inicio, prev_fin, *previo)
+
+
+def _variaciones(actual, prev_inicio, prev_fin, ingreso_prev, num_transacciones_prev, cmv_prev_c):
+    """Indicadores del periodo de comparación y variaciones del ``actual`` respecto a él."""
+    ingreso_total = actual['ingreso_total']
+    ganancia_neta = actual['ganancia_neta']
+    ingreso_sin_iva_prev = _sin_iva(ingreso_prev)
+    ganancia_neta_prev = ingreso_sin_iva_prev - _sin_iva(_pesos(cmv_prev_c))
+
+    ingreso_delta, ingreso_pct = _delta_pct(ingreso_total, ingreso_prev)
+    ganancia_neta_delta, ganancia_neta_pct = _delta_pct(ganancia_neta, ganancia_neta_prev)
+    transacciones_delta, transacciones_pct = _delta_pct(Decimal(actual['num_transacciones']), Decimal(num_transacciones_prev))
+    margen_prev = ((ganancia_neta_prev / ingreso_sin_iva_prev) * Decimal('100')).quantize(Decimal('0.01')) if ingreso_sin_iva_prev > 0 else Decimal('0.00')
+    margen_delta, margen_pct = _delta_pct(actual['margen'], margen_prev)
+    return {
         'prev_inicio': prev_inicio,
         'prev_fin': prev_fin,
         'ingreso_prev': ingreso_prev,
@@ -307,4 +404,103 @@ def compute_analytics(fecha_inicio, fecha_fin, cajero_filter='todos', sucursal_f
         'transacciones_pct': transacciones_pct,
         'margen_delta': margen_delta,
         'margen_pct': margen_pct,
+        'participacion_ingreso': (ingreso_prev / ingreso_total * Decimal('100')).quantize(Decimal('0.01')) if ingreso_total else Decimal('0.00'),
+        'participacion_ganancia': (ganancia_neta_prev / ganancia_neta * Decimal('100')).quantize(Decimal('0.01')) if ganancia_neta else Decimal('0.00'),
+    }
+
+
+def _serie_diaria(v, fecha_inicio, fecha_fin):
+    """Todos los días del rango (incluye días con 0)."""
+    daily_chart = []
+    current = timezone.localtime(fecha_inicio).date() if isinstance(fecha_inicio, datetime.datetime) else fecha_inicio
+    end_date = timezone.localtime(fecha_fin).date() if isinstance(fecha_fin, datetime.datetime) else fecha_fin
+    while current <= end_date:
+        ingreso = v['ingreso_dia'].get(current, Decimal('0.00'))
+        ganancia_neta_dia = _sin_iva(ingreso) - _sin_iva(_pesos(v['cmv_dia'].get(current, 0)))
+        daily_chart.append({'day': current.strftime('%Y-%m-%d'), 'ingreso': float(ingreso), 'ganancia_neta': float(ganancia_neta_dia)})
+        current = current + datetime.timedelta(days=1)
+    return daily_chart
+
+
+def _comparacion_sucursales(v, sucursales):
+    """Todas las ``sucursales`` (``(id, nombre)``), incluso sin ventas."""
+    branch_comparison = []
+    for suc_id, nombre in sucursales:
+        ingreso = v['ingreso_suc'].get(suc_id, Decimal('0.00'))
+        ganancia_neta_suc = _sin_iva(ingreso) - _sin_iva(_pesos(v['cmv_suc'].get(suc_id, 0)))
+        branch_comparison.append({'sucursal': nombre, 'ingreso': float(ingreso), 'ganancia_neta': float(ganancia_neta_suc)})
+    return branch_comparison
+
+
+def _wave(v):
+    """Ganancia neta mensual de los últimos 6 meses, acotada al rango consultado."""
+    months_wave = []
+    gains_wave = []
+    for first_day, last_day in _meses_wave(timezone.localdate().replace(day=1)):
+        ingreso_mes = sum((m for d, m in v['ingreso_dia'].items() if d and first_day <= d <= last_day), Decimal('0.00'))
+        costo_mes = _pesos(sum(c for d, c in v['cmv_dia'].items() if d and first_day <= d <= last_day))
+        months_wave.append(first_day.strftime('%b %Y'))
+        gains_wave.append(float(_sin_iva(ingreso_mes) - _sin_iva(costo_mes)))
+    return {'wave_labels': months_wave, 'wave_gains': gains_wave}
+
+
+def _rentabilidad(p):
+    """Rentabilidad por producto, de mayor a menor ganancia neta.
+
+    Cada línea usa su precio unitario y el costo unitario registrado al vender,
+    ambos sin IVA y redondeados a centavos antes de multiplicar por la cantidad
+    (mismas reglas que las propiedades de Product).
+    """
+    productos = p['filas']
+    ingreso_p = vectorizado.columna(productos, 'ingreso_neto_c')
+    costo_p = vectorizado.columna(productos, 'costo_neto_c')
+    ganancia_p = ingreso_p - costo_p
+    porcentaje_p = vectorizado.porcentaje_centesimas(ganancia_p, ingreso_p)
+    rentabilidad_productos = [
+        {
+            'producto': data['producto__nombre'] or data['producto__producto_id'],
+            'cantidad': cantidad,
+            'ingreso_neto_total': ingreso,
+            'costo_neto_total': costo,
+            'ganancia_neta_total': ganancia,
+            'porcentaje_ganancia': porcentaje,
+        }
+        for data, cantidad, ingreso, costo, ganancia, porcentaje in zip(
+            productos, p['unidades'].tolist(), (ingreso_p / 100).tolist(),
+            (costo_p / 100).tolist(), (ganancia_p / 100).tolist(), (porcentaje_p / 100).tolist(),
+        )
+    ]
+    rentabilidad_productos.sort(key=lambda x: x['ganancia_neta_total'], reverse=True)
+    return rentabilidad_productos
+
+
+def _ranking(cajeros):
+    ventas_cajero = vectorizado.columna(cajeros, 'ventas')
+    ingreso_cajero = vectorizado.columna_centavos(cajeros, 'ingreso')
+    # Ticket promedio redondeado a centavos mitad al par, como quantize(Decimal('0.01'))
+    ticket_cajero = np.where(ventas_cajero > 0, vectorizado.dividir_par(ingreso_cajero, np.maximum(ventas_cajero, 1)), 0)
+    ranking_cajeros = [
+        {'usuario': data['empleado__username'], 'ventas_count': ventas, 'ingreso_total': ingreso, 'ticket_promedio': ticket}
+        for data, ventas, ingreso, ticket in zip(
+            cajeros, ventas_cajero.tolist(), (ingreso_cajero / 100).tolist(), (ticket_cajero / 100).tolist(),
+        )
+    ]
+    ranking_cajeros.sort(key=lambda x: x['ingreso_total'], reverse=True)
+    return ranking_cajeros
+
+
+def _top_productos(p, top):
+    """Producto más vendido y top por unidades (como ``rollup.mas_vendidos``)."""
+    nombres, por_nombre = p['nombres'], p['por_nombre'].tolist()
+    if nombres:
+        # argmax devuelve el primer máximo, igual que max() sobre el dict
+        mejor = int(np.argmax(por_nombre))
+        best_selling_product, best_selling_quantity = nombres[mejor], por_nombre[mejor]
+    else:
+        best_selling_product, best_selling_quantity = "N/A", 0
+    orden = sorted(range(len(nombres)), key=lambda i: por_nombre[i], reverse=True)[:top]
+    return {
+        'best_selling_product': best_selling_product,
+        'best_selling_quantity': best_selling_quantity,
+        'top_selling_products': [{'producto__nombre': nombres[i], 'total_cantidad': por_nombre[i]} for i in orden],
     }
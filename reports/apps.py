@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
+
+    def ready(self):
+        import reports.signals  # Invalida resúmenes diarios al guardar ventas de días cerrados
@@ -0,0 +1,365 @@
+"""Archivo columnar de líneas de venta para análisis de varios años.
+
+Cada línea de ``VentaDetalle`` (con los datos de su ``Venta``) se guarda como
+una fila en arreglos NumPy de ancho fijo, un archivo binario por columna,
+particionados por mes local (``AAAA-MM/``). Las lecturas abren los archivos
+con ``np.memmap``, así que tras la primera consulta los datos se sirven desde
+la caché de páginas del sistema operativo y no tocan la base de datos.
+
+El archivo es sólo de agregado: ``build_sales_columnar`` lo extiende desde el último
+id archivado (``ultimo_id`` del manifiesto). Los ids se asignan al insertar
+pero se ven al confirmar, así que una línea de id bajo puede aparecer después
+de otra de id mayor; por eso el tope de cada corrida es la última línea de
+una venta con más de ``SALES_ARCHIVE_GRACE`` segundos, cuando las
+transacciones anteriores ya terminaron. Las columnas se escriben antes
+que el manifiesto y éste se reemplaza de forma atómica, de modo que un
+lector (o una corrida interrumpida) nunca ve filas a medio escribir: las
+filas válidas de cada partición son las que cuenta el manifiesto.
+
+Las líneas se leen de ``VentaDetalle`` y de ``VentaDetalleArchivada`` (ver
+``reports.historico``), que conservan el id original: mover ventas al archivo
+de la base no cambia este archivo.
+
+Las ventas editadas o borradas después de archivarse no se reflejan;
+``build_sales_columnar --rebuild`` reconstruye el archivo completo (ver
+``diferencia``).
+"""
+import datetime
+import fcntl
+import heapq
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import vectorizado
+
+FORMATO = 1
+_EPOCA = datetime.date(1970, 1, 1)
+
+# Columnas físicas: nombre → dtype (little endian, ancho fijo)
+COLUMNAS = {
+    'detalle_id': '<i8',
+    'venta_id': '<i8',
+    'dia': '<i4',          # días desde 1970-01-01 (fecha local)
+    'hora': '<i1',
+    'dia_semana': '<i1',   # 0 = lunes
+    'sucursal_id': '<i4',  # -1 = sin sucursal
+    'empleado_id': '<i4',
+    'producto_id': '<i4',
+    'forma_pago': '<i1',   # índice en ``formas`` del manifiesto
+    'cantidad': '<i4',
+    'precio_c': '<i8',     # precio unitario en centavos (con IVA)
+    'costo_c': '<i8',      # costo unitario en centavos (NULL = 0)
+}
+
+# Claves de agrupación que ``consultar`` acepta además de las columnas
+DERIVADAS = ('anio', 'mes')
+AGRUPABLES = ('dia', 'hora', 'dia_semana', 'sucursal_id', 'empleado_id', 'producto_id', 'forma_pago') + DERIVADAS
+
+
+def directorio():
+    return Path(getattr(settings, 'SALES_ARCHIVE_DIR', settings.BASE_DIR / '.archivo_ventas'))
+
+
+def _manifiesto_vacio():
+    return {'formato': FORMATO, 'ultimo_id': 0, 'formas': [], 'particiones': {}}
+
+
+def leer_manifiesto(base=None):
+    ruta = Path(base or directorio()) / 'manifiesto.json'
+    if not ruta.exists():
+        return _manifiesto_vacio()
+    with open(ruta) as f:
+        manifiesto = json.load(f)
+    if manifiesto.get('formato') != FORMATO:
+        raise ValueError(f'Formato de archivo {manifiesto.get("formato")} no soportado; reconstruir con --rebuild.')
+    return manifiesto
+
+
+def _guardar_manifiesto(base, manifiesto):
+    tmp = base / 'manifiesto.json.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifiesto, f, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, base / 'manifiesto.json')
+
+
+@contextmanager
+def bloqueo(base=None):
+    """Candado exclusivo de escritura (un solo ``build_sales_columnar`` a la vez)."""
+    base = Path(base or directorio())
+    base.mkdir(parents=True, exist_ok=True)
+    with open(base / '.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield base
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ---------------------------------------------------------------------------
+# Escritura
+# ---------------------------------------------------------------------------
+
+def _filas(desde_id, hasta_id):
+    from cashier.models import Venta
+    from products.pricing import centavos
+    from .rollup import FUENTES
+
+    consultas = [
+        (detalle.objects
+         .filter(id__gt=desde_id, id__lte=hasta_id)
+         .annotate(precio_c=centavos('precio_unitario'), costo_c=centavos('costo_unitario'))
+         .order_by('id')
+         .values_list('id', 'venta_id', 'venta__fecha_local', 'venta__hora_local', 'venta__dia_semana',
+                      'venta__sucursal_id', 'venta__empleado_id', 'producto_id', 'venta__forma_pago',
+                      'cantidad', 'precio_c', 'costo_c', 'venta__fecha'))
+        for _, detalle in FUENTES
+    ]
+    # Ambas tablas en orden de id (los ids no se repiten entre ellas)
+    for row in heapq.merge(*(qs.iterator(chunk_size=5000) for qs in consultas), key=lambda r: r[0]):
+        if row[2] is None:
+            # Ventas anteriores a backfill_fecha_local
+            locales = Venta.campos_locales(row[12])
+            row = row[:2] + (locales['fecha_local'], locales['hora_local'], locales['dia_semana']) + row[5:]
+        yield row
+
+
+def _agregar(base, manifiesto, lote):
+    """Escribe un lote de filas (tuplas de ``_filas``) en sus particiones."""
+    formas = manifiesto['formas']
+    codigo_forma = {forma: i for i, forma in enumerate(formas)}
+    for row in lote:
+        if row[8] not in codigo_forma:
+            codigo_forma[row[8]] = len(formas)
+            formas.append(row[8])
+
+    columnas = {
+        'detalle_id': np.fromiter((r[0] for r in lote), COLUMNAS['detalle_id'], len(lote)),
+        'venta_id': np.fromiter((r[1] for r in lote), COLUMNAS['venta_id'], len(lote)),
+        'dia': np.fromiter(((r[2] - _EPOCA).days for r in lote), COLUMNAS['dia'], len(lote)),
+        'hora': np.fromiter((r[3] for r in lote), COLUMNAS['hora'], len(lote)),
+        'dia_semana': np.fromiter((r[4] for r in lote), COLUMNAS['dia_semana'], len(lote)),
+        'sucursal_id': np.fromiter((-1 if r[5] is None else r[5] for r in lote), COLUMNAS['sucursal_id'], len(lote)),
+        'empleado_id': np.fromiter((r[6] for r in lote), COLUMNAS['empleado_id'], len(lote)),
+        'producto_id': np.fromiter((r[7] for r in lote), COLUMNAS['producto_id'], len(lote)),
+        'forma_pago': np.fromiter((codigo_forma[r[8]] for r in lote), COLUMNAS['forma_pago'], len(lote)),
+        'cantidad': np.fromiter((r[9] for r in lote), COLUMNAS['cantidad'], len(lote)),
+        'precio_c': np.fromiter((r[10] for r in lote), COLUMNAS['precio_c'], len(lote)),
+        'costo_c': np.fromiter((r[11] or 0 for r in lote), COLUMNAS['costo_c'], len(lote)),
+    }
+    meses = np.array([f'{r[2].year:04d}-{r[2].month:02d}' for r in lote])
+    particiones = manifiesto['particiones']
+    for mes in np.unique(meses).tolist():
+        filtro = meses == mes
+        carpeta = base / mes
+        carpeta.mkdir(exist_ok=True)
+        validas = particiones.get(mes, 0)
+        for nombre, dtype in COLUMNAS.items():
+            with open(carpeta / f'{nombre}.bin', 'ab') as f:
+                # Descarta colas de una corrida interrumpida antes del manifiesto
+                f.truncate(validas * np.dtype(dtype).itemsize)
+                f.write(columnas[nombre][filtro].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        particiones[mes] = validas + int(filtro.sum())
+    manifiesto['ultimo_id'] = int(columnas['detalle_id'][-1])
+
+
+def _extender(base, manifiesto, lote):
+    from .rollup import FUENTES
+
+    # Tope fijo al empezar y bajo las ventas recientes, cuyas transacciones (y las de ids
+    # menores aún sin confirmar) pueden seguir abiertas: esas líneas quedan para la siguiente
+    limite = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'SALES_ARCHIVE_GRACE', 300))
+    tope = max(
+        detalle.objects.filter(venta__fecha__lte=limite).order_by('-id').values_list('id', flat=True).first() or 0
+        for _, detalle in FUENTES
+    )
+    nuevas = 0
+    pendientes = []
+    for row in _filas(manifiesto['ultimo_id'], tope):
+        pendientes.append(row)
+        if len(pendientes) >= lote:
+            _agregar(base, manifiesto, pendientes)
+            _guardar_manifiesto(base, manifiesto)
+            nuevas += len(pendientes)
+            pendientes = []
+    if pendientes:
+        _agregar(base, manifiesto, pendientes)
+        _guardar_manifiesto(base, manifiesto)
+        nuevas += len(pendientes)
+    return nuevas
+
+
+def extender(base=None, lote=50000):
+    """Agrega al archivo las líneas con id mayor a ``ultimo_id``. Retorna las filas nuevas."""
+    with bloqueo(base) as base:
+        manifiesto = leer_manifiesto(base)
+        if not (base / 'manifiesto.json').exists():
+            _guardar_manifiesto(base, manifiesto)
+        return _extender(base, manifiesto, lote)
+
+
+def reconstruir(base=None, lote=50000):
+    """Borra el archivo y lo vuelve a generar completo. Retorna las filas archivadas."""
+    with bloqueo(base) as base:
+        manifiesto = _manifiesto_vacio()
+        _guardar_manifiesto(base, manifiesto)
+        for carpeta in base.iterdir():
+            if carpeta.is_dir():
+                for archivo in carpeta.glob('*.bin'):
+                    archivo.unlink()
+                carpeta.rmdir()
+        return _extender(base, manifiesto, lote)
+
+
+def diferencia(base=None):
+    """Líneas archivadas que ya no existen en la base (ventas borradas desde entonces)."""
+    from .rollup import FUENTES
+
+    manifiesto = leer_manifiesto(base)
+    archivadas = sum(manifiesto['particiones'].values())
+    return archivadas - sum(detalle.objects.filter(id__lte=manifiesto['ultimo_id']).count() for _, detalle in FUENTES)
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+def _dia(value):
+    return timezone.localtime(value).date() if isinstance(value, datetime.datetime) else value
+
+
+def _mes(dia):
+    return f'{dia.year:04d}-{dia.month:02d}'
+
+
+def _columna(base, mes, nombre, filas):
+    if not filas:
+        return np.zeros(0, dtype=COLUMNAS[nombre])
+    return np.memmap(base / mes / f'{nombre}.bin', dtype=COLUMNAS[nombre], mode='r', shape=(filas,))
+
+
+def _clave(nombre, cols):
+    if nombre == 'anio' or nombre == 'mes':
+        fechas = cols['dia'].astype('datetime64[D]')
+        anio = fechas.astype('datetime64[Y]').astype(np.int64) + 1970
+        if nombre == 'anio':
+            return anio
+        return anio * 100 + fechas.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    return cols[nombre].astype(np.int64)
+
+
+def _valor(nombre, codigo, formas):
+    if nombre == 'dia':
+        return _EPOCA + datetime.timedelta(days=codigo)
+    if nombre == 'mes':
+        return f'{codigo // 100:04d}-{codigo % 100:02d}'
+    if nombre == 'forma_pago':
+        return formas[codigo]
+    if nombre == 'sucursal_id' and codigo == -1:
+        return None
+    return codigo
+
+
+def _agrupar(claves):
+    """Código denso de grupo por fila de ``claves`` (2D) y la primera fila de cada grupo.
+
+    Combina los códigos de cada columna en un solo entero (base mixta) y
+    vuelve a densificar tras cada columna, así sólo se ordenan arreglos 1D.
+    """
+    codigos = np.zeros(len(claves), dtype=np.int64)
+    for i, columna in enumerate(claves.T):
+        valores, inversa = np.unique(columna, return_inverse=True)
+        codigos = codigos * len(valores) + inversa.reshape(-1)
+        if i:
+            _, codigos = np.unique(codigos, return_inverse=True)
+            codigos = codigos.reshape(-1)
+    _, primeras = np.unique(codigos, return_index=True)
+    return codigos, primeras
+
+
+def consultar(desde=None, hasta=None, por=(), base=None, **filtros):
+    """Agrega las líneas archivadas entre los días locales ``desde`` y ``hasta`` (inclusive).
+
+    ``por`` son claves de ``AGRUPABLES`` (``anio`` y ``mes`` derivan de la
+    fecha). ``filtros`` restringe columnas a un valor o lista de valores, p. ej.
+    ``sucursal_id=3`` o ``forma_pago=['debito', 'credito']``.
+
+    Retorna una lista ordenada por las claves, de dicts con las claves de
+    ``por`` más ``lineas``, ``ventas``, ``unidades``, ``bruto_c`` (precio con
+    IVA × cantidad), ``ingreso_neto_c`` y ``costo_neto_c`` en centavos. Los
+    netos se redondean por unidad como en ``rollup.hechos``.
+    """
+    por = tuple(por)
+    desconocidas = [c for c in por if c not in AGRUPABLES] + [c for c in filtros if c not in COLUMNAS]
+    if desconocidas:
+        raise ValueError(f'Columnas desconocidas: {", ".join(desconocidas)}')
+    desde, hasta = _dia(desde), _dia(hasta)
+    base = Path(base or directorio())
+    manifiesto = leer_manifiesto(base)
+    formas = manifiesto['formas']
+    codigo_forma = {forma: i for i, forma in enumerate(formas)}
+
+    necesarias = set(por) - set(DERIVADAS) | set(filtros) | {'venta_id', 'cantidad', 'precio_c', 'costo_c'}
+    if desde or hasta or set(por) & set(DERIVADAS):
+        necesarias.add('dia')
+    claves, ventas, unidades, bruto, neto, costo = [], [], [], [], [], []
+    for mes, filas in sorted(manifiesto['particiones'].items()):
+        if (desde and mes < _mes(desde)) or (hasta and mes > _mes(hasta)) or not filas:
+            continue
+        cols = {nombre: _columna(base, mes, nombre, filas) for nombre in necesarias}
+        mascara = np.ones(filas, dtype=bool)
+        if desde:
+            mascara &= cols['dia'] >= (desde - _EPOCA).days
+        if hasta:
+            mascara &= cols['dia'] <= (hasta - _EPOCA).days
+        for nombre, valor in filtros.items():
+            valores = valor if isinstance(valor, (list, tuple, set)) else [valor]
+            if nombre == 'forma_pago':
+                valores = [codigo_forma[v] for v in valores if v in codigo_forma]
+            elif nombre == 'sucursal_id':
+                valores = [-1 if v is None else v for v in valores]
+            mascara &= np.isin(cols[nombre], valores)
+        if not mascara.any():
+            continue
+        cols = {nombre: np.asarray(col[mascara]) for nombre, col in cols.items()}
+        cantidad = cols['cantidad'].astype(np.int64)
+        claves.append(np.stack([_clave(c, cols) for c in por], axis=1) if por else np.zeros((len(cantidad), 0), np.int64))
+        ventas.append(cols['venta_id'])
+        unidades.append(cantidad)
+        bruto.append(cantidad * cols['precio_c'])
+        neto.append(cantidad * vectorizado.neto_centavos(cols['precio_c']))
+        costo.append(cantidad * vectorizado.neto_centavos(cols['costo_c']))
+    if not claves:
+        return []
+
+    claves = np.concatenate(claves)
+    codigos, primeras = _agrupar(claves)
+    tamano = len(primeras)
+    unicas = claves[primeras]
+    n_lineas, n_unidades, n_bruto, n_neto, n_costo = vectorizado.sumar_por(
+        codigos, tamano, np.ones(len(codigos), dtype=np.int64),
+        np.concatenate(unidades), np.concatenate(bruto), np.concatenate(neto), np.concatenate(costo))
+    # Ventas distintas por grupo: pares (venta, grupo) únicos
+    _, venta = np.unique(np.concatenate(ventas), return_inverse=True)
+    pares = np.sort(venta.reshape(-1) * tamano + codigos)
+    pares = pares[np.concatenate(([True], pares[1:] != pares[:-1]))]
+    (n_ventas,) = vectorizado.sumar_por(pares % tamano, tamano, np.ones(len(pares), dtype=np.int64))
+
+    resultado = []
+    for i, fila in enumerate(unicas.tolist()):
+        row = {nombre: _valor(nombre, codigo, formas) for nombre, codigo in zip(por, fila)}
+        row.update({
+            'lineas': int(n_lineas[i]), 'ventas': int(n_ventas[i]), 'unidades': int(n_unidades[i]),
+            'bruto_c': int(n_bruto[i]), 'ingreso_neto_c': int(n_neto[i]), 'costo_neto_c': int(n_costo[i]),
+        })
+        resultado.append(row)
+    return resultado
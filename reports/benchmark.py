@@ -0,0 +1,124 @@
+"""Utilidades de benchmark para los reportes (datos sintéticos y mediciones).
+
+Sólo deben usarse contra una base de datos desechable: ``benchmark_analytics``
+crea una base de pruebas propia antes de llamar a ``seed_sales``.
+"""
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+
+def seed_catalog(n_sucursales=4, n_cajeros=12, n_productos=2000, seed=7):
+    """Crea sucursales, cajeros y productos para el benchmark. Retorna los ids."""
+    from django.contrib.auth import get_user_model
+    from products.models import Product
+    from sucursales.models import Sucursal
+
+    rnd = random.Random(seed)
+    sucursales = Sucursal.objects.bulk_create([Sucursal(nombre=f'Bench {i}') for i in range(n_sucursales)])
+    User = get_user_model()
+    cajeros = User.objects.bulk_create([User(username=f'bench_{i}', is_staff=True) for i in range(n_cajeros)])
+    productos = Product.objects.bulk_create([
+        Product(
+            producto_id=f'BENCH{i}', nombre=f'Producto {i}',
+            precio_compra=Decimal(rnd.randint(200, 40000)),
+            precio_venta=Decimal(rnd.randint(500, 80000)),
+        )
+        for i in range(n_productos)
+    ], batch_size=1000)
+    return {
+        'sucursales': [s.pk for s in sucursales],
+        'cajeros': [u.pk for u in cajeros],
+        'productos': [(p.pk, p.precio_venta, p.precio_compra) for p in productos],
+    }
+
+
+def seed_sales(n, catalog, days=90, lines_per_sale=3, batch=5000, seed=11, end=None):
+    """Inserta ``n`` ventas (con ``lines_per_sale`` líneas promedio) repartidas en ``days`` días."""
+    from cashier.models import Venta, VentaDetalle
+
+    rnd = random.Random(seed + n)
+    end = end or timezone.now()
+    span = days * 86400
+    formas = ['efectivo', 'debito', 'credito', 'transferencia']
+    done = 0
+    while done < n:
+        size = min(batch, n - done)
+        ventas = []
+        lineas = []
+        for _ in range(size):
+            fecha = end - datetime.timedelta(seconds=rnd.randint(0, span))
+            items = [rnd.choice(catalog['productos']) for _ in range(rnd.randint(1, 2 * lines_per_sale - 1))]
+            cantidades = [rnd.randint(1, 4) for _ in items]
+            total = sum((item[1] * c for item, c in zip(items, cantidades)), Decimal('0'))
+            ventas.append(Venta(
+                empleado_id=rnd.choice(catalog['cajeros']),
+                sucursal_id=rnd.choice(catalog['sucursales']),
+                fecha=fecha,
+                total=total,
+                forma_pago=rnd.choice(formas),
+                unidades=sum(cantidades),
+                costo_total=sum((item[2] * c for item, c in zip(items, cantidades)), Decimal('0')),
+                lineas=len(items),
+                **Venta.campos_locales(fecha),
+            ))
+            lineas.append(list(zip(items, cantidades)))
+        with transaction.atomic():
+            Venta.objects.bulk_create(ventas, batch_size=batch)
+            VentaDetalle.objects.bulk_create([
+                VentaDetalle(venta_id=v.pk, producto_id=pid, cantidad=c, precio_unitario=precio, costo_unitario=costo)
+                for v, items in zip(ventas, lineas)
+                for (pid, precio, costo), c in items
+            ], batch_size=batch)
+        done += size
+
+
+def seed_stock_movements(n, catalog, batch=5000, seed=13):
+    """Inserta ``n`` transferencias y ``n`` ajustes de stock entre las sucursales del catálogo."""
+    from products.models import AjusteStock, TransferenciaStock
+
+    rnd = random.Random(seed + n)
+    sucursales = catalog['sucursales']
+    done = 0
+    while done < n:
+        size = min(batch, n - done)
+        with transaction.atomic():
+            TransferenciaStock.objects.bulk_create([
+                TransferenciaStock(
+                    producto_id=rnd.choice(catalog['productos'])[0],
+                    origen_id=rnd.choice(sucursales), destino_id=rnd.choice(sucursales),
+                    cantidad=rnd.randint(1, 20),
+                )
+                for _ in range(size)
+            ], batch_size=batch)
+            AjusteStock.objects.bulk_create([
+                AjusteStock(
+                    producto_id=rnd.choice(catalog['productos'])[0],
+                    sucursal_id=rnd.choice(sucursales),
+                    cantidad_delta=rnd.randint(-10, 10),
+                )
+                for _ in range(size)
+            ], batch_size=batch)
+        done += size
+
+
+def measure(func, repeat=3):
+    """Ejecuta ``func`` ``repeat`` veces. Retorna (consultas de la primera corrida, ms mediana)."""
+    tiempos = []
+    consultas = None
+    for _ in range(max(1, repeat)):
+        # Con DEBUG=True el sembrado llena el log de consultas (acotado a 9000)
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            func()
+            tiempos.append((time.perf_counter() - t0) * 1000)
+        if consultas is None:
+            consultas = len(ctx.captured_queries)
+    return consultas, statistics.median(tiempos)
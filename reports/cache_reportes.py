@@ -0,0 +1,94 @@
+"""Caché compartida de resultados de reportes.
+
+Cada entrada guarda el resultado junto con los tokens de ``reports.versiones``
+vigentes al calcularlo; si los tokens actuales coinciden, el resultado es
+exacto. Para evitar estampidas (varios workers calculando lo mismo a la vez)
+el cálculo de una clave se protege con un candado en la misma caché:
+
+- Sólo el proceso que obtiene el candado calcula y guarda.
+- Mientras tanto, los demás reciben la entrada anterior si tiene menos de
+  ``ANALYTICS_CACHE_STALE`` segundos (stale-while-revalidate) o esperan hasta
+  ``ANALYTICS_CACHE_WAIT`` segundos a que aparezca el resultado nuevo.
+- El candado expira solo (``ANALYTICS_CACHE_LOCK_TIMEOUT``) si el proceso que
+  lo tenía muere a mitad de cálculo.
+
+La revalidación ocurre en el request que gana el candado, no en un hilo
+aparte: los workers síncronos de gunicorn no deben dejar hilos con conexiones
+abiertas a la base de datos.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import versiones
+
+_POLL = 0.05  # segundos entre consultas mientras se espera a otro proceso
+
+
+def _vigente(entrada, tokens):
+    return entrada is not None and entrada['versiones'] == tokens
+
+
+def _tokens(actuales):
+    return tuple(v.token for v in (actuales or versiones.actuales()))
+
+
+def vigentes(claves, actuales=None):
+    """Valores vigentes de varias entradas en una sola lectura.
+
+    ``claves`` es ``{nombre: clave}``; retorna ``{nombre: valor}`` sólo para
+    las entradas cuyos tokens coinciden con ``actuales``. Las demás se piden
+    con ``obtener``.
+    """
+    tokens = _tokens(actuales)
+    entradas = cache.get_many(list(claves.values()))
+    return {
+        nombre: entradas[clave]['valor']
+        for nombre, clave in claves.items()
+        if _vigente(entradas.get(clave), tokens)
+    }
+
+
+def obtener(clave, calcular, actuales=None):
+    """Resultado de ``calcular()`` cacheado bajo ``clave``.
+
+    ``actuales`` son las versiones ya leídas con ``versiones.actuales()`` (se
+    leen aquí si no se entregan). Con ``ANALYTICS_CACHE_TIMEOUT = 0`` siempre
+    calcula.
+    """
+    timeout = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 3600)
+    if not timeout:
+        return calcular()
+    tokens = _tokens(actuales)
+    entrada = cache.get(clave)
+    if _vigente(entrada, tokens):
+        return entrada['valor']
+
+    stale = getattr(settings, 'ANALYTICS_CACHE_STALE', 300)
+    anterior = entrada if entrada is not None and time.time() - entrada['calculado'] <= stale else None
+    candado = f'{clave}:candado'
+    dueno = uuid.uuid4().hex
+    limite = time.monotonic() + getattr(settings, 'ANALYTICS_CACHE_WAIT', 15)
+    while not cache.add(candado, dueno, getattr(settings, 'ANALYTICS_CACHE_LOCK_TIMEOUT', 120)):
+        # Otro proceso está calculando esta clave
+        if anterior is not None:
+            return anterior['valor']
+        if time.monotonic() >= limite:
+            return calcular()
+        time.sleep(_POLL)
+        entrada = cache.get(clave)
+        if _vigente(entrada, tokens):
+            return entrada['valor']
+    try:
+        # Quien tenía el candado pudo terminar justo antes de que lo tomáramos
+        entrada = cache.get(clave)
+        if _vigente(entrada, tokens):
+            return entrada['valor']
+        valor = calcular()
+        cache.set(clave, {'versiones': tokens, 'valor': valor, 'calculado': time.time()}, timeout)
+        return valor
+    finally:
+        if cache.get(candado) == dueno:
+            cache.delete(candado)
@@ -0,0 +1,145 @@
+"""Documentos exportados (PDF/DOCX) generados en segundo plano y guardados en disco.
+
+Cada documento se identifica por una clave de contenido: formato, rango
+(normalizado como en ``analytics``), filtros, top, día local y los tokens de
+``reports.versiones``. Mientras los datos no cambien, el mismo pedido apunta
+al mismo archivo y se sirve directo desde ``settings.REPORT_EXPORTS_DIR``; si
+cambian, la clave es otra y el documento se vuelve a generar.
+
+- ``solicitar`` retorna el estado (``listo``, ``pendiente`` o ``error``) y,
+  si el archivo no existe, encola la generación en ``reports.tareas`` (la
+  ejecuta ``run_worker``). Un candado en la caché compartida evita encolar
+  dos veces el mismo documento mientras el primero no termina.
+- El archivo se escribe en un temporal y se renombra, así que nunca se sirve
+  a medio escribir. Los documentos más antiguos que
+  ``REPORT_EXPORTS_MAX_AGE`` segundos se borran al generar uno nuevo.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import tareas, versiones
+from .analytics import _clave_rango
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+LISTO = 'listo'
+PENDIENTE = 'pendiente'
+ERROR = 'error'
+
+
+def directorio():
+    return Path(getattr(settings, 'REPORT_EXPORTS_DIR', Path(settings.BASE_DIR) / '.exportaciones'))
+
+
+def clave(formato, params):
+    """Clave de contenido del documento ``formato`` para la ``analytics.Consulta`` ``params``."""
+    actuales = versiones.actuales()
+    inicio, fin, dias = _clave_rango(params.fecha_inicio, params.fecha_fin, actuales[0])
+    partes = (
+        formato, inicio, fin, dias,
+        params.cajero, params.sucursal, params.top, timezone.localdate(), *(v.token for v in actuales),
+    )
+    return hashlib.sha1('|'.join(str(p) for p in partes).encode('utf-8')).hexdigest()
+
+
+def ruta(clave_doc, formato):
+    return directorio() / f'{clave_doc}.{formato}'
+
+
+def _candado(clave_doc):
+    return f'reports:export:{clave_doc}:candado'
+
+
+def _error(clave_doc):
+    return f'reports:export:{clave_doc}:error'
+
+
+def estado(clave_doc, formato, informar=False):
+    """Estado del documento sin lanzar nada (ver ``solicitar``).
+
+    Con ``informar`` un error se da por informado al usuario y se olvida: el
+    siguiente ``solicitar`` (el "Reintentar") vuelve a encolar la generación.
+    """
+    if ruta(clave_doc, formato).exists():
+        return LISTO
+    if cache.get(_error(clave_doc)) is not None:
+        if informar:
+            cache.delete(_error(clave_doc))
+        return ERROR
+    return PENDIENTE
+
+
+def solicitar(clave_doc, formato, generar, params):
+    """Estado del documento, encolando su generación si hace falta.
+
+    ``generar`` es la ruta de una función que recibe la ``analytics.Consulta``
+    y retorna los bytes; ``params`` son los parámetros GET del pedido, con los
+    que el worker vuelve a armar la consulta. Un error se informa una vez; el
+    siguiente pedido vuelve a intentarlo.
+    """
+    if ruta(clave_doc, formato).exists():
+        return LISTO
+    if estado(clave_doc, formato, informar=True) == ERROR:
+        return ERROR
+    if not cache.add(_candado(clave_doc), True, getattr(settings, 'REPORT_EXPORTS_TIMEOUT', 600)):
+        return PENDIENTE  # ya está encolado o generándose
+    # Los fallos se informan al usuario en vez de reintentarse en la cola
+    tareas.encolar('reports.exportaciones.generar', max_intentos=1,
+                   clave_doc=clave_doc, formato=formato, documento=generar, params=params)
+    return estado(clave_doc, formato, informar=True)  # con TASKS_RUN_INLINE ya terminó
+
+
+def generar(tarea, clave_doc, formato, documento, params):
+    """Tarea de ``reports.tareas``: arma el documento con la función ``documento`` y lo guarda."""
+    from .analytics import consulta
+    try:
+        t0 = time.perf_counter()
+        contenido = import_string(documento)(consulta(params))
+        guardar(clave_doc, formato, contenido)
+        logger.info('Exportación %s.%s generada en %.0f ms', clave_doc, formato, (time.perf_counter() - t0) * 1000)
+    except Exception:
+        logger.exception('Falló la exportación %s.%s', clave_doc, formato)
+        cache.set(_error(clave_doc), True, getattr(settings, 'REPORT_EXPORTS_TIMEOUT', 600))
+    finally:
+        cache.delete(_candado(clave_doc))
+
+
+def guardar(clave_doc, formato, contenido):
+    """Escribe el documento de forma atómica y poda los antiguos."""
+    base = directorio()
+    base.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=base, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(contenido)
+        os.replace(tmp, ruta(clave_doc, formato))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    podar()
+
+
+def podar(max_age=None):
+    """Borra los documentos (y temporales huérfanos) más antiguos que ``max_age`` segundos."""
+    max_age = getattr(settings, 'REPORT_EXPORTS_MAX_AGE', 7 * 24 * 3600) if max_age is None else max_age
+    limite = time.time() - max_age
+    for archivo in directorio().glob('*.*'):
+        try:
+            if archivo.stat().st_mtime < limite:
+                archivo.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,50 @@
+"""Exportaciones CSV en streaming.
+
+Las vistas de exportación calculan antes de responder (con la caché de
+secciones de ``analytics.compute_analytics`` suele ser un acierto) y entregan
+un iterable de filas que sólo serializa ese resultado; ``respuesta_csv`` lo
+escribe a medida que se envía y en memoria sólo vive el bloque en curso, no el
+archivo completo. Un error del cálculo responde 500 en vez de un CSV truncado
+con status 200.
+"""
+import csv
+
+from django.http import StreamingHttpResponse
+
+_BLOQUE = 64 * 1024  # caracteres por trozo enviado
+
+
+class _Eco:
+    """Pseudo-archivo para ``csv.writer``: ``write`` retorna la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _lineas(encabezado, filas):
+    writer = csv.writer(_Eco(), delimiter=';', quoting=csv.QUOTE_MINIMAL)
+    # BOM para que Excel detecte UTF-8 correctamente
+    yield '\ufeff' + writer.writerow(encabezado)
+    bloque = []
+    largo = 0
+    for fila in filas:
+        linea = writer.writerow(fila)
+        bloque.append(linea)
+        largo += len(linea)
+        if largo >= _BLOQUE:
+            yield ''.join(bloque)
+            bloque, largo = [], 0
+    if bloque:
+        yield ''.join(bloque)
+
+
+def respuesta_csv(nombre_archivo, encabezado, filas):
+    """``StreamingHttpResponse`` con el CSV (``;``, UTF-8 con BOM) de ``filas``.
+
+    ``filas`` se consume recién al enviar la respuesta, después del status y
+    el encabezado: no debe hacer trabajo que pueda fallar (consultas pesadas,
+    cálculos), sólo recorrer datos ya obtenidos o un cursor simple.
+    """
+    response = StreamingHttpResponse(_lineas(encabezado, filas), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
@@ -0,0 +1,117 @@
+"""Ventas antiguas fuera de las tablas de operación (separación caliente/fría).
+
+``Venta`` y ``VentaDetalle`` crecen sin límite y todo lo operativo (cierre de
+caja, historiales, búsquedas por caja) corre sobre ellas. ``archivar`` mueve
+las ventas de más de ``settings.SALES_HOT_DAYS`` días a ``VentaArchivada`` y
+``VentaDetalleArchivada``: las tablas calientes quedan acotadas y sus índices,
+respaldos y VACUUM no cargan con los años anteriores.
+
+- Sólo se archivan días ya consolidados en los resúmenes (``reports.rollup``),
+  que son los que leen los reportes; ``archivar`` consolida antes los días
+  pendientes. Las ventas de una caja aún abierta no se mueven.
+- Se mueve por lotes, cada uno en su transacción: las filas se copian con su
+  id original y luego se borran de la tabla caliente. Una corrida
+  interrumpida deja lotes completos y la siguiente continúa.
+- Las lecturas que deben ver todo el historial (comprobantes, totales de
+  caja, historial de ventas, consolidación y ``reports.archivo``) leen ambas
+  tablas; los campos tienen los mismos nombres. ``restaurar`` devuelve un día
+  a las tablas calientes.
+"""
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.http import Http404
+from django.utils import timezone
+
+from cashier.models import Venta, VentaArchivada, VentaDetalle, VentaDetalleArchivada
+from . import rollup
+from .models import DiaConsolidado
+
+# Los días parciales de los rangos por defecto de los reportes (últimos 30 días y
+# el período anterior para comparar) se leen de las tablas calientes
+MIN_DIAS = 62
+
+
+def _campos(modelo):
+    return [campo.attname for campo in modelo._meta.concrete_fields]
+
+
+def _copiar(origen, destino, filtro):
+    campos = [c for c in _campos(destino) if c in set(_campos(origen))]
+    destino.objects.bulk_create(destino(**row) for row in origen.objects.filter(**filtro).values(*campos))
+
+
+def archivar(dias=None, lote=500):
+    """Mueve al archivo las ventas anteriores a hoy - ``dias``. Retorna cuántas movió."""
+    dias = getattr(settings, 'SALES_HOT_DAYS', 365) if dias is None else dias
+    if dias < MIN_DIAS:
+        raise ValueError(f'Se deben conservar al menos {MIN_DIAS} días en las tablas de operación.')
+    limite = timezone.localdate() - datetime.timedelta(days=dias)
+    for dia in rollup.dias_pendientes(limite):
+        rollup.consolidar_dia(dia)
+
+    candidatas = (
+        Venta.objects.filter(fecha_local__lt=limite, fecha_local__in=DiaConsolidado.objects.values('fecha'))
+        .exclude(caja__estado='abierta')
+        .order_by('pk')
+    )
+    movidas, ultimo = 0, 0
+    while True:
+        with transaction.atomic(), rollup.borrado_masivo(limpiar_al_salir=False):
+            ids = list(candidatas.filter(pk__gt=ultimo).values_list('pk', flat=True)[:lote])
+            if not ids:
+                break
+            _copiar(Venta, VentaArchivada, {'pk__in': ids})
+            _copiar(VentaDetalle, VentaDetalleArchivada, {'venta_id__in': ids})
+            Venta.objects.filter(pk__in=ids).delete()
+        movidas += len(ids)
+        ultimo = ids[-1]
+    return movidas
+
+
+def restaurar(dia, lote=500):
+    """Devuelve a las tablas calientes las ventas archivadas del día local ``dia``."""
+    restauradas = 0
+    while True:
+        with transaction.atomic():
+            ids = list(VentaArchivada.objects.filter(fecha_local=dia).order_by('pk').values_list('pk', flat=True)[:lote])
+            if not ids:
+                break
+            _copiar(VentaArchivada, Venta, {'pk__in': ids})
+            _copiar(VentaDetalleArchivada, VentaDetalle, {'venta_id__in': ids})
+            VentaArchivada.objects.filter(pk__in=ids).delete()
+        restauradas += len(ids)
+    return restauradas
+
+
+# ---------------------------------------------------------------------------
+# Lectura unificada
+# ---------------------------------------------------------------------------
+
+def obtener_venta(pk):
+    """La venta ``pk`` desde la tabla caliente o el archivo (``Http404`` si no está en ninguna)."""
+    for modelo, _ in rollup.FUENTES:
+        venta = modelo.objects.select_related('empleado', 'sucursal').filter(pk=pk).first()
+        if venta is not None:
+            return venta
+    raise Http404('No existe la venta.')
+
+
+def totales_caja(caja):
+    """Totales de las ventas de ``caja`` (calientes y archivadas), una consulta por tabla.
+
+    Retorna un dict con ``total``, ``vuelto`` y el total de cada forma de pago
+    (``efectivo``, ``debito``, ``credito``, ``transferencia``).
+    """
+    totales = dict.fromkeys(('total', 'vuelto', 'efectivo', 'debito', 'credito', 'transferencia'), Decimal('0.00'))
+    for modelo, _ in rollup.FUENTES:
+        for row in (modelo.objects.filter(caja=caja).values('forma_pago')
+                    .annotate(t=Sum('total'), v=Sum('vuelto_entregado')).order_by()):
+            totales['total'] += row['t'] or 0
+            totales['vuelto'] += row['v'] or 0
+            if row['forma_pago'] in totales:
+                totales[row['forma_pago']] += row['t'] or 0
+    return totales
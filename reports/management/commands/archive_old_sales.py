@@ -0,0 +1,35 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports import historico
+
+
+class Command(BaseCommand):
+    help = (
+        "Move sales older than SALES_HOT_DAYS days out of Venta/VentaDetalle into the archive tables "
+        "(reports.historico). Days are consolidated into the daily rollups first; sales of open cash "
+        "registers are kept. (The columnar analytics store is build_sales_columnar.)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Days of sales kept in the operational tables (default: SALES_HOT_DAYS)")
+        parser.add_argument("--batch", type=int, default=500, help="Sales moved per transaction")
+        parser.add_argument("--restore", metavar="YYYY-MM-DD", help="Move the archived sales of this local day back instead")
+
+    def handle(self, days=None, batch=500, restore=None, **options):
+        t0 = time.perf_counter()
+        if restore:
+            try:
+                dia = datetime.date.fromisoformat(restore)
+            except ValueError:
+                raise CommandError("--restore must be YYYY-MM-DD")
+            n = historico.restaurar(dia, batch)
+            self.stdout.write(f"Restored {n} sale(s) of {dia} in {(time.perf_counter() - t0) * 1000:.0f} ms.")
+            return
+        try:
+            n = historico.archivar(days, batch)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f"Archived {n} sale(s) in {(time.perf_counter() - t0) * 1000:.0f} ms.")
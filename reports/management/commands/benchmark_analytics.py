@@ -0,0 +1,64 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.test.utils import get_runner, override_settings
+from django.conf import settings
+from django.utils import timezone
+
+from reports import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark compute_analytics (query count and latency) on synthetic data. "
+        "Runs against a throw-away test database, never the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="10000,100000,1000000",
+            help="Comma-separated cumulative sale counts to measure (default: 10k, 100k, 1M)",
+        )
+        parser.add_argument("--days", type=int, default=90, help="Days spanned by the synthetic sales")
+        parser.add_argument("--lines", type=int, default=3, help="Average lines per sale")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (median is reported)")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database between runs")
+        parser.add_argument(
+            "--raw", action="store_true",
+            help="Read every day from raw sales (no daily rollup); by default closed days are consolidated first",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Override ANALYTICS_PARALLEL_WORKERS (parallel reads, PostgreSQL only)",
+        )
+
+    def handle(self, sizes, days=90, lines=3, repeat=3, keepdb=False, raw=False, workers=None, **options):
+        from reports import paralelo, rollup
+        from reports.analytics import compute_analytics
+
+        sizes = sorted(int(s) for s in sizes.split(',') if s.strip())
+        runner = get_runner(settings)(verbosity=0, interactive=False, keepdb=keepdb)
+        old_config = runner.setup_databases()
+        try:
+            catalog = benchmark.seed_catalog()
+            fecha_fin = timezone.now()
+            fecha_inicio = fecha_fin - datetime.timedelta(days=days)
+            seeded = 0
+            if workers is None:
+                workers = settings.ANALYTICS_PARALLEL_WORKERS
+            with override_settings(ANALYTICS_PARALLEL_WORKERS=workers):
+                modo = f"parallel ({workers} workers)" if paralelo.activo() else "sequential"
+            self.stdout.write(f"Section reads: {modo}")
+            self.stdout.write(f"{'sales':>10} {'queries':>8} {'ms (median)':>12}")
+            for size in sizes:
+                if size > seeded:
+                    benchmark.seed_sales(size - seeded, catalog, days=days, lines_per_sale=lines, end=fecha_fin)
+                    seeded = size
+                    # Steady state: closed days already consolidated (as rollup_sales leaves them)
+                    for dia in [] if raw else rollup.dias_pendientes():
+                        rollup.consolidar_dia(dia)
+                with override_settings(ROLLUP_CONSOLIDAR_AL_LEER=0, ANALYTICS_PARALLEL_WORKERS=workers):
+                    queries, ms = benchmark.measure(lambda: compute_analytics(fecha_inicio, fecha_fin, use_cache=False), repeat=repeat)
+                self.stdout.write(f"{size:>10} {queries:>8} {ms:>12.1f}")
+        finally:
+            runner.teardown_databases(old_config)
@@ -0,0 +1,138 @@
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner
+
+from reports import benchmark, vectorizado
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-line Decimal loop against the NumPy engine (reports.vectorizado) for "
+        "per-product, per-hour/weekday and per-cashier aggregates, and check both give identical results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=1_000_000, help="Sale lines to aggregate")
+        parser.add_argument("--products", type=int, default=2000, help="Distinct products")
+        parser.add_argument("--seed", type=int, default=5)
+        parser.add_argument(
+            "--db", action="store_true",
+            help="Seed a throw-away test database and read the columns with values_list instead of generating them",
+        )
+
+    def handle(self, lines=1_000_000, products=2000, seed=5, db=False, **options):
+        if db:
+            runner = get_runner(settings)(verbosity=0, interactive=False)
+            old_config = runner.setup_databases()
+            try:
+                catalog = benchmark.seed_catalog(n_productos=products)
+                benchmark.seed_sales(max(1, lines // 3), catalog)
+                t0 = time.perf_counter()
+                columnas = self._columnas_db()
+                self.stdout.write(f"values_list: {len(columnas[0])} lines in {(time.perf_counter() - t0) * 1000:.0f} ms")
+            finally:
+                runner.teardown_databases(old_config)
+        else:
+            columnas = self._columnas_sinteticas(lines, products, seed)
+
+        t0 = time.perf_counter()
+        esperado = self._decimal(*columnas)
+        ms_decimal = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        obtenido = self._numpy(*columnas)
+        ms_numpy = (time.perf_counter() - t0) * 1000
+
+        if esperado != obtenido:
+            raise CommandError("NumPy and Decimal results differ.")
+        self.stdout.write(f"{'engine':>8} {'ms':>10}")
+        self.stdout.write(f"{'decimal':>8} {ms_decimal:>10.1f}")
+        self.stdout.write(f"{'numpy':>8} {ms_numpy:>10.1f}")
+        self.stdout.write(self.style.SUCCESS(f"Identical results on {len(columnas[0])} lines ({ms_decimal / ms_numpy:.1f}x)."))
+
+    def _columnas_sinteticas(self, lines, products, seed):
+        rnd = np.random.default_rng(seed)
+        precio_compra = rnd.integers(20000, 4000000, products)  # centavos
+        precio_venta = rnd.integers(50000, 8000000, products)
+        producto = rnd.integers(0, products, lines)
+        return (
+            producto,
+            rnd.integers(1, 5, lines),
+            precio_venta[producto],
+            precio_compra[producto],
+            rnd.integers(0, 24, lines),
+            rnd.integers(0, 7, lines),
+            rnd.integers(0, 12, lines),
+        )
+
+    def _columnas_db(self):
+        from cashier.models import VentaDetalle
+        from products.pricing import centavos
+
+        filas = (VentaDetalle.objects
+                 .annotate(precio_c=centavos('precio_unitario'), costo_c=centavos('costo_unitario'))
+                 .values_list('producto_id', 'cantidad', 'precio_c', 'costo_c',
+                              'venta__hora_local', 'venta__dia_semana', 'venta__empleado_id'))
+        datos = np.array(list(filas.iterator(chunk_size=20000)), dtype=np.int64).reshape(-1, 7)
+        producto, _ = vectorizado.codificar(datos[:, 0].tolist())
+        cajero, _ = vectorizado.codificar(datos[:, 6].tolist())
+        return producto, datos[:, 1], datos[:, 2], datos[:, 3], datos[:, 4], datos[:, 5], cajero
+
+    def _decimal(self, producto, cantidad, precio_c, costo_c, hora, semana, cajero):
+        """Bucle por línea con Decimal (como las vistas antes de agregar en SQL)."""
+        iva = Decimal('1.19')
+        cent = Decimal('0.01')
+        por_producto = {}
+        por_celda = {}
+        por_cajero = {}
+        for p, c, pv, pc, h, d, u in zip(producto.tolist(), cantidad.tolist(), precio_c.tolist(), costo_c.tolist(),
+                                         hora.tolist(), semana.tolist(), cajero.tolist()):
+            precio = Decimal(pv) * cent
+            neto = (precio / iva).quantize(cent, rounding=ROUND_HALF_UP) * c
+            costo = (Decimal(pc) * cent / iva).quantize(cent, rounding=ROUND_HALF_UP) * c
+            acc = por_producto.setdefault(p, [0, Decimal('0.00'), Decimal('0.00')])
+            acc[0] += c
+            acc[1] += neto
+            acc[2] += costo
+            celda = por_celda.setdefault(d * 24 + h, [0, Decimal('0.00')])
+            celda[0] += 1
+            celda[1] += precio * c
+            caja = por_cajero.setdefault(u, [0, Decimal('0.00')])
+            caja[0] += 1
+            caja[1] += precio * c
+        productos = {}
+        for p, (unidades, ingreso, costo) in por_producto.items():
+            ganancia = ingreso - costo
+            pct = (ganancia / ingreso * Decimal('100')).quantize(cent) if ingreso > 0 else Decimal('0.00')
+            productos[p] = (unidades, int(ingreso * 100), int(costo * 100), int(pct * 100))
+        celdas = {k: (n, int(monto * 100)) for k, (n, monto) in por_celda.items()}
+        cajeros = {k: (n, int(monto * 100), int((monto / n).quantize(cent) * 100)) for k, (n, monto) in por_cajero.items()}
+        return productos, celdas, cajeros
+
+    def _numpy(self, producto, cantidad, precio_c, costo_c, hora, semana, cajero):
+        tamano = int(producto.max()) + 1 if len(producto) else 0
+        unidades, ingreso, costo = vectorizado.agregar_lineas(producto, cantidad, precio_c, costo_c, tamano)
+        pct = vectorizado.porcentaje_centesimas(ingreso - costo, ingreso)
+        vendidos = np.flatnonzero(unidades)
+        productos = {
+            p: (int(unidades[p]), int(ingreso[p]), int(costo[p]), int(pct[p]))
+            for p in vendidos.tolist()
+        }
+
+        bruto = np.asarray(cantidad, dtype=np.int64) * precio_c
+        uno = np.ones(len(producto), dtype=np.int64)
+        n_celda, monto_celda = vectorizado.sumar_por(semana * 24 + hora, 7 * 24, uno, bruto)
+        celdas = {k: (int(n_celda[k]), int(monto_celda[k])) for k in np.flatnonzero(n_celda).tolist()}
+
+        n_caja = int(cajero.max()) + 1 if len(cajero) else 0
+        n_cajero, monto_cajero = vectorizado.sumar_por(cajero, n_caja, uno, bruto)
+        activos = np.flatnonzero(n_cajero)
+        ticket = vectorizado.dividir_par(monto_cajero[activos], n_cajero[activos])
+        cajeros = {
+            k: (int(n_cajero[k]), int(monto_cajero[k]), int(t))
+            for k, t in zip(activos.tolist(), ticket.tolist())
+        }
+        return productos, celdas, cajeros
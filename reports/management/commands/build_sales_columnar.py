@@ -0,0 +1,63 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports import archivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Append sale lines newer than the last archived id to the memory-mapped columnar store "
+        "(reports.archivo, one directory per local month under SALES_ARCHIVE_DIR). Read-only for "
+        "the database: moving old sales to the archive tables is archive_old_sales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Archive directory (default: SALES_ARCHIVE_DIR)")
+        parser.add_argument("--batch", type=int, default=50000, help="Lines written per manifest update")
+        parser.add_argument("--rebuild", action="store_true", help="Drop the archive and rebuild it from scratch")
+        parser.add_argument(
+            "--query", metavar="KEYS",
+            help="After archiving, print totals grouped by these comma-separated keys (e.g. anio,mes)",
+        )
+        parser.add_argument("--desde", help="First local day for --query (YYYY-MM-DD)")
+        parser.add_argument("--hasta", help="Last local day for --query (YYYY-MM-DD)")
+
+    def handle(self, dir=None, batch=50000, rebuild=False, query=None, desde=None, hasta=None, **options):
+        t0 = time.perf_counter()
+        nuevas = archivo.reconstruir(dir, batch) if rebuild else archivo.extender(dir, batch)
+        manifiesto = archivo.leer_manifiesto(dir)
+        self.stdout.write(
+            f"Archived {nuevas} new line(s) in {(time.perf_counter() - t0) * 1000:.0f} ms; "
+            f"{sum(manifiesto['particiones'].values())} line(s) in {len(manifiesto['particiones'])} month(s), "
+            f"last id {manifiesto['ultimo_id']}."
+        )
+        borradas = archivo.diferencia(dir)
+        if borradas:
+            self.stdout.write(self.style.WARNING(
+                f"{borradas} archived line(s) no longer exist in the database; run with --rebuild to drop them."
+            ))
+
+        if query is None:
+            return
+        por = [c.strip() for c in query.split(",") if c.strip()]
+        t0 = time.perf_counter()
+        try:
+            filas = archivo.consultar(self._fecha(desde, "--desde"), self._fecha(hasta, "--hasta"), por, base=dir)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        ms = (time.perf_counter() - t0) * 1000
+        columnas = por + ["lineas", "ventas", "unidades", "bruto_c", "ingreso_neto_c", "costo_neto_c"]
+        self.stdout.write("\t".join(columnas))
+        for fila in filas:
+            self.stdout.write("\t".join(str(fila[c]) for c in columnas))
+        self.stdout.write(f"{len(filas)} group(s) in {ms:.1f} ms.")
+
+    def _fecha(self, value, flag):
+        if not value:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"{flag} must be YYYY-MM-DD")
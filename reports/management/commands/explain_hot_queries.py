@@ -0,0 +1,140 @@
+import datetime
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.test.utils import CaptureQueriesContext, get_runner
+from django.utils import timezone
+
+from reports import benchmark
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(.*)$')
+_PG_SCAN = re.compile(r'Seq Scan on "?(\w+)"?')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the hot report, cashier and stock-history queries against a generated "
+        "dataset and flag sequential scans on the large tables. Uses a throw-away test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sales", type=int, default=20000, help="Synthetic sales to generate")
+        parser.add_argument("--movements", type=int, default=5000, help="Synthetic transfers and adjustments")
+        parser.add_argument("--days", type=int, default=90, help="Days spanned by the synthetic sales")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database between runs")
+        parser.add_argument("--strict", action="store_true", help="Exit with an error if any scan is flagged")
+        parser.add_argument("--verbose-plans", action="store_true", help="Print the full plan of every query")
+
+    def handle(self, sales=20000, movements=5000, days=90, keepdb=False, strict=False, verbose_plans=False, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"EXPLAIN parsing is only implemented for SQLite and PostgreSQL, not {connection.vendor}.")
+        runner = get_runner(settings)(verbosity=0, interactive=False, keepdb=keepdb)
+        old_config = runner.setup_databases()
+        try:
+            catalog = benchmark.seed_catalog()
+            benchmark.seed_sales(sales, catalog, days=days)
+            benchmark.seed_stock_movements(movements, catalog)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            flagged = 0
+            for label, func in self._hot_queries(catalog):
+                flagged += self._explain(label, func, verbose_plans)
+        finally:
+            runner.teardown_databases(old_config)
+        if flagged:
+            msg = f"{flagged} sequential scan(s) on large tables."
+            if strict:
+                raise CommandError(msg)
+            self.stdout.write(self.style.WARNING(msg))
+        else:
+            self.stdout.write(self.style.SUCCESS("No sequential scans on large tables."))
+
+    def _hot_queries(self, catalog):
+        from cashier.models import Venta
+        from products.models import AjusteStock, TransferenciaStock
+        from reports import rollup
+        from reports.analytics import compute_analytics
+
+        fin = timezone.now()
+        inicio = fin - datetime.timedelta(days=30)
+        sucursal = catalog['sucursales'][0]
+        cajero = catalog['cajeros'][0]
+        producto = catalog['productos'][0][0]
+        caja_id = 1
+
+        def consolidar():
+            for dia in rollup.dias_pendientes()[-3:]:
+                rollup.consolidar_dia(dia)
+
+        return [
+            # reports.analytics
+            ('compute_analytics (raw)', lambda: compute_analytics(inicio, fin, use_cache=False)),
+            ('compute_analytics (sucursal)', lambda: compute_analytics(inicio, fin, 'todos', str(sucursal), use_cache=False)),
+            ('rollup.consolidar_dia', consolidar),
+            ('compute_analytics (rollup)', lambda: compute_analytics(inicio, fin, use_cache=False)),
+            # cashier.views
+            ('cerrar_caja totals', lambda: Venta.objects.filter(caja_id=caja_id, forma_pago='efectivo').aggregate(t=Sum('total'))),
+            ('advanced_reports KPIs', lambda: Venta.objects.filter(fecha__gte=inicio, fecha__lte=fin).aggregate(
+                t=Sum('total'), n=Count('id'), u=Sum('unidades'), c=Sum('costo_total'))),
+            # reports.views
+            ('sales_history page', lambda: list(Venta.objects.filter(empleado_id=cajero, fecha__gte=inicio).order_by('-fecha')[:20])),
+            ('cash_history caja total', lambda: Venta.objects.filter(empleado_id=cajero, fecha__gte=inicio, fecha__lte=fin).aggregate(t=Sum('total'))),
+            ('sucursal sales by day', lambda: list(Venta.objects.filter(sucursal_id=sucursal, fecha__gte=inicio)
+                                                  .values('fecha_local').annotate(t=Sum('total')).order_by())),
+            # products.views
+            ('transfer_history page', lambda: list(TransferenciaStock.objects.select_related('producto', 'origen', 'destino', 'usuario')
+                                                   .order_by('-fecha')[:10])),
+            ('transfer_history by product', lambda: list(TransferenciaStock.objects.filter(producto_id=producto).order_by('-fecha')[:10])),
+            ('adjust_history by sucursal', lambda: list(AjusteStock.objects.select_related('producto', 'sucursal', 'usuario')
+                                                       .filter(sucursal_id=sucursal).order_by('-fecha')[:200])),
+            ('adjust_history by product', lambda: list(AjusteStock.objects.filter(Q(producto_id=producto)).order_by('-fecha')[:200])),
+        ]
+
+    def _large_tables(self):
+        from cashier.models import Venta, VentaDetalle
+        from products.models import AjusteStock, TransferenciaStock
+        from reports.models import ResumenDiarioProducto, ResumenDiarioVentas
+        return {m._meta.db_table for m in (Venta, VentaDetalle, TransferenciaStock, AjusteStock,
+                                           ResumenDiarioVentas, ResumenDiarioProducto)}
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute('EXPLAIN ' + sql)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _scans(self, plan):
+        tables = set()
+        for line in plan:
+            if connection.vendor == 'sqlite':
+                match = _SQLITE_SCAN.match(line.strip())
+                # "SCAN t USING [COVERING] INDEX" recorre un índice, no la tabla
+                if match and 'USING' not in match.group(2):
+                    tables.add(match.group(1))
+            else:
+                tables.update(_PG_SCAN.findall(line))
+        return tables
+
+    def _explain(self, label, func, verbose_plans):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith(('SELECT', 'WITH'))]
+        large = self._large_tables()
+        flagged = 0
+        self.stdout.write(f"{label} ({len(selects)} queries)")
+        for i, sql in enumerate(selects, 1):
+            plan = self._plan(sql)
+            scans = self._scans(plan) & large
+            if scans:
+                flagged += len(scans)
+                self.stdout.write(self.style.WARNING(f"  #{i} SEQ SCAN on {', '.join(sorted(scans))}"))
+                self.stdout.write(f"     {sql[:300]}")
+            if verbose_plans or scans:
+                for line in plan:
+                    self.stdout.write(f"     | {line}")
+        return flagged
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reports import rollup
+
+
+class Command(BaseCommand):
+    help = "Drop the daily sales rollup and rebuild it from raw sales for every closed day."
+
+    def handle(self, **options):
+        rollup.limpiar()
+        dias = rollup.dias_pendientes()
+        for dia in dias:
+            rollup.consolidar_dia(dia)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollup for {len(dias)} day(s)."))
@@ -0,0 +1,56 @@
+import datetime
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from reports import rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Consolidate closed local days into the daily sales rollup. Idempotent: "
+        "only days without a marker or with late sales are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Also recompute every day from this date (YYYY-MM-DD)")
+        parser.add_argument("--hasta", help="Recompute up to this date inclusive (default: yesterday)")
+        parser.add_argument(
+            "--interval", type=int,
+            default=int(os.getenv("SALES_ROLLUP_INTERVAL", "0")),
+            help="Keep running, catching up every N seconds (default: SALES_ROLLUP_INTERVAL or run once)",
+        )
+
+    def handle(self, desde=None, hasta=None, interval=0, **options):
+        desde = self._fecha(desde, "--desde")
+        hasta = self._fecha(hasta, "--hasta")
+        while True:
+            self._catch_up(desde, hasta)
+            if interval <= 0:
+                return
+            close_old_connections()
+            time.sleep(interval)
+
+    def _fecha(self, value, flag):
+        if not value:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"{flag} must be YYYY-MM-DD")
+
+    def _catch_up(self, desde, hasta):
+        limite = hasta + datetime.timedelta(days=1) if hasta else None
+        dias = set(rollup.dias_pendientes(limite))
+        if desde:
+            fin = limite or timezone.localdate()
+            dia = desde
+            while dia < fin:
+                dias.add(dia)
+                dia += datetime.timedelta(days=1)
+        for dia in sorted(dias):
+            rollup.consolidar_dia(dia)
+        self.stdout.write(f"Consolidated {len(dias)} day(s).")
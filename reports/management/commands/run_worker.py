@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from reports import tareas
+
+
+def _detener_con_senales(evento):
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *args: evento.set())
+
+
+def _proceso(trabajador, hilos, espera):
+    # Proceso hijo (fork): conexiones y manejadores de señales propios
+    detener = threading.Event()
+    _detener_con_senales(detener)
+    tareas.trabajar(trabajador, hilos, detener, espera)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks (reports.tareas) until SIGTERM/SIGINT. "
+        "Running tasks are allowed to finish before exiting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=int(os.getenv("TASKS_WORKER_PROCESSES", "1")),
+            help="Worker processes (default: TASKS_WORKER_PROCESSES or 1)",
+        )
+        parser.add_argument(
+            "--threads", type=int, default=int(os.getenv("TASKS_WORKER_THREADS", "2")),
+            help="Threads per process, i.e. tasks run at once by each process (default: TASKS_WORKER_THREADS or 2)",
+        )
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Run the tasks available now and exit")
+
+    def handle(self, processes=1, threads=2, poll=1.0, once=False, **options):
+        nombre = tareas.nombre_trabajador()
+        if once:
+            self.stdout.write(f"Ran {tareas.ejecutar_pendientes(nombre)} task(s).")
+            return
+        detener = threading.Event()
+        _detener_con_senales(detener)
+        processes = max(1, processes)
+        self.stdout.write(f"Worker {nombre}: {processes} process(es) x {max(1, threads)} thread(s).")
+        if processes == 1:
+            tareas.trabajar(nombre, threads, detener, poll)
+            return
+
+        # Los hijos no deben heredar conexiones abiertas del padre
+        connections.close_all()
+        contexto = multiprocessing.get_context("fork")
+
+        def lanzar(i):
+            proceso = contexto.Process(target=_proceso, args=(f"{nombre}-{i}", threads, poll), name=f"worker-{i}")
+            proceso.start()
+            return proceso
+
+        procesos = [lanzar(i) for i in range(processes)]
+        while not detener.wait(1):
+            for i, proceso in enumerate(procesos):
+                if not proceso.is_alive():
+                    self.stderr.write(f"Worker process {i} exited with code {proceso.exitcode}; restarting.")
+                    procesos[i] = lanzar(i)
+        for proceso in procesos:
+            if proceso.is_alive():
+                proceso.terminate()  # SIGTERM: el hijo termina sus tareas en curso
+        for proceso in procesos:
+            proceso.join()
@@ -0,0 +1,69 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_fuenteproductos'),
+        ('reports', '0003_initial'),
+        ('sucursales', '0002_sucursal_low_stock_threshold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaConsolidado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('hasta_venta_id', models.BigIntegerField(default=0, help_text='Mayor id de Venta incluido al consolidar.')),
+                ('ventas', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Día consolidado',
+                'verbose_name_plural': 'Días consolidados',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiarioProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingreso', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ingreso_neto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('empleado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+                ('sucursal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sucursales.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario por producto',
+                'verbose_name_plural': 'Resúmenes diarios por producto',
+                'indexes': [models.Index(fields=['fecha'], name='reports_res_fecha_a0e216_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiarioVentas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora', models.PositiveSmallIntegerField()),
+                ('forma_pago', models.CharField(max_length=20)),
+                ('ventas', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('empleado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('sucursal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sucursales.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de ventas',
+                'verbose_name_plural': 'Resúmenes diarios de ventas',
+                'indexes': [models.Index(fields=['fecha'], name='reports_res_fecha_6853bc_idx')],
+            },
+        ),
+    ]
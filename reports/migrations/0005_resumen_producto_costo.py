@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:15
+
+from django.db import migrations, models
+
+
+def reabrir_dias(apps, schema_editor):
+    # Los resúmenes existentes no tienen costo: se leen desde las ventas hasta
+    # que ``rollup_sales`` los vuelva a consolidar.
+    apps.get_model('reports', 'DiaConsolidado').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0004_resumenes_diarios'),
+        ('cashier', '0006_venta_detalle_costo_unitario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumendiarioproducto',
+            name='costo',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='resumendiarioproducto',
+            name='costo_neto',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(reabrir_dias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-19 02:18
+
+from django.db import migrations, models
+
+
+def reabrir_dias(apps, schema_editor):
+    # Los resúmenes existentes no tienen unidades ni costo por venta
+    apps.get_model('reports', 'DiaConsolidado').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_resumen_producto_costo'),
+        ('cashier', '0007_venta_resumen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumendiarioventas',
+            name='costo',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='resumendiarioventas',
+            name='unidades',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(reabrir_dias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.7 on 2026-10-19 03:25
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_resumen_ventas_unidades_costo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('funcion', models.CharField(help_text="Ruta de la función, p. ej. 'reports.exportaciones.generar'.", max_length=200)),
+                ('argumentos', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('disponible', models.DateTimeField(default=django.utils.timezone.now, help_text='No se ejecuta antes de este momento.')),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3)),
+                ('progreso', models.PositiveSmallIntegerField(default=0, help_text='Porcentaje informado por la tarea.')),
+                ('mensaje', models.CharField(blank=True, max_length=255)),
+                ('resultado', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('iniciada', models.DateTimeField(blank=True, null=True)),
+                ('latido', models.DateTimeField(blank=True, help_text='Última señal del worker que la ejecuta.', null=True)),
+                ('finalizada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'ordering': ['-creada'],
+                'indexes': [models.Index(fields=['estado', 'disponible'], name='reports_tar_estado_a112a9_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 
 class Sucursal(models.Model):
     nombre = models.CharField(max_length=255)
@@ -8,3 +11,115 @@ class Sucursal(models.Model):
     def __str__(self):
         return self.nombre
 
+
+
+class DiaConsolidado(models.Model):
+    """Día local (America/Santiago) cuyos resúmenes ya reflejan todas sus ventas.
+
+    Los reportes sólo leen los resúmenes de días marcados aquí; el resto se
+    agrega desde las tablas de ventas. Ver reports/rollup.py.
+    """
+    fecha = models.DateField(unique=True)
+    hasta_venta_id = models.BigIntegerField(default=0, help_text="Mayor id de Venta incluido al consolidar.")
+    ventas = models.IntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Día consolidado'
+        verbose_name_plural = 'Días consolidados'
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return str(self.fecha)
+
+
+class ResumenDiarioVentas(models.Model):
+    """Ventas por (día local, hora local, sucursal, cajero, forma de pago)."""
+    fecha = models.DateField()
+    hora = models.PositiveSmallIntegerField()
+    sucursal = models.ForeignKey('sucursales.Sucursal', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    empleado = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    forma_pago = models.CharField(max_length=20)
+    ventas = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unidades = models.IntegerField(default=0)
+    costo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Resumen diario de ventas'
+        verbose_name_plural = 'Resúmenes diarios de ventas'
+        indexes = [models.Index(fields=['fecha'])]
+
+
+class ResumenDiarioProducto(models.Model):
+    """Líneas de venta por (día local, sucursal, cajero, producto).
+
+    ``ingreso_neto`` y ``costo_neto`` suman por línea ``cantidad * (precio / 1.19)``
+    redondeado a centavos, igual que la rentabilidad calculada desde las líneas.
+    El costo es el ``costo_unitario`` registrado en cada línea al vender.
+    """
+    fecha = models.DateField()
+    sucursal = models.ForeignKey('sucursales.Sucursal', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    empleado = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    producto = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='+')
+    unidades = models.IntegerField(default=0)
+    ingreso = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ingreso_neto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    costo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    costo_neto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Resumen diario por producto'
+        verbose_name_plural = 'Resúmenes diarios por producto'
+        indexes = [models.Index(fields=['fecha'])]
+
+
+class Tarea(models.Model):
+    """Trabajo pesado encolado para el comando run_worker (ver reports/tareas.py).
+
+    ``funcion`` es la ruta de una función que recibe la tarea y ``argumentos``
+    como keywords; lo que retorna queda en ``resultado``. Los intentos fallidos
+    vuelven a ``pendiente`` con espera creciente hasta ``max_intentos``.
+    """
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_EN_CURSO = 'en_curso'
+    ESTADO_COMPLETADA = 'completada'
+    ESTADO_FALLIDA = 'fallida'
+    ESTADOS = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_EN_CURSO, 'En curso'),
+        (ESTADO_COMPLETADA, 'Completada'),
+        (ESTADO_FALLIDA, 'Fallida'),
+    ]
+
+    funcion = models.CharField(max_length=200, help_text="Ruta de la función, p. ej. 'reports.exportaciones.generar'.")
+    argumentos = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=ESTADO_PENDIENTE)
+    disponible = models.DateTimeField(default=timezone.now, help_text="No se ejecuta antes de este momento.")
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    progreso = models.PositiveSmallIntegerField(default=0, help_text="Porcentaje informado por la tarea.")
+    mensaje = models.CharField(max_length=255, blank=True)
+    resultado = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, null=True)
+    trabajador = models.CharField(max_length=100, blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    iniciada = models.DateTimeField(blank=True, null=True)
+    latido = models.DateTimeField(blank=True, null=True, help_text="Última señal del worker que la ejecuta.")
+    finalizada = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-creada']
+        verbose_name = 'Tarea'
+        verbose_name_plural = 'Tareas'
+        indexes = [models.Index(fields=['estado', 'disponible'])]
+
+    def __str__(self):
+        return f"{self.funcion} #{self.pk} {self.estado} ({self.progreso}%)"
+
+    def avanzar(self, progreso, mensaje=''):
+        """Guarda el avance (0-100) y un mensaje corto; sirve también de latido."""
+        self.progreso = max(0, min(100, int(progreso)))
+        self.mensaje = mensaje[:255]
+        self.latido = timezone.now()
+        Tarea.objects.filter(pk=self.pk).update(progreso=self.progreso, mensaje=self.mensaje, latido=self.latido)
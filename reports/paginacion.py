@@ -0,0 +1,165 @@
+"""Paginación por cursor (keyset) para los historiales.
+
+``Paginator`` pagina con OFFSET y cuenta todo con ``COUNT(*)`` en cada vista:
+una página profunda lee y descarta todas las filas anteriores. Aquí cada
+página se pide "después de" (o "antes de") la última fila vista, con un filtro
+sobre ``(campo, id)`` que recorre el índice correspondiente: la página mil
+cuesta lo mismo que la primera.
+
+- El orden es siempre descendente por ``campo`` y luego ``id`` (lo más
+  reciente primero). Los cursores (``?despues=`` y ``?antes=``) son opacos:
+  base64 del valor del campo y el id de la fila límite.
+- No hay número de página ni "última página". Con ``contar`` la página
+  ofrece un total aproximado que no recorre la tabla: en Postgres la
+  estimación del planificador (``EXPLAIN``); en otras bases se cuenta hasta
+  ``TOPE_CONTEO`` filas.
+- Un cursor inválido o manipulado muestra la primera página.
+- ``paginar`` acepta también una lista de querysets con el mismo campo de
+  orden (p. ej. ventas calientes y archivadas): cada uno aporta su página por
+  índice y las filas se mezclan en memoria.
+"""
+import base64
+import json
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+DESPUES = 'despues'
+ANTES = 'antes'
+TOPE_CONTEO = 10000
+
+
+def _codificar(valor, pk):
+    return base64.urlsafe_b64encode(json.dumps([valor, pk]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decodificar(cursor, campo):
+    """``(valor, pk)`` del cursor, o ``None`` si no es válido."""
+    try:
+        valor, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        valor = campo.to_python(valor)
+        return (valor, int(pk)) if valor is not None else None
+    except Exception:
+        return None
+
+
+class Pagina:
+    """Filas de una página y los enlaces a sus vecinas (iterable como ``Page``)."""
+
+    def __init__(self, request, fuentes, campo, object_list, has_previous, has_next, contar):
+        self.object_list = object_list
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self._request = request
+        self._fuentes = fuentes
+        self._campo = campo
+        self._contar = contar
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, fila):
+        return _codificar(self._campo.value_to_string(fila), fila.pk)
+
+    def _url(self, **cursor):
+        params = self._request.GET.copy()
+        for clave in (DESPUES, ANTES, 'page'):
+            params.pop(clave, None)
+        params.update(cursor)
+        return f'?{params.urlencode()}' if params else '?'
+
+    @property
+    def url_primera(self):
+        return self._url()
+
+    @property
+    def url_anterior(self):
+        return self._url(**{ANTES: self._cursor(self.object_list[0])}) if self.has_previous else None
+
+    @property
+    def url_siguiente(self):
+        return self._url(**{DESPUES: self._cursor(self.object_list[-1])}) if self.has_next else None
+
+    @cached_property
+    def total_aproximado(self):
+        """``(total, es_tope)`` del listado completo, o ``None`` si la vista no lo pidió."""
+        if not self._contar:
+            return None
+        conteos = [contar_aproximado(qs) for qs in self._fuentes]
+        return sum(total for total, _ in conteos), any(es_tope for _, es_tope in conteos)
+
+    @property
+    def descripcion_total(self):
+        if self.total_aproximado is None:
+            return ''
+        total, es_tope = self.total_aproximado
+        cifra = f'{total:,}'.replace(',', '.')
+        return f'Más de {cifra} registros' if es_tope else f'~{cifra} registros'
+
+
+def _leer(fuentes, campo, q, ascendente, n):
+    """Primeras ``n`` filas de ``fuentes`` filtradas por ``q`` en el orden pedido."""
+    orden = (campo, 'pk') if ascendente else (f'-{campo}', '-pk')
+    filas = [fila for qs in fuentes for fila in qs.filter(q).order_by(*orden)[:n]]
+    if len(fuentes) > 1:
+        filas.sort(key=lambda fila: (getattr(fila, campo), fila.pk), reverse=not ascendente)
+    return filas[:n]
+
+
+def paginar(request, queryset, campo, por_pagina, contar=False):
+    """Página de ``queryset`` (o de una lista de querysets) según los cursores de ``request.GET``.
+
+    ``campo`` es el nombre del campo de orden (descendente, desempatado por
+    ``id``); debería existir un índice sobre ``(campo, id)`` con los filtros
+    habituales de la vista al inicio.
+    """
+    fuentes = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+    modelo_campo = fuentes[0].model._meta.get_field(campo)
+    despues = _decodificar(request.GET.get(DESPUES, ''), modelo_campo)
+    antes = None if despues else _decodificar(request.GET.get(ANTES, ''), modelo_campo)
+
+    if antes:
+        valor, pk = antes
+        filas = _leer(fuentes, campo, Q(**{f'{campo}__gt': valor}) | Q(**{campo: valor, 'pk__gt': pk}),
+                      True, por_pagina + 1)
+        has_previous = len(filas) > por_pagina
+        filas = filas[:por_pagina][::-1]
+        has_next = True
+        if not has_previous and len(filas) < por_pagina:
+            # Volvimos al inicio y la página quedó corta: mostrar la primera completa
+            filas = _leer(fuentes, campo, Q(), False, por_pagina + 1)
+            has_next = len(filas) > por_pagina
+            filas = filas[:por_pagina]
+    else:
+        filas = []
+        if despues:
+            valor, pk = despues
+            filas = _leer(fuentes, campo, Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'pk__lt': pk}),
+                          False, por_pagina + 1)
+        has_previous = bool(filas)
+        if not filas:
+            # Sin cursor, o las filas siguientes ya no existen: primera página
+            filas = _leer(fuentes, campo, Q(), False, por_pagina + 1)
+        has_next = len(filas) > por_pagina
+        filas = filas[:por_pagina]
+    return Pagina(request, fuentes, modelo_campo, filas, has_previous, has_next, contar)
+
+
+def contar_aproximado(queryset):
+    """``(total, es_tope)``: estimación del planificador en Postgres, conteo acotado en otras bases."""
+    queryset = queryset.order_by()
+    conexion = connections[queryset.db]
+    if conexion.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with conexion.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+    total = queryset[:TOPE_CONTEO + 1].count()
+    return min(total, TOPE_CONTEO), total > TOPE_CONTEO
@@ -0,0 +1,83 @@
+"""Ejecución concurrente de las lecturas de los reportes (opcional, sólo Postgres).
+
+Con ``settings.ANALYTICS_PARALLEL_WORKERS`` > 1, ``analytics.compute_sections``
+lanza las lecturas independientes de una pasada (hechos de ventas, cajeros y
+productos, periodo anterior, sucursales) en un pool acotado de hilos y junta
+los resultados, de modo que el tiempo total se acerca al de la lectura más
+lenta en vez de a la suma.
+
+- Cada hilo usa su propia conexión, con ``statement_timeout`` igual a
+  ``ANALYTICS_SECTION_TIMEOUT`` segundos, y la cierra al terminar: los hilos
+  del pool no quedan con conexiones abiertas entre requests.
+- Si una lectura falla o no termina a tiempo se repite en el hilo que llama
+  (sin límite), igual que ``cache_reportes.obtener`` calcula cuando no puede
+  esperar más: el resultado es siempre el mismo que en modo secuencial.
+- Dentro de una transacción (``ATOMIC_REQUESTS``, pruebas) se ejecuta en
+  secuencia: otras conexiones no verían los datos sin confirmar.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def activo():
+    """Si las lecturas de esta llamada pueden ir en paralelo."""
+    return (
+        getattr(settings, 'ANALYTICS_PARALLEL_WORKERS', 0) > 1
+        and connection.vendor == 'postgresql'
+        and not connection.in_atomic_block
+    )
+
+
+def _ejecutor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.ANALYTICS_PARALLEL_WORKERS, thread_name_prefix='analytics',
+            )
+        return _pool
+
+
+def _en_conexion_propia(tarea, zona, timeout):
+    """Corre ``tarea`` en el hilo del pool con su conexión y la zona horaria del request."""
+    try:
+        if timeout and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET statement_timeout = %s', [int(timeout * 1000)])
+        with timezone.override(zona):
+            return tarea()
+    finally:
+        connection.close()
+
+
+def ejecutar(tareas):
+    """Ejecuta ``{nombre: callable}`` en el pool y retorna ``{nombre: resultado}``."""
+    timeout = getattr(settings, 'ANALYTICS_SECTION_TIMEOUT', 30)
+    zona = timezone.get_current_timezone()
+    futuros = {
+        nombre: _ejecutor().submit(_en_conexion_propia, tarea, zona, timeout)
+        for nombre, tarea in tareas.items()
+    }
+    # Con más tareas que hilos, las últimas esperan su turno antes de empezar
+    tandas = -(-len(tareas) // settings.ANALYTICS_PARALLEL_WORKERS)
+    limite = time.monotonic() + (timeout * tandas if timeout else 0)
+    resultado = {}
+    for nombre, futuro in futuros.items():
+        try:
+            resultado[nombre] = futuro.result(timeout=max(0, limite - time.monotonic()) if timeout else None)
+        except Exception:
+            futuro.cancel()  # si aún no empezaba; si corre, statement_timeout la corta
+            logger.warning('Lectura %s de analytics falló o excedió el tiempo; se repite en secuencia', nombre, exc_info=True)
+            resultado[nombre] = tareas[nombre]()
+    return resultado
@@ -0,0 +1,436 @@
+"""Resúmenes diarios de ventas (rollups) y lectura mixta resumen + ventas.
+
+Los días locales ya cerrados se consolidan en ``ResumenDiarioVentas`` y
+``ResumenDiarioProducto`` (ver ``consolidar_dia``) y se marcan en
+``DiaConsolidado``. Los reportes leen los resúmenes para los días completos y
+consolidados del rango, y sólo agregan filas de ``Venta``/``VentaDetalle`` para
+los días parciales (típicamente hoy) o aún no consolidados.
+
+Consolidar un día lo recalcula completo desde las ventas, así que la operación
+es idempotente. Además de ``rollup_sales``, las lecturas consolidan al vuelo
+los días cerrados más recientes que encuentran sin marca (hasta
+``settings.ROLLUP_CONSOLIDAR_AL_LEER`` por lectura) y encolan el resto, junto
+con los del período de comparación, en ``reports.tareas`` (``consolidar_dias``):
+un request no paga más que unos pocos días y tras el primer uso sólo el día
+en curso se calcula desde las ventas. Las ventas nuevas
+con fecha pasada, editadas o borradas invalidan el día vía señales; los
+borrados masivos (``borrado_masivo``) limpian los resúmenes al terminar.
+
+La consolidación lee también las tablas de archivo (``VentaArchivada``, ver
+``reports.historico``): un día archivado sigue pudiendo recalcularse. Las
+lecturas crudas de los tramos sólo ven las tablas calientes, por eso un día
+con ventas archivadas se vuelve a consolidar en cuanto se invalida (o se
+limpian los resúmenes).
+"""
+import datetime
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from cashier.models import Venta, VentaArchivada, VentaDetalle, VentaDetalleArchivada
+from products.pricing import centavos, neto_centavos
+from . import tareas, versiones
+from .models import DiaConsolidado, ResumenDiarioProducto, ResumenDiarioVentas, Tarea
+
+
+# (ventas, líneas) de las tablas calientes y de archivo, con los mismos campos
+FUENTES = ((Venta, VentaDetalle), (VentaArchivada, VentaDetalleArchivada))
+
+
+def inicio_dia(dia):
+    """Inicio (aware, hora local) del día ``dia``."""
+    return timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+
+
+def _dia_local(value):
+    return timezone.localtime(value).date() if isinstance(value, datetime.datetime) else value
+
+
+def filtrar_ventas(qs, cajero_filter='todos', sucursal_filter='todos', prefix=''):
+    """Aplica los filtros de cajero/sucursal (``prefix='venta__'`` para detalles)."""
+    if cajero_filter and cajero_filter != 'todos':
+        try:
+            qs = qs.filter(**{f'{prefix}empleado_id': int(cajero_filter)})
+        except ValueError:
+            pass
+    if sucursal_filter and sucursal_filter != 'todos':
+        try:
+            qs = qs.filter(**{f'{prefix}sucursal_id': int(sucursal_filter)})
+        except ValueError:
+            pass
+    return qs
+
+
+# ---------------------------------------------------------------------------
+# Partición del rango
+# ---------------------------------------------------------------------------
+
+def particionar(fecha_inicio, fecha_fin, consolidar=True):
+    """Divide ``[fecha_inicio, fecha_fin]`` en días consolidados y tramos crudos.
+
+    Retorna ``(dias, tramos)``: ``dias`` es la lista de fechas locales completas
+    dentro del rango y consolidadas; ``tramos`` son intervalos ``(desde, hasta)``
+    (datetimes, ``hasta`` inclusivo) que deben leerse desde las ventas. Con
+    ``consolidar=False`` los días sin marca sólo se encolan.
+    """
+    primero = _dia_local(fecha_inicio)
+    ultimo = _dia_local(fecha_fin)
+    candidatos = []
+    dia = primero
+    while dia <= ultimo:
+        desde = inicio_dia(dia)
+        siguiente = inicio_dia(dia + datetime.timedelta(days=1))
+        # Un día cuenta completo si el rango lo cubre hasta su último segundo
+        if desde >= fecha_inicio and fecha_fin >= siguiente - datetime.timedelta(seconds=1):
+            candidatos.append(dia)
+        dia += datetime.timedelta(days=1)
+    consolidados = set()
+    if candidatos:
+        consolidados = set(
+            DiaConsolidado.objects.filter(fecha__gte=candidatos[0], fecha__lte=candidatos[-1]).order_by().values_list('fecha', flat=True)
+        )
+        consolidados.update(_consolidar_al_leer((d for d in candidatos if d not in consolidados), consolidar))
+    dias = [d for d in candidatos if d in consolidados]
+
+    tramos = []
+    cursor = fecha_inicio
+    for d in dias:
+        desde = inicio_dia(d)
+        if cursor < desde:
+            tramos.append((cursor, desde - datetime.timedelta(microseconds=1)))
+        cursor = inicio_dia(d + datetime.timedelta(days=1))
+    if cursor <= fecha_fin:
+        tramos.append((cursor, fecha_fin))
+    return dias, tramos
+
+
+def _consolidar_al_leer(faltantes, consolidar=True):
+    """Consolida los días cerrados sin marca (los más recientes primero, con tope) y encola el resto.
+
+    Retorna los días consolidados. El día en curso nunca se consolida. Con el
+    tope en 0 no se consolida ni se encola nada (sólo ``rollup_sales``).
+    """
+    limite = getattr(settings, 'ROLLUP_CONSOLIDAR_AL_LEER', 3)
+    if limite <= 0:
+        return []
+    hoy = timezone.localdate()
+    faltantes = sorted((d for d in faltantes if d < hoy), reverse=True)
+    ahora = faltantes[:limite] if consolidar else []
+    for dia in ahora:
+        consolidar_dia(dia)
+    _encolar_consolidacion(faltantes[len(ahora):])
+    return ahora
+
+
+def _encolar_consolidacion(dias):
+    """Encola ``consolidar_dias`` con los ``dias`` que no estén ya en una tarea pendiente o en curso."""
+    if not dias:
+        return
+    encolados = set()
+    for argumentos in Tarea.objects.filter(
+        funcion=CONSOLIDAR_DIAS, estado__in=(Tarea.ESTADO_PENDIENTE, Tarea.ESTADO_EN_CURSO),
+    ).values_list('argumentos', flat=True):
+        encolados.update(argumentos.get('dias', ()))
+    nuevos = [d.isoformat() for d in dias if d.isoformat() not in encolados]
+    if nuevos:
+        # Nunca en el request de lectura, aunque TASKS_RUN_INLINE esté activo
+        tareas.encolar(CONSOLIDAR_DIAS, en_linea=False, dias=nuevos)
+
+
+def _q_tramos(tramos, field='fecha'):
+    q = Q()
+    for desde, hasta in tramos:
+        q |= Q(**{f'{field}__gte': desde, f'{field}__lte': hasta})
+    return q
+
+
+# ---------------------------------------------------------------------------
+# Lectura de hechos
+# ---------------------------------------------------------------------------
+
+def _sumar(destino, key, row, campos):
+    actual = destino.get(key)
+    if actual is None:
+        destino[key] = dict(row)
+        return
+    for campo in campos:
+        actual[campo] = (actual[campo] or 0) + (row[campo] or 0)
+
+
+SECCIONES = ('ventas', 'cajeros', 'productos')
+
+
+def hechos(fecha_inicio, fecha_fin, cajero_filter='todos', sucursal_filter='todos', secciones=SECCIONES, particion=None):
+    """Hechos agregados del rango combinando resúmenes y ventas.
+
+    Retorna un dict con listas (sólo las ``secciones`` pedidas; el resto vacías):
+
+    - ``ventas``: {dia, hora, sucursal_id, forma_pago, ventas, ingreso, unidades, cmv_c}
+    - ``cajeros``: {empleado_id, empleado__username, ventas, ingreso, unidades, cmv_c}
+    - ``productos``: {producto_id, producto__nombre, producto__producto_id,
+      unidades, ingreso_neto_c, costo_neto_c}
+
+    Los montos ``*_c`` son centavos enteros. ``ventas`` y ``cajeros`` salen sólo
+    de la tabla de ventas (columnas ``unidades``/``costo_total`` de cada venta);
+    ``productos`` es la única sección que lee las líneas. ``particion`` es el
+    resultado de ``particionar`` si ya se calculó (lecturas en paralelo).
+    """
+    dias, tramos = particion or particionar(fecha_inicio, fecha_fin)
+    ventas, cajeros, productos = {}, {}, {}
+    campos = ('ventas', 'ingreso', 'unidades', 'cmv_c')
+
+    if dias:
+        rv = filtrar_ventas(ResumenDiarioVentas.objects.filter(fecha__in=dias), cajero_filter, sucursal_filter)
+        rp = filtrar_ventas(ResumenDiarioProducto.objects.filter(fecha__in=dias), cajero_filter, sucursal_filter)
+        for row in ((rv.values('fecha', 'hora', 'sucursal_id', 'forma_pago')
+                     .annotate(n=Sum('ventas'), ingreso=Sum('total'), u=Sum('unidades'), cmv_c=Sum(centavos('costo')))
+                     .order_by()) if 'ventas' in secciones else ()):
+            _sumar(ventas, (row['fecha'], row['hora'], row['sucursal_id'], row['forma_pago']), {
+                'dia': row['fecha'], 'hora': row['hora'], 'sucursal_id': row['sucursal_id'], 'forma_pago': row['forma_pago'],
+                'ventas': row['n'], 'ingreso': row['ingreso'], 'unidades': row['u'], 'cmv_c': row['cmv_c'],
+            }, campos)
+        for row in ((rv.values('empleado_id', 'empleado__username')
+                     .annotate(n=Sum('ventas'), ingreso=Sum('total'), u=Sum('unidades'), cmv_c=Sum(centavos('costo')))
+                     .order_by()) if 'cajeros' in secciones else ()):
+            _sumar(cajeros, row['empleado_id'], {
+                'empleado_id': row['empleado_id'], 'empleado__username': row['empleado__username'],
+                'ventas': row['n'], 'ingreso': row['ingreso'], 'unidades': row['u'], 'cmv_c': row['cmv_c'],
+            }, campos)
+        for row in ((rp.values('producto_id', 'producto__nombre', 'producto__producto_id')
+                     .annotate(
+                         u=Sum('unidades'),
+                         ingreso_neto_c=Sum(centavos('ingreso_neto')),
+                         costo_neto_c=Sum(centavos('costo_neto')),
+                     ).order_by()) if 'productos' in secciones else ()):
+            row['unidades'] = row.pop('u')
+            _sumar(productos, row['producto_id'], row, ('unidades', 'ingreso_neto_c', 'costo_neto_c'))
+
+    if tramos:
+        vq = filtrar_ventas(Venta.objects.filter(_q_tramos(tramos)), cajero_filter, sucursal_filter)
+        lq = filtrar_ventas(VentaDetalle.objects.filter(_q_tramos(tramos, 'venta__fecha')), cajero_filter, sucursal_filter, prefix='venta__')
+        for row in ((vq.values('fecha_local', 'hora_local', 'sucursal_id', 'forma_pago')
+                     .annotate(n=Count('id'), ingreso=Sum('total'), u=Sum('unidades'), cmv_c=Sum(centavos('costo_total')))
+                     .order_by()) if 'ventas' in secciones else ()):
+            _sumar(ventas, (row['fecha_local'], row['hora_local'], row['sucursal_id'], row['forma_pago']), {
+                'dia': row['fecha_local'], 'hora': row['hora_local'], 'sucursal_id': row['sucursal_id'], 'forma_pago': row['forma_pago'],
+                'ventas': row['n'], 'ingreso': row['ingreso'], 'unidades': row['u'], 'cmv_c': row['cmv_c'],
+            }, campos)
+        for row in ((vq.values('empleado_id', 'empleado__username')
+                     .annotate(n=Count('id'), ingreso=Sum('total'), u=Sum('unidades'), cmv_c=Sum(centavos('costo_total')))
+                     .order_by()) if 'cajeros' in secciones else ()):
+            _sumar(cajeros, row['empleado_id'], {
+                'empleado_id': row['empleado_id'], 'empleado__username': row['empleado__username'],
+                'ventas': row['n'], 'ingreso': row['ingreso'], 'unidades': row['u'], 'cmv_c': row['cmv_c'],
+            }, campos)
+        for row in ((lq.values('producto_id', 'producto__nombre', 'producto__producto_id')
+                     .annotate(
+                         unidades=Sum('cantidad'),
+                         ingreso_neto_c=Sum(F('cantidad') * neto_centavos('precio_unitario')),
+                         costo_neto_c=Sum(F('cantidad') * neto_centavos('costo_unitario')),
+                     ).order_by()) if 'productos' in secciones else ()):
+            _sumar(productos, row['producto_id'], row, ('unidades', 'ingreso_neto_c', 'costo_neto_c'))
+
+    return {
+        'ventas': list(ventas.values()),
+        'cajeros': list(cajeros.values()),
+        'productos': list(productos.values()),
+    }
+
+
+def mas_vendidos(fecha_inicio, fecha_fin, cajero_filter='todos', sucursal_filter='todos', limite=10):
+    """Top de productos por unidades: ``[{'producto__nombre', 'total_cantidad'}]``."""
+    por_nombre = {}
+    for row in hechos(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter, secciones=('productos',))['productos']:
+        nombre = row['producto__nombre']
+        por_nombre[nombre] = por_nombre.get(nombre, 0) + (row['unidades'] or 0)
+    top = sorted(por_nombre.items(), key=lambda kv: kv[1], reverse=True)[:limite]
+    return [{'producto__nombre': nombre, 'total_cantidad': cantidad} for nombre, cantidad in top]
+
+
+def totales(fecha_inicio, fecha_fin, cajero_filter='todos', sucursal_filter='todos', consolidar=True):
+    """Ingreso, número de ventas y costo (centavos) del rango: ``(ingreso, ventas, cmv_c)``."""
+    dias, tramos = particionar(fecha_inicio, fecha_fin, consolidar)
+    ingreso, n, cmv_c = Decimal('0.00'), 0, 0
+    if dias:
+        agg = filtrar_ventas(ResumenDiarioVentas.objects.filter(fecha__in=dias), cajero_filter, sucursal_filter).aggregate(
+            t=Sum('total'), n=Sum('ventas'), c=Sum(centavos('costo')))
+        ingreso += agg['t'] or 0
+        n += agg['n'] or 0
+        cmv_c += agg['c'] or 0
+    if tramos:
+        agg = filtrar_ventas(Venta.objects.filter(_q_tramos(tramos)), cajero_filter, sucursal_filter).aggregate(
+            t=Sum('total'), n=Count('id'), c=Sum(centavos('costo_total')))
+        ingreso += agg['t'] or 0
+        n += agg['n'] or 0
+        cmv_c += agg['c'] or 0
+    return ingreso, n, cmv_c
+
+
+# ---------------------------------------------------------------------------
+# Mantención
+# ---------------------------------------------------------------------------
+
+def consolidar_dia(dia):
+    """Recalcula desde las ventas los resúmenes de un día local y lo marca consolidado.
+
+    La marca del día se toma con ``select_for_update`` antes de leer: dos
+    procesos que consolidan el mismo día (comando y lectura al vuelo) se
+    serializan en vez de duplicar filas.
+    """
+    with transaction.atomic():
+        DiaConsolidado.objects.select_for_update().get_or_create(fecha=dia)
+        _consolidar(dia)
+
+
+CONSOLIDAR_DIAS = 'reports.rollup.consolidar_dias'
+
+
+def consolidar_dias(tarea, dias):
+    """Tarea de ``reports.tareas``: consolida los ``dias`` (ISO) que sigan sin marca."""
+    dias = [datetime.date.fromisoformat(d) for d in dias]
+    hechos = set(DiaConsolidado.objects.filter(fecha__in=dias).values_list('fecha', flat=True))
+    pendientes = [d for d in dias if d not in hechos]
+    for i, dia in enumerate(pendientes, 1):
+        consolidar_dia(dia)
+        tarea.avanzar(100 * i / len(pendientes), f'{dia:%Y-%m-%d}')
+    return {'consolidados': len(pendientes)}
+
+
+def _consolidar(dia):
+    ventas, productos = {}, {}
+    n, max_id = 0, 0
+    for modelo, detalle in FUENTES:
+        ventas_dia = modelo.objects.filter(fecha_local=dia)
+        for row in (ventas_dia.values('hora_local', 'sucursal_id', 'empleado_id', 'forma_pago')
+                    .annotate(n=Count('id'), t=Sum('total'), u=Sum('unidades'), c=Sum('costo_total')).order_by()):
+            _sumar(ventas, (row['hora_local'], row['sucursal_id'], row['empleado_id'], row['forma_pago']),
+                   row, ('n', 't', 'u', 'c'))
+        for row in (detalle.objects.filter(venta__fecha_local=dia)
+                    .values('venta__sucursal_id', 'venta__empleado_id', 'producto_id')
+                    .annotate(
+                        u=Sum('cantidad'),
+                        ingreso_c=Sum(F('cantidad') * centavos('precio_unitario')),
+                        neto_c=Sum(F('cantidad') * neto_centavos('precio_unitario')),
+                        costo_c=Sum(F('cantidad') * centavos('costo_unitario')),
+                        costo_neto_c=Sum(F('cantidad') * neto_centavos('costo_unitario')),
+                    ).order_by()):
+            _sumar(productos, (row['venta__sucursal_id'], row['venta__empleado_id'], row['producto_id']),
+                   row, ('u', 'ingreso_c', 'neto_c', 'costo_c', 'costo_neto_c'))
+        resumen = ventas_dia.aggregate(n=Count('id'), max_id=Max('id'))
+        n += resumen['n'] or 0
+        max_id = max(max_id, resumen['max_id'] or 0)
+
+    filas_ventas = [
+        ResumenDiarioVentas(
+            fecha=dia, hora=row['hora_local'], sucursal_id=row['sucursal_id'], empleado_id=row['empleado_id'],
+            forma_pago=row['forma_pago'] or '', ventas=row['n'], total=row['t'] or 0,
+            unidades=row['u'] or 0, costo=row['c'] or 0,
+        )
+        for row in ventas.values()
+    ]
+    filas_productos = [
+        ResumenDiarioProducto(
+            fecha=dia, sucursal_id=row['venta__sucursal_id'], empleado_id=row['venta__empleado_id'],
+            producto_id=row['producto_id'], unidades=row['u'] or 0,
+            ingreso=Decimal(row['ingreso_c'] or 0) * Decimal('0.01'),
+            ingreso_neto=Decimal(row['neto_c'] or 0) * Decimal('0.01'),
+            costo=Decimal(row['costo_c'] or 0) * Decimal('0.01'),
+            costo_neto=Decimal(row['costo_neto_c'] or 0) * Decimal('0.01'),
+        )
+        for row in productos.values()
+    ]
+
+    ResumenDiarioVentas.objects.filter(fecha=dia).delete()
+    ResumenDiarioProducto.objects.filter(fecha=dia).delete()
+    ResumenDiarioVentas.objects.bulk_create(filas_ventas, batch_size=1000)
+    ResumenDiarioProducto.objects.bulk_create(filas_productos, batch_size=1000)
+    DiaConsolidado.objects.filter(fecha=dia).update(
+        ventas=n, hasta_venta_id=max_id, actualizado=timezone.now(),
+    )
+
+
+def dias_pendientes(hasta=None):
+    """Días locales cerrados (anteriores a ``hasta``, por defecto hoy) sin consolidar.
+
+    Incluye días sin marca entre la primera venta y ``hasta`` y los días que
+    recibieron ventas con id mayor a la marca de agua (ventas atrasadas).
+    """
+    hasta = hasta or timezone.localdate()
+    primeras = [modelo.objects.aggregate(p=Min('fecha_local'))['p'] for modelo, _ in FUENTES]
+    dia = min((p for p in primeras if p), default=None)
+    if not dia:
+        return []
+    marcados = set(DiaConsolidado.objects.filter(fecha__gte=dia, fecha__lt=hasta).values_list('fecha', flat=True))
+    pendientes = set()
+    while dia < hasta:
+        if dia not in marcados:
+            pendientes.add(dia)
+        dia += datetime.timedelta(days=1)
+    marca = DiaConsolidado.objects.aggregate(m=Max('hasta_venta_id'))['m'] or 0
+    if marca:
+        pendientes.update(
+            Venta.objects.filter(id__gt=marca, fecha_local__lt=hasta)
+            .values_list('fecha_local', flat=True).order_by().distinct()
+        )
+    return sorted(pendientes)
+
+
+def invalidar_dia(dia):
+    """Quita la marca de consolidado (el día vuelve a leerse desde las ventas).
+
+    Si el día tiene ventas archivadas se consolida de nuevo en el acto: los
+    tramos crudos no leen el archivo.
+    """
+    DiaConsolidado.objects.filter(fecha=dia).delete()
+    if VentaArchivada.objects.filter(fecha_local=dia).exists():
+        consolidar_dia(dia)
+
+
+_estado = threading.local()
+
+
+@contextmanager
+def borrado_masivo(limpiar_al_salir=True):
+    """Contexto para borrar ventas en bloque (p. ej. limpiar el historial).
+
+    Dentro del bloque las señales de borrado no invalidan día por día (una
+    consulta por venta); al salir se limpian todos los resúmenes de una vez.
+    Con ``limpiar_al_salir=False`` los resúmenes se conservan: el archivado
+    quita ventas de días ya consolidados sin cambiar sus totales.
+    """
+    _estado.masivo = True
+    try:
+        yield
+    finally:
+        _estado.masivo = False
+        if limpiar_al_salir:
+            limpiar()
+
+
+def en_borrado_masivo():
+    return getattr(_estado, 'masivo', False)
+
+
+def limpiar():
+    """Elimina todos los resúmenes (p. ej. tras borrar el historial de ventas).
+
+    Los días con ventas archivadas se vuelven a consolidar en la misma
+    transacción: los tramos crudos no leen el archivo, así que un lector nunca
+    debe encontrarlos sin resumen. También invalida los resultados cacheados
+    (al confirmarse la transacción de quien llama): quien llama a ``limpiar``
+    acaba de modificar ventas en bloque, sin pasar por las señales.
+    """
+    with transaction.atomic():
+        DiaConsolidado.objects.all().delete()
+        ResumenDiarioVentas.objects.all().delete()
+        ResumenDiarioProducto.objects.all().delete()
+        archivados = list(VentaArchivada.objects.exclude(fecha_local=None).order_by()
+                          .values_list('fecha_local', flat=True).distinct())
+        for dia in archivados:
+            consolidar_dia(dia)
+    versiones.invalidar_al_confirmar(versiones.VENTAS)
@@ -0,0 +1,56 @@
+# reports/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from cashier.models import Venta, VentaDetalle
+from products.models import Product
+from sucursales.models import Sucursal
+
+from . import versiones
+
+# Campos de Product que aparecen en los reportes (el stock no)
+CAMPOS_CATALOGO = {'nombre', 'producto_id', 'precio_compra', 'precio_venta'}
+
+
+def _invalidar_si_pasado(venta):
+    """Una venta guardada con fecha de un día ya cerrado invalida su resumen."""
+    if venta is None or venta.fecha is None:
+        return
+    dia = venta.fecha_local or timezone.localtime(venta.fecha).date()
+    if dia < timezone.localdate():
+        from .rollup import invalidar_dia
+        invalidar_dia(dia)
+
+
+@receiver(post_save, sender=Venta)
+def venta_guardada(sender, instance, **kwargs):
+    _invalidar_si_pasado(instance)
+    versiones.invalidar_al_confirmar(versiones.VENTAS)
+
+
+@receiver(post_delete, sender=Venta)
+def venta_borrada(sender, instance, **kwargs):
+    from .rollup import en_borrado_masivo
+    if en_borrado_masivo():
+        return  # borrado_masivo se ocupa de los resúmenes al terminar
+    _invalidar_si_pasado(instance)
+    versiones.invalidar_al_confirmar(versiones.VENTAS)
+
+
+@receiver(post_save, sender=VentaDetalle)
+def detalle_guardado(sender, instance, **kwargs):
+    _invalidar_si_pasado(instance.venta)
+    versiones.invalidar_al_confirmar(versiones.VENTAS)
+
+
+@receiver(post_save, sender=Product)
+def producto_guardado(sender, instance, update_fields=None, **kwargs):
+    # El checkout descuenta stock con save(update_fields=['stock']) en cada línea
+    if update_fields is None or CAMPOS_CATALOGO.intersection(update_fields):
+        versiones.invalidar_al_confirmar(versiones.CATALOGO)
+
+
+@receiver([post_save, post_delete], sender=Sucursal)
+def sucursal_modificada(sender, instance, **kwargs):
+    versiones.invalidar_al_confirmar(versiones.CATALOGO)
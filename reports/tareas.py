@@ -0,0 +1,212 @@
+"""Cola de tareas en la base de datos para el trabajo pesado, sin broker externo.
+
+Los requests encolan con ``encolar`` y responden de inmediato; el comando
+``run_worker`` (uno o más procesos, cada uno con un pool de hilos) reserva las
+tareas pendientes y las ejecuta fuera de los workers de gunicorn.
+
+- La reserva usa ``SELECT ... FOR UPDATE SKIP LOCKED`` en Postgres: varios
+  workers toman tareas distintas sin esperarse entre sí. En SQLite (sin SKIP
+  LOCKED, un escritor a la vez) la marca es un UPDATE condicionado a que la
+  tarea siga ``pendiente``: de los que compiten, sólo uno la obtiene.
+- Encolar dentro de una transacción es seguro: el worker ve la tarea recién
+  cuando se confirma, junto con los datos que necesita.
+- Si la función lanza una excepción la tarea vuelve a ``pendiente`` con una
+  espera de ``TASKS_RETRY_DELAY * 2 ** (intento - 1)`` segundos, hasta
+  ``max_intentos``; después queda ``fallida`` con el traceback en ``error``.
+- El worker marca un latido en sus tareas en curso. Las que llevan más de
+  ``TASKS_STALE_AFTER`` segundos sin latido (worker muerto o reiniciado) se
+  tratan como un intento fallido.
+- Con ``TASKS_RUN_INLINE`` (por defecto igual a ``DEBUG``) la tarea se
+  ejecuta al encolarla, en el mismo proceso (desarrollo sin worker, pruebas),
+  salvo que se encole con ``en_linea=False``.
+  Sin él hace falta ``run_worker``; si al encolar hay tareas esperando hace
+  más de ``TASKS_STALE_AFTER`` segundos se registra una advertencia.
+- Un worker sólo cierra la tarea que sigue en curso a su nombre: si
+  ``rescatar`` ya la devolvió a la cola, su resultado no la pisa.
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_CANDIDATAS = 10  # tareas que se intenta marcar por reserva sin SKIP LOCKED
+
+
+def nombre_trabajador():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def encolar(funcion, *, max_intentos=3, demora=0, en_linea=True, **argumentos):
+    """Encola ``funcion`` (ruta importable) con ``argumentos`` serializables a JSON.
+
+    La función recibe la ``Tarea`` (para ``tarea.avanzar``) y los argumentos
+    como keywords; lo que retorne se guarda en ``tarea.resultado``. Con
+    ``en_linea=False`` la tarea sólo se encola aunque ``TASKS_RUN_INLINE``
+    esté activo (trabajo que un request no debe pagar).
+    """
+    import_string(funcion)  # una ruta mal escrita falla aquí y no en el worker
+    tarea = Tarea.objects.create(
+        funcion=funcion, argumentos=argumentos, max_intentos=max(1, max_intentos),
+        disponible=timezone.now() + datetime.timedelta(seconds=demora),
+    )
+    if en_linea and getattr(settings, 'TASKS_RUN_INLINE', False) and not demora:
+        reservada = _marcar(tarea.pk, 'inline')
+        if reservada is not None:
+            ejecutar(reservada)
+            tarea.refresh_from_db()
+    else:
+        _advertir_sin_worker()
+    return tarea
+
+
+def _advertir_sin_worker():
+    """Advierte si hay tareas disponibles que ningún worker reclama hace más de ``TASKS_STALE_AFTER`` segundos."""
+    espera = getattr(settings, 'TASKS_STALE_AFTER', 300)
+    limite = timezone.now() - datetime.timedelta(seconds=espera)
+    if Tarea.objects.filter(estado=Tarea.ESTADO_PENDIENTE, disponible__lt=limite).exists():
+        logger.warning('Hay tareas pendientes sin reclamar hace más de %s s: ¿está corriendo run_worker? '
+                       '(o TASKS_RUN_INLINE=true para ejecutarlas en el proceso web)', espera)
+
+
+def _marcar(pk, trabajador):
+    """Pasa la tarea ``pk`` de pendiente a en curso; ``None`` si otro la tomó antes."""
+    ahora = timezone.now()
+    marcadas = Tarea.objects.filter(pk=pk, estado=Tarea.ESTADO_PENDIENTE).update(
+        estado=Tarea.ESTADO_EN_CURSO, trabajador=trabajador, intentos=F('intentos') + 1,
+        iniciada=ahora, latido=ahora,
+    )
+    return Tarea.objects.get(pk=pk) if marcadas else None
+
+
+def reservar(trabajador):
+    """Marca en curso la próxima tarea disponible para ``trabajador`` y la retorna (o ``None``)."""
+    disponibles = Tarea.objects.filter(
+        estado=Tarea.ESTADO_PENDIENTE, disponible__lte=timezone.now(),
+    ).order_by('disponible', 'pk')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = disponibles.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            return _marcar(pk, trabajador) if pk is not None else None
+    # Sin transacción: en SQLite un SELECT seguido de UPDATE en la misma
+    # transacción puede fallar al subir de lectura a escritura
+    for pk in list(disponibles.values_list('pk', flat=True)[:_CANDIDATAS]):
+        tarea = _marcar(pk, trabajador)
+        if tarea is not None:
+            return tarea
+    return None
+
+
+def ejecutar(tarea):
+    """Corre una tarea ya reservada y guarda su resultado o el fallo."""
+    try:
+        resultado = import_string(tarea.funcion)(tarea, **tarea.argumentos)
+        Tarea.objects.filter(pk=tarea.pk, estado=Tarea.ESTADO_EN_CURSO, trabajador=tarea.trabajador).update(
+            estado=Tarea.ESTADO_COMPLETADA, progreso=100, resultado=resultado, finalizada=timezone.now(),
+        )
+    except Exception:
+        _fallo(tarea, traceback.format_exc(), estado=Tarea.ESTADO_EN_CURSO, trabajador=tarea.trabajador)
+
+
+def _fallo(tarea, detalle, **condicion):
+    """Reintenta la tarea con espera creciente o la da por fallida si agotó sus intentos."""
+    ahora = timezone.now()
+    tareas = Tarea.objects.filter(pk=tarea.pk, **condicion)
+    if tarea.intentos < tarea.max_intentos:
+        espera = getattr(settings, 'TASKS_RETRY_DELAY', 30) * 2 ** max(0, tarea.intentos - 1)
+        logger.warning('Tarea %s (%s) falló en el intento %s de %s; se reintenta en %s s',
+                       tarea.pk, tarea.funcion, tarea.intentos, tarea.max_intentos, espera)
+        tareas.update(estado=Tarea.ESTADO_PENDIENTE, disponible=ahora + datetime.timedelta(seconds=espera),
+                      trabajador='', error=detalle)
+    else:
+        logger.error('Tarea %s (%s) falló tras %s intentos\n%s', tarea.pk, tarea.funcion, tarea.intentos, detalle)
+        tareas.update(estado=Tarea.ESTADO_FALLIDA, error=detalle, finalizada=ahora)
+
+
+def latir(pks):
+    """Renueva el latido de las tareas en curso ``pks`` de este proceso."""
+    if pks:
+        Tarea.objects.filter(pk__in=list(pks), estado=Tarea.ESTADO_EN_CURSO).update(latido=timezone.now())
+
+
+def rescatar():
+    """Trata como intento fallido las tareas en curso sin latido hace más de ``TASKS_STALE_AFTER`` segundos."""
+    limite = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'TASKS_STALE_AFTER', 300))
+    perdidas = list(Tarea.objects.filter(estado=Tarea.ESTADO_EN_CURSO, latido__lt=limite))
+    for tarea in perdidas:
+        _fallo(tarea, f'Sin latido del worker {tarea.trabajador} desde {tarea.latido:%Y-%m-%d %H:%M:%S}.',
+               estado=Tarea.ESTADO_EN_CURSO, latido__lt=limite)
+    return len(perdidas)
+
+
+def ejecutar_pendientes(trabajador=None):
+    """Ejecuta en este hilo las tareas disponibles ahora, hasta vaciar la cola; retorna cuántas."""
+    trabajador = trabajador or nombre_trabajador()
+    n = 0
+    while (tarea := reservar(trabajador)) is not None:
+        ejecutar(tarea)
+        n += 1
+    return n
+
+
+def _hilo(trabajador, en_curso, detener, espera):
+    try:
+        while not detener.is_set():
+            close_old_connections()
+            try:
+                tarea = reservar(trabajador)
+            except Exception:
+                logger.exception('No se pudo reservar una tarea; se reintenta en %s s', espera)
+                tarea = None
+            if tarea is None:
+                detener.wait(espera)
+                continue
+            en_curso.add(tarea.pk)
+            try:
+                ejecutar(tarea)
+            finally:
+                en_curso.discard(tarea.pk)
+    finally:
+        connection.close()
+
+
+def trabajar(trabajador, hilos, detener, espera=1.0):
+    """Bucle de un proceso worker hasta que se active ``detener`` (``threading.Event``).
+
+    ``hilos`` hilos reservan y ejecutan tareas, esperando ``espera`` segundos
+    cuando la cola está vacía; este hilo renueva los latidos y rescata las
+    tareas de workers muertos. Al detenerse, las tareas en curso terminan.
+    """
+    en_curso = set()
+    pool = [
+        threading.Thread(target=_hilo, args=(f'{trabajador}/{i}', en_curso, detener, espera),
+                         name=f'tareas-{i}')
+        for i in range(max(1, hilos))
+    ]
+    for hilo in pool:
+        hilo.start()
+    intervalo = min(30, getattr(settings, 'TASKS_STALE_AFTER', 300) / 3)
+    try:
+        while not detener.wait(intervalo):
+            try:
+                close_old_connections()
+                latir(set(en_curso))
+                rescatar()
+            except Exception:
+                logger.exception('Falló el mantenimiento de la cola de tareas')
+    finally:
+        detener.set()
+        for hilo in pool:
+            hilo.join()
+        connection.close()
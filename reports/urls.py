@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'reports'
@@ -17,6 +17,8 @@ urlpatterns = [
     path('advanced/export/comparacion_sucursal.csv', views.export_branch_comparison_csv, name='export_branch_comparison_csv'),
     path('advanced/export/full.pdf', views.export_advanced_pdf, name='export_advanced_pdf'),
     path('advanced/export/full.docx', views.export_advanced_docx, name='export_advanced_docx'),
+    re_path(r'^advanced/export/estado/(?P<clave>[0-9a-f]{40})\.(?P<formato>pdf|docx)$', views.export_estado, name='export_estado'),
+    re_path(r'^advanced/export/doc/(?P<clave>[0-9a-f]{40})\.(?P<formato>pdf|docx)$', views.export_descarga, name='export_descarga'),
     path('advanced/data/', views.advanced_reports_data, name='advanced_reports_data'),
     path('limpiar_historial/', views.limpiar_historial_caja, name='limpiar_historial_caja'),
     path('limpiar_historial_ventas/', views.limpiar_historial_ventas, name='limpiar_historial_ventas'),
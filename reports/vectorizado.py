@@ -0,0 +1,87 @@
+"""Agregaciones vectorizadas (NumPy) para los reportes.
+
+Los montos viajan como centavos enteros (``int64``) y se agrupan con
+``np.add.at`` sobre índices densos, así que las sumas son exactas. Los
+redondeos replican los de ``Decimal`` usados en el resto del sistema:
+
+- ``dividir_redondeado``: mitad hacia afuera, como ``products.pricing`` y
+  ``quantize(..., ROUND_HALF_UP)`` (precios netos).
+- ``dividir_par``: mitad al par, como ``quantize(Decimal('0.01'))`` con el
+  contexto por defecto (porcentajes y tickets promedio de los reportes).
+
+Se asumen divisores positivos, igual que ``products.pricing``.
+"""
+import numpy as np
+
+from products.pricing import IVA_CENTESIMAS
+
+
+def columna(rows, campo, dtype=np.int64):
+    """Columna ``campo`` de una lista de dicts como arreglo (``None`` = 0)."""
+    return np.fromiter((row[campo] or 0 for row in rows), dtype=dtype, count=len(rows))
+
+
+def columna_centavos(rows, campo):
+    """Montos Decimal de 2 decimales → centavos ``int64``."""
+    return np.fromiter((int((row[campo] or 0) * 100) for row in rows), dtype=np.int64, count=len(rows))
+
+
+def codificar(valores):
+    """Códigos densos para valores hashables: ``(codigos, unicos)``."""
+    indice = {}
+    codigos = np.fromiter((indice.setdefault(v, len(indice)) for v in valores), dtype=np.int64, count=len(valores))
+    return codigos, list(indice)
+
+
+def sumar_por(codigos, tamano, *valores):
+    """Suma cada arreglo de ``valores`` agrupado por ``codigos`` (``0..tamano-1``)."""
+    resultado = []
+    for valor in valores:
+        acumulado = np.zeros(tamano, dtype=np.int64)
+        np.add.at(acumulado, codigos, valor)
+        resultado.append(acumulado)
+    return resultado
+
+
+def dividir_redondeado(num, den):
+    """``num / den`` entero con redondeo mitad hacia afuera (``den`` > 0)."""
+    num = np.asarray(num, dtype=np.int64)
+    magnitud = (2 * np.abs(num) + den) // (2 * den)
+    return np.where(num >= 0, magnitud, -magnitud)
+
+
+def dividir_par(num, den):
+    """``num / den`` entero con redondeo mitad al par (``den`` > 0, escalar o arreglo)."""
+    cociente, resto = np.divmod(np.asarray(num, dtype=np.int64), den)
+    doble = 2 * resto
+    sube = (doble > den) | ((doble == den) & (cociente % 2 == 1))
+    return cociente + sube
+
+
+def neto_centavos(centavos):
+    """Centavos sin IVA (``/ 1.19`` redondeado mitad hacia afuera)."""
+    return dividir_redondeado(np.asarray(centavos, dtype=np.int64) * 100, IVA_CENTESIMAS)
+
+
+def porcentaje_centesimas(parte, total):
+    """Centésimas de ``parte / total * 100`` (0 donde ``total`` no es positivo)."""
+    parte = np.asarray(parte, dtype=np.int64)
+    total = np.asarray(total, dtype=np.int64)
+    positivo = total > 0
+    resultado = np.zeros(len(total), dtype=np.int64)
+    if positivo.any():
+        resultado[positivo] = dividir_par(parte[positivo] * 10000, total[positivo])
+    return resultado
+
+
+def agregar_lineas(producto, cantidad, precio_c, costo_c, tamano):
+    """Unidades, ingreso neto y costo neto (centavos) por producto.
+
+    Cada línea usa su precio y costo unitarios sin IVA redondeados antes de
+    multiplicar por la cantidad, igual que ``reports.rollup.hechos``.
+    """
+    cantidad = np.asarray(cantidad, dtype=np.int64)
+    return sumar_por(
+        producto, tamano, cantidad,
+        cantidad * neto_centavos(precio_c), cantidad * neto_centavos(costo_c),
+    )
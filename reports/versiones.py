@@ -0,0 +1,78 @@
+"""Versiones de los datos que alimentan los reportes (invalidación de caché).
+
+Cada versión es un token opaco guardado en la caché compartida. Los
+resultados cacheados (ver ``analytics.compute_analytics``) incluyen los tokens
+vigentes en su clave, de modo que invalidar es sólo cambiar el token: las
+entradas anteriores dejan de leerse y expiran solas.
+
+- ``ventas``: checkout, edición o borrado de ventas, limpiezas y backfills.
+- ``catalogo``: productos (nombres, costos) y sucursales.
+
+Las señales y las limpiezas cambian el token con ``invalidar_al_confirmar``:
+recién cuando la transacción de la venta se confirma y una sola vez por
+transacción. Así la fila del token (caché en base de datos) no queda
+bloqueada mientras dura un checkout, y con redis/locmem/archivo ningún lector
+reconstruye un resultado desde datos aún sin confirmar bajo el token nuevo.
+"""
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+VENTAS = 'ventas'
+CATALOGO = 'catalogo'
+
+_TIMEOUT = None  # sin expiración: perder el token sólo fuerza un recálculo
+
+# ``desde``: momento del último cambio (un token recién creado cuenta como ahora)
+Version = namedtuple('Version', 'token desde')
+
+
+def _nueva():
+    return Version(uuid.uuid4().hex, timezone.now())
+
+
+def _clave(nombre):
+    return f'reports:version:{nombre}'
+
+
+def actuales():
+    """Retorna ``(version_ventas, version_catalogo)`` (``Version``), creando las que falten."""
+    claves = {nombre: _clave(nombre) for nombre in (VENTAS, CATALOGO)}
+    valores = cache.get_many(list(claves.values()))
+    faltantes = {clave: _nueva() for clave in claves.values() if clave not in valores}
+    if faltantes:
+        cache.set_many(faltantes, _TIMEOUT)
+        valores.update(faltantes)
+    return Version(*valores[claves[VENTAS]]), Version(*valores[claves[CATALOGO]])
+
+
+def invalidar(*nombres):
+    """Cambia el token de las versiones indicadas (por defecto, todas)."""
+    cache.set_many({_clave(nombre): _nueva() for nombre in (nombres or (VENTAS, CATALOGO))}, _TIMEOUT)
+
+
+class _Invalidacion:
+    """Callback ``on_commit`` que junta las versiones a invalidar de una transacción."""
+
+    def __init__(self, nombres):
+        self.nombres = set(nombres)
+        self.pendiente = True
+
+    def __call__(self):
+        self.pendiente = False
+        invalidar(*self.nombres)
+
+
+def invalidar_al_confirmar(*nombres):
+    """Como ``invalidar``, pero al confirmarse la transacción en curso (de inmediato fuera de una)."""
+    nombres = nombres or (VENTAS, CATALOGO)
+    conexion = transaction.get_connection()
+    if conexion.in_atomic_block:
+        for _, pendiente, _ in conexion.run_on_commit:
+            if isinstance(pendiente, _Invalidacion) and pendiente.pendiente:
+                pendiente.nombres.update(nombres)
+                return
+    transaction.on_commit(_Invalidacion(nombres))
@@ -1,15 +1,16 @@
 import logging
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.paginator import Paginator
 from django.utils.dateparse import parse_date
-from django.db.models import Q, Sum, F, Count
+from django.db.models import Q, Sum, F, Count, Case, When, OuterRef, Subquery, DecimalField
 from django.db.models.functions import Cast
 from django.utils import timezone
 import datetime
+import time
 from decimal import Decimal, ROUND_HALF_UP
 from django.http import JsonResponse
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
 from django.core.cache import cache
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 from django.contrib.auth import get_user_model
@@ -29,8 +30,9 @@ from docx import Document as DocxDocument
 
 User = get_user_model()
 
-from cashier.models import Venta, VentaDetalle, AperturaCierreCaja  
+from cashier.models import Venta, VentaArchivada, AperturaCierreCaja  
 from sucursales.models import Sucursal  # Importar desde la app 'sucursales'
+from . import exportaciones, exportar, historico, paginacion, rollup
 
 logger = logging.getLogger(__name__)
 
@@ -64,32 +66,31 @@ def sales_history(request):
     fecha_inicio = request.GET.get('fecha_inicio')
     fecha_fin = request.GET.get('fecha_fin')
     empleado_id = request.GET.get('empleado')
-    page = request.GET.get('page', 1)
 
-    ventas = Venta.objects.all().order_by('-fecha')
+    # Ventas calientes y archivadas con los mismos filtros (ver reports.historico)
+    ventas = [modelo.objects.select_related('empleado') for modelo, _ in rollup.FUENTES]
 
     if fecha_inicio:
         try:
             fecha_inicio_obj = timezone.make_aware(datetime.datetime.strptime(fecha_inicio, '%Y-%m-%d'))
-            ventas = ventas.filter(fecha__gte=fecha_inicio_obj)
+            ventas = [qs.filter(fecha__gte=fecha_inicio_obj) for qs in ventas]
         except ValueError:
-            ventas = Venta.objects.none()
+            ventas = [Venta.objects.none()]
     if fecha_fin:
         try:
             fecha_fin_obj = timezone.make_aware(datetime.datetime.strptime(fecha_fin, '%Y-%m-%d'))
             fecha_fin_obj += datetime.timedelta(days=1, seconds=-1)
-            ventas = ventas.filter(fecha__lte=fecha_fin_obj)
+            ventas = [qs.filter(fecha__lte=fecha_fin_obj) for qs in ventas]
         except ValueError:
-            ventas = Venta.objects.none()
+            ventas = [Venta.objects.none()]
     if empleado_id:
         try:
             empleado_id = int(empleado_id)
-            ventas = ventas.filter(empleado_id=empleado_id)
+            ventas = [qs.filter(empleado_id=empleado_id) for qs in ventas]
         except ValueError:
-            ventas = Venta.objects.none()
+            ventas = [Venta.objects.none()]
 
-    paginator = Paginator(ventas, 8)
-    sales_page = paginator.get_page(page)
+    sales_page = paginacion.paginar(request, ventas, 'fecha', 8, contar=True)
     for sale in sales_page:
         sale.display_total = "$" + format_clp(sale.total)
     empleados = User.objects.all()
@@ -111,7 +112,6 @@ def cash_history(request):
     cajero_filtro = request.GET.get('cajero')
     fecha_inicio_filtro = request.GET.get('fecha_inicio')
     fecha_fin_filtro = request.GET.get('fecha_fin')
-    page = request.GET.get('page', 1)
     per_page_options = [5, 10, 15, 20]
     per_page = request.GET.get('per_page', 10)
     try:
@@ -121,8 +121,20 @@ def cash_history(request):
     if per_page not in per_page_options:
         per_page = 10
 
-    # Se ordena por fecha de apertura (campo "apertura")
-    cajas = AperturaCierreCaja.objects.all().order_by('-apertura')
+    # Total de ventas: las cajas cerradas lo guardaron al cerrar; las abiertas suman
+    # sus ventas por la FK en una subconsulta (la página completa en una sola consulta)
+    ventas_abiertas = (
+        Venta.objects.filter(caja=OuterRef('pk')).order_by().values('caja')
+        .annotate(total=Sum('total')).values('total')
+    )
+    # Se pagina por fecha de apertura (campo "apertura"), más recientes primero
+    cajas = AperturaCierreCaja.objects.select_related('vendedor').annotate(
+        ventas_caja=Case(
+            When(estado='cerrada', then=F('ventas_totales')),
+            default=Subquery(ventas_abiertas),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
     if id_caja_filtro:
         try:
             cajas = cajas.filter(id=int(id_caja_filtro))
@@ -146,16 +158,9 @@ def cash_history(request):
         except ValueError:
             cajas = AperturaCierreCaja.objects.none()
 
-    paginator = Paginator(cajas, per_page)
-    cash_page = paginator.get_page(page)
-    # Para cada caja se recalcula el total de ventas (consultando las ventas registradas en el período)
+    cash_page = paginacion.paginar(request, cajas, 'apertura', per_page)
     for caja in cash_page:
-        ventas_total = Venta.objects.filter(
-            empleado=caja.vendedor,
-            fecha__gte=caja.apertura,
-            fecha__lte=caja.cierre if caja.cierre else timezone.now()
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0.00')
-        caja.formatted_ventas_totales = "$" + format_clp(ventas_total)
+        caja.formatted_ventas_totales = "$" + format_clp(caja.ventas_caja or Decimal('0.00'))
 
     context = {
         'cajas': cash_page,
@@ -176,7 +181,7 @@ def sales_report(request, sale_id):
     Se calculan los valores formateados y se pasan al contexto sin asignarlos a la instancia.
     """
     try:
-        venta = get_object_or_404(Venta, id=sale_id)
+        venta = historico.obtener_venta(sale_id)
         detalles = venta.detalles.all()
         logger.info("Venta %s encontrada con %d detalle(s).", sale_id, detalles.count())
 
@@ -215,237 +220,27 @@ def sales_report(request, sale_id):
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
 @login_required(login_url='login')
 def advanced_reports(request):
-    """JSON endpoint para recargar secciones vía AJAX sin renderizar HTML completo."""
-    # Perfilado ligero para medir tiempos y cantidad de queries (solo primera sección JSON rápida)
-    import time
-    from django.db import connection
-    start_total = time.perf_counter()
-    start_queries = len(getattr(connection, 'queries', []))
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    cajero_filter = request.GET.get('cajero','todos')
-    sucursal_filter = request.GET.get('sucursal','todos')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-    ventas_qs = Venta.objects.filter(fecha__gte=fecha_inicio, fecha__lte=fecha_fin)
-    t_filtrado = time.perf_counter()
-    if cajero_filter and cajero_filter != 'todos':
-        try:
-            ventas_qs = ventas_qs.filter(empleado_id=int(cajero_filter))
-        except ValueError:
-            pass
-    if sucursal_filter and sucursal_filter != 'todos':
-        try:
-            ventas_qs = ventas_qs.filter(sucursal_id=int(sucursal_filter))
-        except ValueError:
-            pass
-    # Reutilizar partes ligeras (serie diaria, branch, hourly, rentabilidad, ranking, heatmap)
-    daily = (
-        ventas_qs.extra({'day': "DATE(fecha)"})
-        .values('day')
-        .annotate(ingreso=Sum('total'))
-        .order_by('day')
-    )
-    t_daily = time.perf_counter()
-    daily_chart = []
-    for row in daily:
-        day_raw = row['day']
-        # Normalizar a date
-        if isinstance(day_raw, datetime.datetime):
-            day_date = day_raw.date()
-        elif isinstance(day_raw, datetime.date):
-            day_date = day_raw
-        elif isinstance(day_raw, str):
-            parsed = None
-            for fmt in ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S'):
-                try:
-                    parsed = datetime.datetime.strptime(day_raw[:19], fmt).date()
-                    break
-                except ValueError:
-                    continue
-            if not parsed:
-                # Si no se puede parsear se usa el string original para key y se salta cálculos detallados
-                day_date = None
-            else:
-                day_date = parsed
-        else:
-            day_date = None
-
-        ingreso_dia = row['ingreso'] or Decimal('0.00')
-        ganancia_neta_dia = Decimal('0.00')
-        if day_date:
-            detalles_dia = VentaDetalle.objects.filter(venta__fecha__date=day_date, venta__in=ventas_qs)
-            costo_dia = Decimal('0.00')
-            for det in detalles_dia:
-                costo_dia += (det.producto.precio_compra or Decimal('0.00')) * det.cantidad
-            ingreso_sin_iva_dia = (ingreso_dia / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso_dia else Decimal('0.00')
-            costo_sin_iva_dia = (costo_dia / Decimal('1.19')).quantize(Decimal('0.01')) if costo_dia else Decimal('0.00')
-            ganancia_neta_dia = ingreso_sin_iva_dia - costo_sin_iva_dia
-        day_str = day_date.strftime('%Y-%m-%d') if day_date else (day_raw if isinstance(day_raw, str) else '')
-        daily_chart.append({'day': day_str, 'ingreso': float(ingreso_dia), 'ganancia_neta': float(ganancia_neta_dia)})
-    # Branch comparison
-    branch_comp = []
-    for suc in Sucursal.objects.all():
-        ventas_suc = ventas_qs.filter(sucursal_id=suc.id)
-        ingreso_suc = ventas_suc.aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-        detalles_suc = VentaDetalle.objects.filter(venta__in=ventas_suc)
-        costo_suc = Decimal('0.00')
-        for det in detalles_suc:
-            costo_suc += (det.producto.precio_compra or Decimal('0.00')) * det.cantidad
-        ingreso_sin_iva_suc = (ingreso_suc / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso_suc else Decimal('0.00')
-        costo_sin_iva_suc = (costo_suc / Decimal('1.19')).quantize(Decimal('0.01')) if costo_suc else Decimal('0.00')
-        ganancia_neta_suc = ingreso_sin_iva_suc - costo_sin_iva_suc
-        branch_comp.append({'sucursal': suc.nombre, 'ingreso': float(ingreso_suc), 'ganancia_neta': float(ganancia_neta_suc)})
-    t_branch = time.perf_counter()
-    # Hourly distribution
-    hourly = [ {'hora': h, 'ventas': 0, 'ingreso': 0.0} for h in range(24) ]
-    for v in ventas_qs:
-        h = v.fecha.hour
-        hourly[h]['ventas'] += 1
-        hourly[h]['ingreso'] += float(v.total or 0)
-    # Ranking cajeros
-    rank_temp = {}
-    for v in ventas_qs.select_related('empleado'):
-        uid = v.empleado_id
-        e = rank_temp.get(uid)
-        if not e:
-            e = {'usuario': v.empleado.username, 'ventas_count': 0, 'ingreso_total': Decimal('0.00')}
-        e['ventas_count'] += 1
-        e['ingreso_total'] += v.total or Decimal('0.00')
-        rank_temp[uid] = e
-    ranking = []
-    for _, d in rank_temp.items():
-        ticket_prom = (d['ingreso_total'] / d['ventas_count']).quantize(Decimal('0.01')) if d['ventas_count'] else Decimal('0.00')
-        ranking.append({'usuario': d['usuario'], 'ventas_count': d['ventas_count'], 'ingreso_total': float(d['ingreso_total']), 'ticket_promedio': float(ticket_prom)})
-    ranking.sort(key=lambda x: x['ingreso_total'], reverse=True)
-    t_ranking = time.perf_counter()
-    # Heatmap
-    heatmap = [[{'ventas':0,'ingreso':0.0} for _ in range(24)] for _ in range(7)]
-    for v in ventas_qs:
-        dow = v.fecha.weekday(); hour = v.fecha.hour
-        cell = heatmap[dow][hour]
-        cell['ventas'] += 1
-        cell['ingreso'] += float(v.total or 0)
-    t_heatmap = time.perf_counter()
-    profiling_json = {
-        'ms_filtrado': round((t_filtrado - start_total)*1000,2),
-        'ms_daily': round((t_daily - t_filtrado)*1000,2),
-        'ms_branch': round((t_branch - t_daily)*1000,2),
-        'ms_ranking': round((t_ranking - t_branch)*1000,2),
-        'ms_heatmap': round((t_heatmap - t_ranking)*1000,2),
-        'ms_total_json': round((time.perf_counter() - start_total)*1000,2),
-        'queries_total_json': len(getattr(connection, 'queries', [])) - start_queries,
-    }
-    # Guardar profiling_json para contexto; no retornamos aquí para permitir render HTML completo
-    # (Sección HTML completa) usar helper para generar contexto extendido
-    from .analytics import compute_analytics
-    analytics = compute_analytics(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter)
-    # --- Custom comparison range override (only for comparativo section) ---
+    """Dashboard avanzado (HTML).
+
+    Sólo calcula los KPIs y el comparativo (lecturas de la tabla de ventas o
+    sus resúmenes), así que el primer pintado no espera a las secciones
+    pesadas; la página pide el resto a ``advanced_reports_data``.
+    """
+    from .analytics import compute_analytics, comparativo_personalizado, consulta
+    params = consulta(request.GET)
+    analytics = compute_analytics(params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                                  top=params.top, secciones=('kpis', 'comparativo'))
+    # Rango de comparación personalizado (sólo afecta la sección comparativa)
     comp_inicio_str = request.GET.get('comparativo_inicio')
     comp_fin_str = request.GET.get('comparativo_fin')
-    custom_comparativo_used = False
-    if comp_inicio_str and comp_fin_str:
-        try:
-            comp_inicio = timezone.make_aware(datetime.datetime.strptime(comp_inicio_str, '%Y-%m-%d'))
-            comp_fin = timezone.make_aware(datetime.datetime.strptime(comp_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-            if comp_inicio <= comp_fin:
-                # Recompute only comparative metrics for custom range
-                ventas_prev_custom = Venta.objects.filter(fecha__gte=comp_inicio, fecha__lte=comp_fin)
-                if cajero_filter and cajero_filter != 'todos':
-                    try:
-                        ventas_prev_custom = ventas_prev_custom.filter(empleado_id=int(cajero_filter))
-                    except ValueError:
-                        pass
-                if sucursal_filter and sucursal_filter != 'todos':
-                    try:
-                        ventas_prev_custom = ventas_prev_custom.filter(sucursal_id=int(sucursal_filter))
-                    except ValueError:
-                        pass
-                ingreso_prev = ventas_prev_custom.aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-                detalles_prev = VentaDetalle.objects.filter(venta__in=ventas_prev_custom)
-                cmv_prev_val = detalles_prev.aggregate(cmv_prev=Sum(F('cantidad') * F('producto__precio_compra')))['cmv_prev'] or 0
-                cmv_prev = Decimal(str(cmv_prev_val))
-                ingreso_sin_iva_prev = (ingreso_prev / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso_prev else Decimal('0.00')
-                costo_prev_net = (cmv_prev / Decimal('1.19')).quantize(Decimal('0.01')) if cmv_prev else Decimal('0.00')
-                ganancia_neta_prev = ingreso_sin_iva_prev - costo_prev_net
-                num_transacciones_prev = ventas_prev_custom.count()
-                margen_prev = ((ganancia_neta_prev / ingreso_sin_iva_prev) * Decimal('100')).quantize(Decimal('0.01')) if ingreso_sin_iva_prev > 0 else Decimal('0.00')
-                def delta_pct(current: Decimal, previous: Decimal):
-                    delta = (current - previous)
-                    if previous == 0:
-                        pct = Decimal('100.00') if current > 0 else Decimal('0.00')
-                    else:
-                        pct = ((delta / previous) * Decimal('100')).quantize(Decimal('0.01'))
-                    return delta, pct
-                ingreso_delta, ingreso_pct = delta_pct(analytics['ingreso_total'], ingreso_prev)
-                ganancia_neta_delta, ganancia_neta_pct = delta_pct(analytics['ganancia_neta'], ganancia_neta_prev)
-                transacciones_delta, transacciones_pct = delta_pct(Decimal(analytics['num_transacciones']), Decimal(num_transacciones_prev))
-                margen_delta, margen_pct = delta_pct(analytics['margen'], margen_prev)
-                # Override analytics comparative keys for context only
-                analytics.update({
-                    'prev_inicio': comp_inicio,
-                    'prev_fin': comp_fin,
-                    'ingreso_prev': ingreso_prev,
-                    'ganancia_neta_prev': ganancia_neta_prev,
-                    'num_transacciones_prev': num_transacciones_prev,
-                    'margen_prev': margen_prev,
-                    'ingreso_delta': ingreso_delta,
-                    'ingreso_pct': ingreso_pct,
-                    'ganancia_neta_delta': ganancia_neta_delta,
-                    'ganancia_neta_pct': ganancia_neta_pct,
-                    'transacciones_delta': transacciones_delta,
-                    'transacciones_pct': transacciones_pct,
-                    'margen_delta': margen_delta,
-                    'margen_pct': margen_pct,
-                    'participacion_ingreso': (ingreso_prev / analytics['ingreso_total'] * Decimal('100')).quantize(Decimal('0.01')) if analytics['ingreso_total'] else Decimal('0.00'),
-                    'participacion_ganancia': (ganancia_neta_prev / analytics['ganancia_neta'] * Decimal('100')).quantize(Decimal('0.01')) if analytics['ganancia_neta'] else Decimal('0.00'),
-                })
-                custom_comparativo_used = True
-        except ValueError:
-            pass
-    filtro_top = request.GET.get('top', 10)
-    try:
-        filtro_top = int(filtro_top)
-    except ValueError:
-        filtro_top = 10
-    # Recalcular top_selling_products separado para mantener comportamiento previo
-    ventas_full = Venta.objects.filter(fecha__gte=fecha_inicio, fecha__lte=fecha_fin)
-    if cajero_filter and cajero_filter != 'todos':
-        try:
-            ventas_full = ventas_full.filter(empleado_id=int(cajero_filter))
-        except ValueError:
-            pass
-    if sucursal_filter and sucursal_filter != 'todos':
-        try:
-            ventas_full = ventas_full.filter(sucursal_id=int(sucursal_filter))
-        except ValueError:
-            pass
-    top_selling_products = VentaDetalle.objects.filter(venta__in=ventas_full).values('producto__nombre').annotate(total_cantidad=Sum('cantidad')).order_by('-total_cantidad')[:filtro_top]
+    personalizado = comparativo_personalizado(analytics, comp_inicio_str, comp_fin_str, params.cajero, params.sucursal)
+    custom_comparativo_used = personalizado is not None
+    if custom_comparativo_used:
+        analytics.update(personalizado)
 
     def fmt_money(val: Decimal):
         return "$" + format_clp(val or 0)
 
-    # Calcular promedios de rentabilidad (ganancia neta y porcentaje)
-    promedio_ganancia_neta = Decimal('0.00')
-    promedio_porcentaje_ganancia = Decimal('0.00')
-    rent_list = analytics['rentabilidad_productos']
-    if rent_list:
-        total_gan_neta = sum(Decimal(str(r['ganancia_neta_total'])) for r in rent_list)
-        promedio_ganancia_neta = (total_gan_neta / Decimal(str(len(rent_list)))).quantize(Decimal('0.01'))
-        total_pct = sum(Decimal(str(r['porcentaje_ganancia'])) for r in rent_list)
-        promedio_porcentaje_ganancia = (total_pct / Decimal(str(len(rent_list)))).quantize(Decimal('0.01'))
     context = {
         'ingreso_total': fmt_money(analytics['ingreso_total']),
         'ingreso_total_sin_iva': fmt_money(analytics['ingreso_total_sin_iva']),
@@ -457,29 +252,13 @@ def advanced_reports(request):
         'num_transacciones': analytics['num_transacciones'],
         'ticket_promedio': fmt_money(analytics['ticket_promedio']),
         'unidades_promedio': format_clp(analytics['unidades_promedio']),
-        'best_selling_product': analytics['best_selling_product'],
-        'best_selling_quantity': analytics['best_selling_quantity'],
         'sales_by_payment': [ {'forma_pago': sp['forma_pago'], 'total_monto': fmt_money(sp['total_monto_raw']) } for sp in analytics['sales_by_payment'] ],
         'sales_by_payment_chart': analytics['sales_by_payment_chart'],
-        'top_selling_products': list(top_selling_products),
-        'fecha_inicio': fecha_inicio_str,
-        'fecha_fin': fecha_fin_str,
-        'filtro_top_actual': filtro_top,
-        'promedio_ganancia_neta': fmt_money(promedio_ganancia_neta),
-    'promedio_ganancia_neta_raw': float(promedio_ganancia_neta),
-    # String with dot as decimal separator for embedding in data- attributes (JS expects dot)
-    'promedio_ganancia_neta_raw_dot': format(promedio_ganancia_neta, '.2f'),
-        'promedio_porcentaje_ganancia': format_clp(promedio_porcentaje_ganancia) + '%',
-        'cajero_actual': cajero_filter,
-        'sucursal_actual': sucursal_filter,
-        'daily_chart': analytics['daily_chart'],
-        'branch_comparison': analytics['branch_comparison'],
-        'hourly_distribution': analytics['hourly_distribution'],
-        'heatmap_matrix': analytics['heatmap_matrix'],
-        'rentabilidad_productos': analytics['rentabilidad_productos'],
-        'ranking_cajeros': analytics['ranking_cajeros'],
-        'wave_labels': analytics['wave_labels'],
-        'wave_gains': analytics['wave_gains'],
+        'fecha_inicio': params.fecha_inicio_str,
+        'fecha_fin': params.fecha_fin_str,
+        'filtro_top_actual': params.top,
+        'cajero_actual': params.cajero,
+        'sucursal_actual': params.sucursal,
         'prev_inicio': analytics['prev_inicio'].strftime('%Y-%m-%d'),
         'prev_fin': analytics['prev_fin'].strftime('%Y-%m-%d'),
         'ingreso_prev': fmt_money(analytics['ingreso_prev']),
@@ -494,9 +273,8 @@ def advanced_reports(request):
         'transacciones_pct': format_clp(analytics['transacciones_pct']) + '%',
         'margen_delta': format_clp(analytics['margen_delta']) + '%',
         'margen_pct': format_clp(analytics['margen_pct']) + '%',
-    'participacion_ingreso': format_clp(analytics.get('participacion_ingreso', Decimal('0')))+'%',
-    'participacion_ganancia': format_clp(analytics.get('participacion_ganancia', Decimal('0')))+'%',
-        'profiling': profiling_json,
+        'participacion_ingreso': format_clp(analytics['participacion_ingreso']) + '%',
+        'participacion_ganancia': format_clp(analytics['participacion_ganancia']) + '%',
         'comparativo_custom': custom_comparativo_used,
         'comparativo_inicio_custom': comp_inicio_str if custom_comparativo_used else '',
         'comparativo_fin_custom': comp_fin_str if custom_comparativo_used else '',
@@ -511,107 +289,37 @@ def advanced_reports(request):
 @login_required
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
 def advanced_reports_data(request):
-    """Nuevo endpoint JSON completo usando compute_analytics sin renderizar HTML."""
-    from .analytics import compute_analytics
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    cajero_filter = request.GET.get('cajero','todos')
-    sucursal_filter = request.GET.get('sucursal','todos')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
+    """Endpoint JSON del dashboard avanzado (sin renderizar HTML).
+
+    Sin parámetros devuelve todas las secciones. Con ``sections=kpis,comparativo``
+    devuelve sólo las pedidas (ver ``analytics.SECCIONES``), de modo que la
+    página pinta los KPIs primero y carga las secciones pesadas en paralelo.
+    Cada sección tiene su propia entrada de caché; el encabezado
+    ``Server-Timing`` informa los milisegundos de cada una.
+    """
+    from .analytics import SECCIONES, compute_sections, comparativo_personalizado, consulta
+    t0 = time.perf_counter()
+    params = consulta(request.GET)
     comp_inicio_str = request.GET.get('comparativo_inicio')
     comp_fin_str = request.GET.get('comparativo_fin')
-    analytics = compute_analytics(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter)
-    # Parametro opcional para limitar Top de productos (default 10)
-    filtro_top = request.GET.get('top', 10)
-    try:
-        filtro_top = int(filtro_top)
-    except ValueError:
-        filtro_top = 10
-    comparativo_meta = {
-        'comparativo_custom': False,
-        'comparativo_inicio': analytics['prev_inicio'].strftime('%Y-%m-%d'),
-        'comparativo_fin': analytics['prev_fin'].strftime('%Y-%m-%d'),
-        'ingreso_prev': float(analytics['ingreso_prev']),
-        'ganancia_neta_prev': float(analytics['ganancia_neta_prev']),
-        'num_transacciones_prev': analytics['num_transacciones_prev'],
-        'margen_prev': float(analytics['margen_prev']),
-        'ingreso_delta': float(analytics['ingreso_delta']),
-        'ingreso_pct': float(analytics['ingreso_pct']),
-        'ganancia_neta_delta': float(analytics['ganancia_neta_delta']),
-        'ganancia_neta_pct': float(analytics['ganancia_neta_pct']),
-        'transacciones_delta': float(analytics['transacciones_delta']),
-        'transacciones_pct': float(analytics['transacciones_pct']),
-        'margen_delta': float(analytics['margen_delta']),
-        'margen_pct': float(analytics['margen_pct']),
-        'participacion_ingreso': float((analytics['ingreso_prev']/analytics['ingreso_total']*Decimal('100')).quantize(Decimal('0.01')) if analytics['ingreso_total'] else Decimal('0.00')),
-        'participacion_ganancia': float((analytics['ganancia_neta_prev']/analytics['ganancia_neta']*Decimal('100')).quantize(Decimal('0.01')) if analytics['ganancia_neta'] else Decimal('0.00')),
-    }
-    if comp_inicio_str and comp_fin_str:
-        try:
-            comp_inicio = timezone.make_aware(datetime.datetime.strptime(comp_inicio_str, '%Y-%m-%d'))
-            comp_fin = timezone.make_aware(datetime.datetime.strptime(comp_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-            if comp_inicio <= comp_fin:
-                ventas_prev_custom = Venta.objects.filter(fecha__gte=comp_inicio, fecha__lte=comp_fin)
-                if cajero_filter and cajero_filter != 'todos':
-                    try: ventas_prev_custom = ventas_prev_custom.filter(empleado_id=int(cajero_filter))
-                    except ValueError: pass
-                if sucursal_filter and sucursal_filter != 'todos':
-                    try: ventas_prev_custom = ventas_prev_custom.filter(sucursal_id=int(sucursal_filter))
-                    except ValueError: pass
-                ingreso_prev = ventas_prev_custom.aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-                detalles_prev = VentaDetalle.objects.filter(venta__in=ventas_prev_custom)
-                cmv_prev_val = detalles_prev.aggregate(cmv_prev=Sum(F('cantidad') * F('producto__precio_compra')))['cmv_prev'] or 0
-                cmv_prev = Decimal(str(cmv_prev_val))
-                ingreso_sin_iva_prev = (ingreso_prev / Decimal('1.19')).quantize(Decimal('0.01')) if ingreso_prev else Decimal('0.00')
-                costo_prev_net = (cmv_prev / Decimal('1.19')).quantize(Decimal('0.01')) if cmv_prev else Decimal('0.00')
-                ganancia_neta_prev = ingreso_sin_iva_prev - costo_prev_net
-                num_transacciones_prev = ventas_prev_custom.count()
-                margen_prev = ((ganancia_neta_prev / ingreso_sin_iva_prev) * Decimal('100')).quantize(Decimal('0.01')) if ingreso_sin_iva_prev > 0 else Decimal('0.00')
-                def delta_pct(current: Decimal, previous: Decimal):
-                    delta = (current - previous)
-                    if previous == 0:
-                        pct = Decimal('100.00') if current > 0 else Decimal('0.00')
-                    else:
-                        pct = ((delta / previous) * Decimal('100')).quantize(Decimal('0.01'))
-                    return delta, pct
-                ingreso_delta, ingreso_pct = delta_pct(analytics['ingreso_total'], ingreso_prev)
-                ganancia_neta_delta, ganancia_neta_pct = delta_pct(analytics['ganancia_neta'], ganancia_neta_prev)
-                transacciones_delta, transacciones_pct = delta_pct(Decimal(analytics['num_transacciones']), Decimal(num_transacciones_prev))
-                margen_delta, margen_pct = delta_pct(analytics['margen'], margen_prev)
-                comparativo_meta.update({
-                    'comparativo_custom': True,
-                    'comparativo_inicio': comp_inicio.strftime('%Y-%m-%d'),
-                    'comparativo_fin': comp_fin.strftime('%Y-%m-%d'),
-                    'ingreso_prev': float(ingreso_prev),
-                    'ganancia_neta_prev': float(ganancia_neta_prev),
-                    'num_transacciones_prev': num_transacciones_prev,
-                    'margen_prev': float(margen_prev),
-                    'ingreso_delta': float(ingreso_delta),
-                    'ingreso_pct': float(ingreso_pct),
-                    'ganancia_neta_delta': float(ganancia_neta_delta),
-                    'ganancia_neta_pct': float(ganancia_neta_pct),
-                    'transacciones_delta': float(transacciones_delta),
-                    'transacciones_pct': float(transacciones_pct),
-                    'margen_delta': float(margen_delta),
-                    'margen_pct': float(margen_pct),
-                    'participacion_ingreso': float((ingreso_prev/analytics['ingreso_total']*Decimal('100')).quantize(Decimal('0.01')) if analytics['ingreso_total'] else Decimal('0.00')),
-                    'participacion_ganancia': float((ganancia_neta_prev/analytics['ganancia_neta']*Decimal('100')).quantize(Decimal('0.01')) if analytics['ganancia_neta'] else Decimal('0.00')),
-                })
-        except ValueError:
-            pass
+    pedidas = request.GET.get('sections')
+    if pedidas:
+        nombres = [n.strip() for n in pedidas.split(',') if n.strip()]
+        desconocidas = [n for n in nombres if n not in SECCIONES]
+        if desconocidas:
+            return JsonResponse({
+                'error': f"Secciones desconocidas: {', '.join(desconocidas)}",
+                'disponibles': list(SECCIONES),
+            }, status=400)
+    else:
+        nombres = list(SECCIONES)
+    # Las variaciones del comparativo se calculan sobre los KPIs del rango
+    requeridas = set(nombres) | ({'kpis'} if 'comparativo' in nombres else set())
+    tiempos = {}
+    analytics = {}
+    for valores in compute_sections(requeridas, params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                                    top=params.top, tiempos=tiempos).values():
+        analytics.update(valores)
     # Formateo monetario liviano en JSON (sin símbolos para facilitar consumo externo)
     def dec_to_float(d):
         if isinstance(d, Decimal):
@@ -624,13 +332,16 @@ def advanced_reports_data(request):
             return str(val)
     json_payload = {
         'params': {
-            'fecha_inicio': fecha_inicio_str,
-            'fecha_fin': fecha_fin_str,
-            'cajero': cajero_filter,
-            'sucursal': sucursal_filter,
-            'top': filtro_top,
+            'fecha_inicio': params.fecha_inicio_str,
+            'fecha_fin': params.fecha_fin_str,
+            'cajero': params.cajero,
+            'sucursal': params.sucursal,
+            'top': params.top,
+            'sections': nombres,
         },
-        'kpis': {
+    }
+    if 'kpis' in nombres:
+        json_payload['kpis'] = {
             'ingreso_total': dec_to_float(analytics['ingreso_total']),
             'ingreso_total_clp': format_clp_plain(analytics['ingreso_total']),
             'ingreso_total_sin_iva': dec_to_float(analytics['ingreso_total_sin_iva']),
@@ -648,10 +359,15 @@ def advanced_reports_data(request):
             'ticket_promedio': dec_to_float(analytics['ticket_promedio']),
             'ticket_promedio_clp': format_clp_plain(analytics['ticket_promedio']),
             'unidades_promedio': analytics['unidades_promedio'],
-            'best_selling_product': analytics['best_selling_product'],
-            'best_selling_quantity': analytics['best_selling_quantity'],
-        },
-        'comparativo': {
+        }
+        # El más vendido sale de las líneas: sólo si también se pidió top_productos
+        if 'top_productos' in nombres:
+            json_payload['kpis'].update({
+                'best_selling_product': analytics['best_selling_product'],
+                'best_selling_quantity': analytics['best_selling_quantity'],
+            })
+    if 'comparativo' in nombres:
+        json_payload['comparativo'] = {
             'prev_inicio': analytics['prev_inicio'].strftime('%Y-%m-%d'),
             'prev_fin': analytics['prev_fin'].strftime('%Y-%m-%d'),
             'ingreso_prev': dec_to_float(analytics['ingreso_prev']),
@@ -670,269 +386,152 @@ def advanced_reports_data(request):
             'transacciones_pct': dec_to_float(analytics['transacciones_pct']),
             'margen_delta': dec_to_float(analytics['margen_delta']),
             'margen_pct': dec_to_float(analytics['margen_pct']),
-        },
-        'series': {
-            'daily_chart': analytics['daily_chart'],
-            'branch_comparison': analytics['branch_comparison'],
-            'hourly_distribution': analytics['hourly_distribution'],
-            'heatmap_matrix': analytics['heatmap_matrix'],
-            'wave_labels': analytics['wave_labels'],
-            'wave_gains': analytics['wave_gains'],
-        },
-        'rentabilidad_productos': analytics['rentabilidad_productos'],
-        'ranking_cajeros': analytics['ranking_cajeros'],
-        'comparativo_meta': comparativo_meta,
+        }
+        personalizado = comparativo_personalizado(analytics, comp_inicio_str, comp_fin_str, params.cajero, params.sucursal)
+        json_payload['comparativo_meta'] = _comparativo_meta(personalizado or analytics, personalizado is not None)
+    series = {
+        clave: analytics[clave]
+        for clave in ('daily_chart', 'branch_comparison', 'hourly_distribution', 'heatmap_matrix', 'wave_labels', 'wave_gains')
+        if clave in analytics
+    }
+    if series:
+        json_payload['series'] = series
+    if 'rentabilidad' in nombres:
+        json_payload['rentabilidad_productos'] = analytics['rentabilidad_productos']
+        json_payload['rentabilidad_promedios'] = _promedios_rentabilidad(analytics['rentabilidad_productos'])
+    if 'ranking' in nombres:
+        json_payload['ranking_cajeros'] = analytics['ranking_cajeros']
+    if 'top_productos' in nombres:
         # Top productos más vendidos (filtrado por parámetro 'top')
-        'top_selling_products': list(
-            VentaDetalle.objects.filter(
-                venta__fecha__gte=fecha_inicio,
-                venta__fecha__lte=fecha_fin,
-                **({} if cajero_filter in (None, '', 'todos') else {'venta__empleado_id': cajero_filter}),
-                **({} if sucursal_filter in (None, '', 'todos') else {'venta__sucursal_id': sucursal_filter}),
-            ).values('producto__nombre')
-             .annotate(total_cantidad=Sum('cantidad'))
-             .order_by('-total_cantidad')[:filtro_top]
-        ),
+        json_payload['top_selling_products'] = analytics['top_selling_products']
+    response = JsonResponse(json_payload)
+    tiempos['total'] = (time.perf_counter() - t0) * 1000
+    response['Server-Timing'] = ', '.join(f'{nombre};dur={ms:.1f}' for nombre, ms in tiempos.items())
+    return response
+
+
+def _promedios_rentabilidad(filas):
+    """Promedio de ganancia neta y de % de ganancia de las filas de rentabilidad."""
+    ganancia = porcentaje = Decimal('0.00')
+    if filas:
+        n = Decimal(len(filas))
+        ganancia = (sum(Decimal(str(r['ganancia_neta_total'])) for r in filas) / n).quantize(Decimal('0.01'))
+        porcentaje = (sum(Decimal(str(r['porcentaje_ganancia'])) for r in filas) / n).quantize(Decimal('0.01'))
+    return {
+        'ganancia_neta': float(ganancia),
+        'ganancia_neta_clp': format_clp(ganancia),
+        'porcentaje_ganancia': float(porcentaje),
+        'porcentaje_ganancia_clp': format_clp(porcentaje),
+    }
+
+
+def _comparativo_meta(comparativo, custom):
+    """Comparativo del endpoint JSON: periodo anterior o rango personalizado (``custom``)."""
+    meta = {
+        'comparativo_custom': custom,
+        'comparativo_inicio': comparativo['prev_inicio'].strftime('%Y-%m-%d'),
+        'comparativo_fin': comparativo['prev_fin'].strftime('%Y-%m-%d'),
+        'num_transacciones_prev': comparativo['num_transacciones_prev'],
     }
-    return JsonResponse(json_payload)
+    for clave in ('ingreso_prev', 'ganancia_neta_prev', 'margen_prev', 'ingreso_delta', 'ingreso_pct',
+                  'ganancia_neta_delta', 'ganancia_neta_pct', 'transacciones_delta', 'transacciones_pct',
+                  'margen_delta', 'margen_pct', 'participacion_ingreso', 'participacion_ganancia'):
+        meta[clave] = float(comparativo[clave])
+    return meta
+
+def _csv_monto(valor):
+    """Monto en pesos de las secciones del dashboard (float) con 2 decimales."""
+    return f'{valor:.2f}'
 
 @login_required
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
 def export_rentabilidad_csv(request):
-    # Reutilizar rango de fechas principal
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-    ventas_qs = Venta.objects.filter(fecha__gte=fecha_inicio, fecha__lte=fecha_fin)
-    detalles_rango = VentaDetalle.objects.filter(venta__in=ventas_qs)
-    rent_map = {}
-    for det in detalles_rango.select_related('producto'):
-        pid = det.producto_id
-        venta_unit = det.precio_unitario or Decimal('0.00')
-        compra_unit = det.producto.precio_compra or Decimal('0.00')
-        venta_sin_iva = (venta_unit / Decimal('1.19')).quantize(Decimal('0.01')) if venta_unit else Decimal('0.00')
-        compra_sin_iva = (compra_unit / Decimal('1.19')).quantize(Decimal('0.01')) if compra_unit else Decimal('0.00')
-        ganancia_unit = venta_sin_iva - compra_sin_iva
-        entry = rent_map.get(pid)
-        if not entry:
-            entry = {
-                'producto': det.producto.nombre or det.producto.producto_id,
-                'cantidad': 0,
-                'ingreso': Decimal('0.00'),
-                'costo': Decimal('0.00'),
-                'ganancia': Decimal('0.00')
-            }
-        entry['cantidad'] += det.cantidad
-        entry['ingreso'] += venta_sin_iva * det.cantidad
-        entry['costo'] += compra_sin_iva * det.cantidad
-        entry['ganancia'] += ganancia_unit * det.cantidad
-        rent_map[pid] = entry
-    rows = []
-    for _, d in rent_map.items():
-        pct = Decimal('0.00')
-        if d['ingreso'] > 0:
-            pct = (d['ganancia'] / d['ingreso'] * Decimal('100')).quantize(Decimal('0.01'))
-        rows.append([d['producto'], d['cantidad'], d['ingreso'], d['costo'], d['ganancia'], pct])
-    rows.sort(key=lambda r: r[4], reverse=True)
-    import csv
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename=rentabilidad_productos.csv'
-    # BOM para que Excel detecte UTF-8 correctamente
-    response.write('\ufeff')
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(['Producto','Cantidad','Ingreso Neto','Costo Neto','Ganancia Neta','% Ganancia'])
-    for r in rows:
-        writer.writerow([r[0], r[1], r[2], r[3], r[4], r[5]])
-    return response
+    from .analytics import compute_analytics, consulta
+    # Mismo rango y filtros que el dashboard; todos los productos (sin límite)
+    params = consulta(request.GET)
+    productos = compute_analytics(params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                                  limit_rentabilidad=None, secciones=('rentabilidad',))['rentabilidad_productos']
+
+    def filas():
+        for r in productos:
+            yield [r['producto'], r['cantidad'], _csv_monto(r['ingreso_neto_total']), _csv_monto(r['costo_neto_total']),
+                   _csv_monto(r['ganancia_neta_total']), _csv_monto(r['porcentaje_ganancia'])]
+
+    return exportar.respuesta_csv(
+        'rentabilidad_productos.csv',
+        ['Producto','Cantidad','Ingreso Neto','Costo Neto','Ganancia Neta','% Ganancia'], filas(),
+    )
 
 @login_required
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
 def export_ranking_cajeros_csv(request):
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-    ventas_qs = Venta.objects.filter(fecha__gte=fecha_inicio, fecha__lte=fecha_fin).select_related('empleado')
-    ranking_map = {}
-    for v in ventas_qs:
-        uid = v.empleado_id
-        entry = ranking_map.get(uid)
-        if not entry:
-            entry = {'usuario': v.empleado.username, 'ventas': 0, 'ingreso': Decimal('0.00')}
-        entry['ventas'] += 1
-        entry['ingreso'] += v.total or Decimal('0.00')
-        ranking_map[uid] = entry
-    rows = []
-    for _, d in ranking_map.items():
-        ticket_prom = (d['ingreso'] / d['ventas']).quantize(Decimal('0.01')) if d['ventas'] else Decimal('0.00')
-        rows.append([d['usuario'], d['ventas'], d['ingreso'], ticket_prom])
-    rows.sort(key=lambda r: r[2], reverse=True)
-    import csv
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename=ranking_cajeros.csv'
-    response.write('\ufeff')
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(['Usuario','Ventas','Ingreso Total','Ticket Promedio'])
-    for r in rows:
-        writer.writerow([r[0], r[1], r[2], r[3]])
-    return response
+    from .analytics import compute_analytics, consulta
+    params = consulta(request.GET)
+    cajeros = compute_analytics(params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                                secciones=('ranking',))['ranking_cajeros']
+
+    def filas():
+        for r in cajeros:
+            yield [r['usuario'], r['ventas_count'], _csv_monto(r['ingreso_total']), _csv_monto(r['ticket_promedio'])]
+
+    return exportar.respuesta_csv('ranking_cajeros.csv', ['Usuario','Ventas','Ingreso Total','Ticket Promedio'], filas())
 
 
 @login_required
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
 def export_analytics_csv(request):
     """Exporta un CSV con KPIs principales y top productos para el rango solicitado."""
-    from .analytics import compute_analytics
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    cajero_filter = request.GET.get('cajero','todos')
-    sucursal_filter = request.GET.get('sucursal','todos')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-
-    analytics = compute_analytics(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter, limit_rentabilidad=100)
-    # Top productos
-    top_products = VentaDetalle.objects.filter(venta__fecha__gte=fecha_inicio, venta__fecha__lte=fecha_fin)
-    if cajero_filter and cajero_filter != 'todos':
-        try:
-            top_products = top_products.filter(venta__empleado_id=int(cajero_filter))
-        except ValueError:
-            pass
-    if sucursal_filter and sucursal_filter != 'todos':
-        try:
-            top_products = top_products.filter(venta__sucursal_id=int(sucursal_filter))
-        except ValueError:
-            pass
-    top_list = list(top_products.values('producto__nombre').annotate(total_cantidad=Sum('cantidad')).order_by('-total_cantidad')[:50])
-
-    import csv
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename=analytics_kpis.csv'
-    response.write('\ufeff')
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-    # Escribir KPIs principales
-    writer.writerow(['KPI','Valor'])
-    writer.writerow(['Ingreso Total (CLP)', analytics['ingreso_total']])
-    writer.writerow(['Ingreso Neto (sin IVA)', analytics['ingreso_total_sin_iva']])
-    writer.writerow(['IVA Calculado', analytics['iva_total_calc']])
-    writer.writerow(['Ganancia Bruta', analytics['ganancia_bruta']])
-    writer.writerow(['Ganancia Neta', analytics['ganancia_neta']])
-    writer.writerow(['Margen (%)', analytics['margen']])
-    writer.writerow(['Numero Transacciones', analytics['num_transacciones']])
-    writer.writerow(['Ticket Promedio', analytics['ticket_promedio']])
-    writer.writerow([])
-    writer.writerow(['Top Productos','Cantidad'])
-    for p in top_list:
-        writer.writerow([p.get('producto__nombre'), p.get('total_cantidad')])
-    return response
-    return response
+    from .analytics import compute_analytics, consulta
+    params = consulta(request.GET)
+    analytics = compute_analytics(params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                                  top=50, secciones=('kpis', 'top_productos'))
+
+    def filas():
+        # KPIs principales
+        yield ['Ingreso Total (CLP)', analytics['ingreso_total']]
+        yield ['Ingreso Neto (sin IVA)', analytics['ingreso_total_sin_iva']]
+        yield ['IVA Calculado', analytics['iva_total_calc']]
+        yield ['Ganancia Bruta', analytics['ganancia_bruta']]
+        yield ['Ganancia Neta', analytics['ganancia_neta']]
+        yield ['Margen (%)', analytics['margen']]
+        yield ['Numero Transacciones', analytics['num_transacciones']]
+        yield ['Ticket Promedio', analytics['ticket_promedio']]
+        yield []
+        yield ['Top Productos','Cantidad']
+        for p in analytics['top_selling_products']:
+            yield [p['producto__nombre'], p['total_cantidad']]
+
+    return exportar.respuesta_csv('analytics_kpis.csv', ['KPI','Valor'], filas())
 
 @login_required
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
 def export_daily_series_csv(request):
     """Exporta la serie diaria (ingreso y ganancia neta) en CSV."""
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    cajero_filter = request.GET.get('cajero','todos')
-    sucursal_filter = request.GET.get('sucursal','todos')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-    from .analytics import compute_analytics
-    analytics = compute_analytics(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter)
-    rows = analytics['daily_chart']
-    import csv
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename=serie_diaria.csv'
-    response.write('\ufeff')
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(['Dia','Ingreso','GananciaNeta'])
-    for r in rows:
-        writer.writerow([r['day'], r['ingreso'], r['ganancia_neta']])
-    return response
+    from .analytics import compute_analytics, consulta
+    params = consulta(request.GET)
+    serie = compute_analytics(params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                              secciones=('diaria',))['daily_chart']
+
+    def filas():
+        for r in serie:
+            yield [r['day'], r['ingreso'], r['ganancia_neta']]
+
+    return exportar.respuesta_csv('serie_diaria.csv', ['Dia','Ingreso','GananciaNeta'], filas())
 
 @login_required
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
 def export_branch_comparison_csv(request):
     """Exporta comparación por sucursal (ingreso y ganancia neta) en CSV."""
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    cajero_filter = request.GET.get('cajero','todos')
-    sucursal_filter = request.GET.get('sucursal','todos')
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-    from .analytics import compute_analytics
-    analytics = compute_analytics(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter)
-    rows = analytics['branch_comparison']
-    import csv
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename=comparacion_sucursal.csv'
-    response.write('\ufeff')
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(['Sucursal','Ingreso','GananciaNeta'])
-    for r in rows:
-        writer.writerow([r['sucursal'], r['ingreso'], r['ganancia_neta']])
-    return response
+    from .analytics import compute_analytics, consulta
+    params = consulta(request.GET)
+    sucursales = compute_analytics(params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                                   secciones=('sucursales',))['branch_comparison']
+
+    def filas():
+        for r in sucursales:
+            yield [r['sucursal'], r['ingreso'], r['ganancia_neta']]
+
+    return exportar.respuesta_csv('comparacion_sucursal.csv', ['Sucursal','Ingreso','GananciaNeta'], filas())
 
 @login_required
 @user_passes_test(_is_admin, login_url='cashier_dashboard')
@@ -950,7 +549,7 @@ def caja_report(request, caja_id):
     caja.formatted_efectivo_final = "$" + format_clp(caja.efectivo_final or caja.efectivo_inicial or 0)
     caja.formatted_ventas_totales = "$" + format_clp(caja.ventas_totales or 0)
     # Para transferencias mantenemos el cálculo puntual (no hay campo persistido para transferencias)
-    ventas_transferencia = Venta.objects.filter(caja=caja, forma_pago='transferencia').aggregate(total=Sum('total'))['total'] or Decimal('0.00')
+    ventas_transferencia = historico.totales_caja(caja)['transferencia']
     caja.formatted_total_ventas_transferencia = "$" + format_clp(ventas_transferencia)
     
     return render(request, 'reports/reporte_caja.html', {'caja': caja})
@@ -960,7 +559,9 @@ def caja_report(request, caja_id):
 def limpiar_historial_ventas(request):
     if request.method == "POST":
         try:
-            Venta.objects.all().delete()
+            with rollup.borrado_masivo():
+                Venta.objects.all().delete()
+                VentaArchivada.objects.all().delete()
             return JsonResponse({'success': True})
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
@@ -977,52 +578,22 @@ def limpiar_historial_caja(request):
         return JsonResponse({'error': 'Método no permitido.'}, status=405)
 
 
-@login_required
-@user_passes_test(_is_admin, login_url='cashier_dashboard')
-def export_advanced_pdf(request):
-    """Exporta el reporte avanzado completo a PDF usando la misma data y un template html compacto."""
-    # Fallback amigable cuando aspose-pdf no está instalado (p.ej., ARM)
-    if not ASPose_AVAILABLE:
-        return HttpResponse(
-            (
-                "Exportación a PDF no disponible en este servidor (falta dependencia aspose-pdf). "
-                "Por favor use la opción 'Exportar Word'."
-            ),
-            content_type="text/plain",
-            status=501,
-        )
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    cajero_filter = request.GET.get('cajero','todos')
-    sucursal_filter = request.GET.get('sucursal','todos')
-    filtro_top = int(request.GET.get('top', 10) or 10)
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
+# Secciones que muestran los reportes PDF/DOCX
+_SECCIONES_EXPORTACION = ('kpis', 'ranking', 'rentabilidad', 'top_productos')
+
+
+def _datos_exportacion(params):
     from .analytics import compute_analytics
-    analytics = compute_analytics(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter, limit_rentabilidad=50)
-    top_selling = list(
-        VentaDetalle.objects.filter(
-            venta__fecha__gte=fecha_inicio,
-            venta__fecha__lte=fecha_fin,
-            **({} if cajero_filter in (None, '', 'todos') else {'venta__empleado_id': cajero_filter}),
-            **({} if sucursal_filter in (None, '', 'todos') else {'venta__sucursal_id': sucursal_filter}),
-        ).values('producto__nombre').annotate(total_cantidad=Sum('cantidad')).order_by('-total_cantidad')[:filtro_top]
-    )
+    return compute_analytics(params.fecha_inicio, params.fecha_fin, params.cajero, params.sucursal,
+                             limit_rentabilidad=50, top=params.top, secciones=_SECCIONES_EXPORTACION)
+
+
+def _documento_pdf(params):
+    """PDF del reporte avanzado (bytes): template html compacto convertido con aspose-pdf."""
+    analytics = _datos_exportacion(params)
     context = {
-        'fecha_inicio': fecha_inicio_str or (timezone.now() - datetime.timedelta(days=30)).strftime('%Y-%m-%d'),
-        'fecha_fin': fecha_fin_str or timezone.now().strftime('%Y-%m-%d'),
+        'fecha_inicio': params.fecha_inicio.strftime('%Y-%m-%d'),
+        'fecha_fin': params.fecha_fin.strftime('%Y-%m-%d'),
         'ingreso_total': "$" + format_clp(analytics['ingreso_total']),
         'ingreso_total_sin_iva': "$" + format_clp(analytics['ingreso_total_sin_iva']),
         'iva_total': "$" + format_clp(analytics['iva_total_calc']),
@@ -1034,55 +605,22 @@ def export_advanced_pdf(request):
         'unidades_promedio': analytics['unidades_promedio'],
         'ranking_cajeros': analytics['ranking_cajeros'],
         'rentabilidad_productos': analytics['rentabilidad_productos'],
-        'top_selling_products': top_selling,
+        'top_selling_products': analytics['top_selling_products'],
     }
     html = render_to_string('reports/export/advanced_pdf.html', context)
     load_opts = HtmlLoadOptions()
     pdf = PdfDocument(io.BytesIO(html.encode('utf-8')), load_opts)
     out = io.BytesIO()
     pdf.save(out)
-    out.seek(0)
-    resp = HttpResponse(out.read(), content_type='application/pdf')
-    resp['Content-Disposition'] = 'attachment; filename="reporte_avanzado.pdf"'
-    return resp
+    return out.getvalue()
 
 
-@login_required
-@user_passes_test(_is_admin, login_url='cashier_dashboard')
-def export_advanced_docx(request):
-    """Exporta un resumen del reporte avanzado a DOCX."""
-    fecha_inicio_str = request.GET.get('fecha_inicio')
-    fecha_fin_str = request.GET.get('fecha_fin')
-    cajero_filter = request.GET.get('cajero','todos')
-    sucursal_filter = request.GET.get('sucursal','todos')
-    filtro_top = int(request.GET.get('top', 10) or 10)
-    try:
-        if fecha_inicio_str:
-            fecha_inicio = timezone.make_aware(datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d'))
-        else:
-            fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    except ValueError:
-        fecha_inicio = timezone.now() - datetime.timedelta(days=30)
-    try:
-        if fecha_fin_str:
-            fecha_fin = timezone.make_aware(datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d')) + datetime.timedelta(days=1, seconds=-1)
-        else:
-            fecha_fin = timezone.now()
-    except ValueError:
-        fecha_fin = timezone.now()
-    from .analytics import compute_analytics
-    analytics = compute_analytics(fecha_inicio, fecha_fin, cajero_filter, sucursal_filter, limit_rentabilidad=50)
-    top_selling = list(
-        VentaDetalle.objects.filter(
-            venta__fecha__gte=fecha_inicio,
-            venta__fecha__lte=fecha_fin,
-            **({} if cajero_filter in (None, '', 'todos') else {'venta__empleado_id': cajero_filter}),
-            **({} if sucursal_filter in (None, '', 'todos') else {'venta__sucursal_id': sucursal_filter}),
-        ).values('producto__nombre').annotate(total_cantidad=Sum('cantidad')).order_by('-total_cantidad')[:filtro_top]
-    )
+def _documento_docx(params):
+    """Resumen del reporte avanzado en DOCX (bytes)."""
+    analytics = _datos_exportacion(params)
     doc = DocxDocument()
     doc.add_heading('Reporte Avanzado', 0)
-    doc.add_paragraph(f"Rango: {fecha_inicio.strftime('%Y-%m-%d')} a {fecha_fin.strftime('%Y-%m-%d')}")
+    doc.add_paragraph(f"Rango: {params.fecha_inicio.strftime('%Y-%m-%d')} a {params.fecha_fin.strftime('%Y-%m-%d')}")
     doc.add_heading('KPIs', level=1)
     doc.add_paragraph(f"Ingreso total: ${format_clp(analytics['ingreso_total'])}")
     doc.add_paragraph(f"Venta sin IVA: ${format_clp(analytics['ingreso_total_sin_iva'])}")
@@ -1094,7 +632,7 @@ def export_advanced_docx(request):
     doc.add_paragraph(f"Ticket promedio: ${format_clp(analytics['ticket_promedio'])}")
     doc.add_paragraph(f"Unidades promedio/venta: {analytics['unidades_promedio']}")
     doc.add_heading('Top Productos', level=1)
-    for item in top_selling:
+    for item in analytics['top_selling_products']:
         doc.add_paragraph(f"{item['producto__nombre']}: {item['total_cantidad']}")
     doc.add_heading('Ranking de Cajeros', level=1)
     for r in analytics['ranking_cajeros']:
@@ -1104,8 +642,87 @@ def export_advanced_docx(request):
         doc.add_paragraph(f"{r['producto']}: ganancia_neta=${format_clp(r['ganancia_neta_total'])} ({r['porcentaje_ganancia']}%)")
     out = io.BytesIO()
     doc.save(out)
-    out.seek(0)
-    resp = HttpResponse(out.read(), content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-    resp['Content-Disposition'] = 'attachment; filename="reporte_avanzado.docx"'
-    return resp
+    return out.getvalue()
+
+
+def _exportar_documento(request, formato, generar):
+    """Pide el documento ``formato`` y redirige a su descarga si ya está generado.
+
+    Si no, responde 202 con una página (o JSON si se pide
+    ``Accept: application/json``) que consulta ``export_estado`` hasta que el
+    documento esté listo (ver ``reports.exportaciones``). ``generar`` es la
+    ruta de la función que arma el documento.
+    """
+    from .analytics import consulta
+    params = consulta(request.GET)
+    clave = exportaciones.clave(formato, params)
+    estado = exportaciones.solicitar(clave, formato, generar, request.GET.dict())
+    descarga_url = reverse('reports:export_descarga', args=[clave, formato])
+    if estado == exportaciones.LISTO:
+        return redirect(descarga_url)
+    estado_url = reverse('reports:export_estado', args=[clave, formato])
+    status = 500 if estado == exportaciones.ERROR else 202
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'estado': estado, 'estado_url': estado_url, 'descarga_url': descarga_url}, status=status)
+    return render(request, 'reports/export/pendiente.html', {
+        'estado': estado, 'formato': formato.upper(), 'estado_url': estado_url, 'descarga_url': descarga_url,
+        'reintentar_url': request.get_full_path(),
+    }, status=status)
+
+
+@login_required
+@user_passes_test(_is_admin, login_url='cashier_dashboard')
+def export_advanced_pdf(request):
+    """Exporta el reporte avanzado completo a PDF usando la misma data y un template html compacto."""
+    # Fallback amigable cuando aspose-pdf no está instalado (p.ej., ARM)
+    if not ASPose_AVAILABLE:
+        return HttpResponse(
+            (
+                "Exportación a PDF no disponible en este servidor (falta dependencia aspose-pdf). "
+                "Por favor use la opción 'Exportar Word'."
+            ),
+            content_type="text/plain",
+            status=501,
+        )
+    return _exportar_documento(request, 'pdf', 'reports.views._documento_pdf')
+
+
+@login_required
+@user_passes_test(_is_admin, login_url='cashier_dashboard')
+def export_advanced_docx(request):
+    """Exporta un resumen del reporte avanzado a DOCX."""
+    return _exportar_documento(request, 'docx', 'reports.views._documento_docx')
+
+
+@login_required
+@user_passes_test(_is_admin, login_url='cashier_dashboard')
+def export_estado(request, clave, formato):
+    """Estado de un documento pedido con ``export_advanced_pdf``/``export_advanced_docx``.
+
+    Un error se informa una sola vez: el "Reintentar" de la página lo vuelve a encolar.
+    """
+    return JsonResponse({
+        'estado': exportaciones.estado(clave, formato, informar=True),
+        'descarga_url': reverse('reports:export_descarga', args=[clave, formato]),
+    })
+
+
+@login_required
+@user_passes_test(_is_admin, login_url='cashier_dashboard')
+def export_descarga(request, clave, formato):
+    """Sirve un documento generado. La clave identifica el contenido, así que es su ETag."""
+    ruta = exportaciones.ruta(clave, formato)
+    if not ruta.exists():
+        raise Http404('Documento no disponible.')
+    etag = f'"{clave}"'
+    if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            open(ruta, 'rb'), as_attachment=True, filename=f'reporte_avanzado.{formato}',
+            content_type=exportaciones.FORMATOS[formato],
+        )
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
 